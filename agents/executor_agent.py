@@ -1,9 +1,20 @@
 from core.state import AgentState
+from core.config import env_float
+from core.instrumentation import record_token_usage
+from core.resilience import aguarded_call, guarded_call
 from core.prompts import get_rag_prompt
 from tools.llm_client import LLMClient
 
 FALLBACK_RESPONSE = "Tôi hiểu lo lắng của bạn về triệu chứng này. Để được tư vấn y tế chính xác, vui lòng tham khảo ý kiến chuyên gia y tế có thể đánh giá đúng tình trạng của bạn. Các thông tin mà chatbot cung cấp chỉ mang tính chất tham khảo. Hãy thật cẩn thận với các thông tin này."
 
+DISCLAIMER = "Các thông tin mà chatbot cung cấp chỉ mang tính chất tham khảo. Hãy thật cẩn thận với các thông tin này."
+
+# Answers for questions the planner routes straight to the executor
+CANNED_RESPONSES = {
+    "direct": "Xin chào! Tôi là MedicalBot, chatbot cung cấp thông tin y tế và sức khỏe. Bạn có câu hỏi nào về bệnh, triệu chứng, thuốc hay dinh dưỡng, cứ hỏi tôi nhé. " + DISCLAIMER,
+    "out_of_scope": "Tôi là chatbot chỉ trả lời các câu hỏi liên quan tới y tế, sức khỏe. Bạn hãy tập trung hỏi về y tế, sức khỏe nhé. " + DISCLAIMER,
+}
+
 def _add_to_history(state: AgentState, question: str, answer: str, source: str):
     """Helper function to add Q&A to conversation history"""
     state["conversation_history"].append({
@@ -16,10 +27,7 @@ def _add_to_history(state: AgentState, question: str, answer: str, source: str):
         'source': source
     })
 
-def ExecutorAgent(state: AgentState) -> AgentState:
-    question = state["question"]
-    source_info = state.get("source", "Unknown")
-
+def _build_history_context(state: AgentState) -> str:
     # Get conversation context (5 cặp Q&A gần nhất)
     history_context = ""
     for item in state.get("conversation_history", [])[-10:]:
@@ -27,12 +35,56 @@ def ExecutorAgent(state: AgentState) -> AgentState:
             history_context += f"Người dùng: {item.get('content', '')}\n"
         elif item.get('role') == 'assistant':
             history_context += f"MedicalBot: {item.get('content', '')}\n"
+    return history_context
 
-    # If LLM was successful earlier (from LLMAgent), use that response
+def _use_llm_answer(state: AgentState) -> bool:
+    """If LLM was successful earlier (from LLMAgent), use that response"""
     if state.get("llm_success", False) and state.get("generation"):
-        answer = state["generation"]
-        _add_to_history(state, question, answer, source_info)
+        _add_to_history(state, state["question"], state["generation"], state.get("source", "Unknown"))
         print("Executor: Using LLM response from earlier")
+        return True
+    return False
+
+def _use_canned_answer(state: AgentState) -> bool:
+    """Greetings and off-topic questions need no LLM call"""
+    answer = CANNED_RESPONSES.get(state.get("current_tool"))
+    if not answer:
+        return False
+    state["generation"] = answer
+    state["source"] = "System Message"
+    _add_to_history(state, state["question"], answer, "System Message")
+    print(f"Executor: Answered directly ({state['current_tool']})")
+    return True
+
+def _build_rag_prompt(state: AgentState) -> str:
+    content = "\n\n".join([doc.page_content[:1000] for doc in state["documents"][:3]])
+    return get_rag_prompt(_build_history_context(state), state["question"], content)
+
+def _apply_rag_response(state: AgentState, response) -> bool:
+    record_token_usage(state, response)
+    answer = response.content.strip() if hasattr(response, 'content') else str(response).strip()
+    source_info = state.get("source", "Unknown")
+
+    if answer and len(answer) > 10:
+        state["generation"] = answer
+        state["source"] = source_info
+        _add_to_history(state, state["question"], answer, source_info)
+        print("Executor: Generated response with RAG documents")
+        return True
+
+    print("Executor: RAG response too short, using fallback")
+    return False
+
+def _use_fallback(state: AgentState) -> AgentState:
+    # Fallback response when all else fails
+    print("Executor: Using fallback response")
+    state["generation"] = FALLBACK_RESPONSE
+    state["source"] = "System Message"
+    _add_to_history(state, state["question"], FALLBACK_RESPONSE, "System Message")
+    return state
+
+def ExecutorAgent(state: AgentState) -> AgentState:
+    if _use_canned_answer(state) or _use_llm_answer(state):
         return state
 
     # If we have documents from retrieval, generate response with RAG
@@ -41,28 +93,32 @@ def ExecutorAgent(state: AgentState) -> AgentState:
             llm = LLMClient.get_llm()
             if not llm:
                 raise Exception("LLM client not available")
-                
-            content = "\n\n".join([doc.page_content[:1000] for doc in state["documents"][:3]])
-            prompt = get_rag_prompt(history_context, question, content)
-
-            response = llm.invoke(prompt)
-            answer = response.content.strip() if hasattr(response, 'content') else str(response).strip()
-
-            if answer and len(answer) > 10:
-                state["generation"] = answer
-                state["source"] = source_info
-                _add_to_history(state, question, answer, source_info)
-                print("Executor: Generated response with RAG documents")
+
+            response = guarded_call("gemini", llm.invoke, _build_rag_prompt(state), state=state,
+                                    timeout=env_float("LLM_TIMEOUT", 20.0))
+            if _apply_rag_response(state, response):
                 return state
-            else:
-                print("Executor: RAG response too short, using fallback")
         except Exception as e:
             print(f"Executor: Error calling Gemini API - {e}")
 
-    # Fallback response when all else fails
-    print("Executor: Using fallback response")
-    state["generation"] = FALLBACK_RESPONSE
-    state["source"] = "System Message"
-    _add_to_history(state, question, FALLBACK_RESPONSE, "System Message")
+    return _use_fallback(state)
 
-    return state
+async def ExecutorAgentAsync(state: AgentState) -> AgentState:
+    """Async ExecutorAgent for the ASGI serving path"""
+    if _use_canned_answer(state) or _use_llm_answer(state):
+        return state
+
+    if state.get("documents") and len(state["documents"]) > 0:
+        try:
+            llm = LLMClient.get_llm()
+            if not llm:
+                raise Exception("LLM client not available")
+
+            response = await aguarded_call("gemini", llm.ainvoke, _build_rag_prompt(state), state=state,
+                                           timeout=env_float("LLM_TIMEOUT", 20.0))
+            if _apply_rag_response(state, response):
+                return state
+        except Exception as e:
+            print(f"Executor: Error calling Gemini API - {e}")
+
+    return _use_fallback(state)
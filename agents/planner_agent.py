@@ -1,45 +1,71 @@
+from core.config import env_bool, env_float
+from core.metrics import REGISTRY
 from core.state import AgentState
+from tools.data_loader import detect_language
+from tools.keyword_matcher import KeywordMatcher
+from tools.semantic_router import get_semantic_router
+from tools.vector_store import get_title_index
+
+# Compiled once from the bilingual lexicon in data/medical_keywords.json
+MEDICAL_KEYWORDS = KeywordMatcher.load()
+
+ROUTE_DECISIONS = REGISTRY.counter(
+    "medical_chat_route_total", "Planner routing decisions by route and what decided it", ("route", "decided_by")
+)
+
+
+def choose_retrieval_filter(question: str):
+    """
+    Metadata filter for the retriever: a disease named in the question is
+    looked up by title, a Vietnamese question searches the Vietnamese entries.
+    """
+    if not env_bool("RETRIEVAL_FILTER_ENABLED", True):
+        return None
+    title_index = get_title_index()
+    title = title_index.match(question) if title_index else None
+    if title:
+        return {"title": title}
+    if detect_language(question) == "vi":
+        return {"language": "vi"}
+    return None
+
+
+def choose_route(state: AgentState):
+    """
+    (route, confidence, decided_by) for the question. The semantic router's
+    confidence is its similarity to the nearest route; below
+    SEMANTIC_ROUTER_MIN_CONFIDENCE the keyword rule decides instead.
+    """
+    question = state["question"]
+    # A disease from the database is worth a lookup even without a keyword
+    if "title" in (state["retrieval_filter"] or {}):
+        return "retriever", None, "title"
+
+    confidence = None
+    try:
+        router = get_semantic_router()
+        if router:
+            route, confidence = router.classify(question)
+            if confidence >= env_float("SEMANTIC_ROUTER_MIN_CONFIDENCE", 0.35):
+                # A follow-up can look off-topic on its own, the LLM sees the history
+                if route == "out_of_scope" and state.get("conversation_history"):
+                    route = "llm_agent"
+                return route, confidence, "semantic"
+    except Exception as e:
+        print(f"Planner: semantic routing failed, using keywords - {e}")
+
+    route = "retriever" if MEDICAL_KEYWORDS.matches(question) else "llm_agent"
+    return route, confidence, "keyword"
+
 
 def PlannerAgent(state: AgentState) -> AgentState:
-    question = state["question"].lower()
-    
-    medical_keywords = [
-        # Symptoms
-        "fever", "pain", "headache", "nausea", "vomiting", "diarrhea", "cough",
-        "acne", "pimple", "skin", "rash", "itch", "cold", "flu",
-        "shortness of breath", "chest pain", "abdominal pain", "back pain",
-        "joint pain", "muscle pain", "fatigue", "weakness", "dizziness",
-        "confusion", "memory loss", "seizure", "numbness", "tingling", "swelling",
-        "bleeding", "bruising", "weight loss", "weight gain",
-        "appetite loss", "sleep problems", "insomnia",
-        
-        # Conditions
-        "cancer", "diabetes", "hypertension", "heart disease", "stroke", "asthma",
-        "copd", "pneumonia", "bronchitis", "covid", "coronavirus",
-        "infection", "virus", "bacteria", "fungal", "arthritis", "osteoporosis",
-        "thyroid", "kidney disease", "liver disease", "hepatitis", "depression",
-        "anxiety", "bipolar", "schizophrenia", "alzheimer", "parkinson", "epilepsy",
-        
-        # Medical terms
-        "treatment", "therapy", "medication", "medicine", "prescription", "dosage",
-        "side effects", "diagnosis", "prognosis", "surgery", "operation",
-        "procedure", "test", "lab results", "blood test", "x-ray", "mri",
-        "ct scan", "ultrasound", "biopsy", "screening", "prevention", "vaccine",
-        "immunization", "rehabilitation", "recovery", "chronic", "acute",
-        "syndrome", "disorder", "symptom", "cure", "remedy", "doctor", "hospital",
-        
-        # Body parts
-        "heart", "lung", "kidney", "liver", "brain", "stomach", "intestine",
-        "blood", "bone", "muscle", "nerve", "skin", "eye", "ear", "throat",
-        "neck", "spine", "joint", "head", "chest", "abdomen", "leg", "arm"
-    ]
-    
-    contains_medical = any(word in question for word in medical_keywords)
-    
-    if contains_medical:
-        state["current_tool"] = "retriever"
-    else:
-        state["current_tool"] = "llm_agent"
-    
+    # Also used when the LLM agent falls back to the retriever
+    state["retrieval_filter"] = choose_retrieval_filter(state["question"])
+
+    route, confidence, decided_by = choose_route(state)
+    state["current_tool"] = route
+    state["route_confidence"] = confidence
+    ROUTE_DECISIONS.inc(route=route, decided_by=decided_by)
+
     state["retry_count"] = 0
     return state
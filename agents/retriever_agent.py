@@ -1,33 +1,57 @@
+import asyncio
+from core.resilience import deadline_passed
 from core.state import AgentState
-from tools.vector_store import get_retriever
+from tools.reranker import get_reranker, rerank_candidates
+from tools.vector_store import get_retriever, get_title_documents
 
-def RetrieverAgent(state: AgentState) -> AgentState:
+# Chunks the executor puts into the prompt
+TOP_K = 3
+
+
+def _build_query(state: AgentState) -> str:
     query = state["question"]
-    
-    # Get retriever
-    retriever = get_retriever()
-    
-    if not retriever:
-        print("RAG: No retriever available - vector database not initialized")
-        state["documents"] = []
-        state["rag_success"] = False
-        state["rag_attempted"] = True
-        return state
-    
+
     # Create context from conversation history
     context_parts = []
     for item in state.get("conversation_history", [])[-3:]:
         if item.get('role') == 'user':
             context_parts.append(f"Context: {item.get('content', '')}")
-    
+
     context = " | ".join(context_parts)
-    combined_query = f"{query} {context}" if context else query
-    
-    # Retrieve documents
-    docs = retriever.invoke(combined_query)
-    
+    return f"{query} {context}" if context else query
+
+
+def _no_retriever(state: AgentState) -> AgentState:
+    print("RAG: No retriever available - vector database not initialized")
+    state["documents"] = []
+    state["rag_success"] = False
+    state["rag_attempted"] = True
+    return state
+
+
+def _out_of_time(state: AgentState) -> AgentState:
+    print("RAG: Request deadline passed, skipping retrieval")
+    state["documents"] = []
+    state["rag_success"] = False
+    state["rag_attempted"] = True
+    return state
+
+
+def _is_valid(doc) -> bool:
+    return len(doc.page_content.strip()) > 50
+
+
+def _rerank(query: str, docs):
+    """Keep the best TOP_K of the over-fetched candidates when re-ranking is enabled"""
+    reranker = get_reranker()
+    if reranker is None or not docs:
+        return docs
+    return reranker.rerank(query, [doc for doc in docs if _is_valid(doc)])
+
+
+def _apply_documents(state: AgentState, docs) -> AgentState:
     if docs and len(docs) > 0:
-        valid_docs = [doc for doc in docs if len(doc.page_content.strip()) > 50]
+        valid_docs = [doc for doc in docs if _is_valid(doc)]
         if valid_docs:
             state["documents"] = valid_docs
             state["rag_success"] = True
@@ -44,3 +68,57 @@ def RetrieverAgent(state: AgentState) -> AgentState:
 
     state["rag_attempted"] = True
     return state
+
+
+def _title_documents(state: AgentState):
+    """Chunks of the disease the planner recognized in the question, without any search"""
+    retrieval_filter = state.get("retrieval_filter") or {}
+    if "title" not in retrieval_filter:
+        return []
+    docs = get_title_documents(retrieval_filter["title"], limit=rerank_candidates(TOP_K))
+    if docs:
+        print(f"RAG: Exact title match for '{retrieval_filter['title']}'")
+    return docs
+
+
+def RetrieverAgent(state: AgentState) -> AgentState:
+    if deadline_passed(state):
+        return _out_of_time(state)
+    query = _build_query(state)
+    docs = _title_documents(state)
+
+    if not docs:
+        # Get retriever
+        retriever = get_retriever(k=rerank_candidates(TOP_K), filter=state.get("retrieval_filter"))
+
+        if not retriever:
+            return _no_retriever(state)
+
+        # Retrieve documents
+        docs = retriever.invoke(query)
+        if state.get("retrieval_filter") and not any(_is_valid(doc) for doc in docs):
+            # Nothing in the filtered part of the collection, search all of it
+            docs = get_retriever(k=rerank_candidates(TOP_K)).invoke(query)
+
+    return _apply_documents(state, _rerank(query, docs))
+
+
+async def RetrieverAgentAsync(state: AgentState) -> AgentState:
+    """Async RetrieverAgent for the ASGI serving path"""
+    if deadline_passed(state):
+        return _out_of_time(state)
+    query = _build_query(state)
+    docs = await asyncio.to_thread(_title_documents, state)
+
+    if not docs:
+        retriever = get_retriever(k=rerank_candidates(TOP_K), filter=state.get("retrieval_filter"))
+
+        if not retriever:
+            return _no_retriever(state)
+
+        docs = await retriever.ainvoke(query)
+        if state.get("retrieval_filter") and not any(_is_valid(doc) for doc in docs):
+            docs = await get_retriever(k=rerank_candidates(TOP_K)).ainvoke(query)
+
+    docs = await asyncio.to_thread(_rerank, query, docs)
+    return _apply_documents(state, docs)
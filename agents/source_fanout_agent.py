@@ -0,0 +1,146 @@
+import asyncio
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from core.config import env_float, env_int
+from core.resilience import time_left
+from core.state import AgentState
+from agents.retriever_agent import RetrieverAgent, RetrieverAgentAsync
+from agents.wikipedia_agent import WikipediaAgent, WikipediaAgentAsync
+from agents.tavily_agent import TavilyAgent, TavilyAgentAsync
+
+# Knowledge sources in priority order: (name, sync agent, async agent, attempted flag, success flag, deadline setting, default deadline)
+SOURCES = [
+    ("retriever", RetrieverAgent, RetrieverAgentAsync, "rag_attempted", "rag_success", "SOURCE_DEADLINE_RETRIEVER", 3.0),
+    ("wikipedia", WikipediaAgent, WikipediaAgentAsync, "wiki_attempted", "wiki_success", "SOURCE_DEADLINE_WIKIPEDIA", 5.0),
+    ("tavily", TavilyAgent, TavilyAgentAsync, "tavily_attempted", "tavily_success", "SOURCE_DEADLINE_TAVILY", 6.0),
+]
+
+# Shared so that each request doesn't pay for thread start-up
+_executor = ThreadPoolExecutor(max_workers=env_int("SOURCE_FANOUT_THREADS", 16), thread_name_prefix="source")
+
+
+def _branch_state(state: AgentState) -> AgentState:
+    """Each source works on its own copy so concurrent agents don't overwrite each other"""
+    branch = dict(state)
+    branch["documents"] = []
+    return branch
+
+
+def _deadlines(started: float, state: AgentState) -> dict:
+    """Per-source deadlines, none later than the request's own"""
+    remaining = time_left(state)
+    request_deadline = started + remaining if remaining is not None else float("inf")
+    return {name: min(started + env_float(setting, default), request_deadline)
+            for name, _, _, _, _, setting, default in SOURCES}
+
+
+def _is_success(name: str, branch: AgentState) -> bool:
+    success_flag = next(source[4] for source in SOURCES if source[0] == name)
+    return bool(branch.get(success_flag)) and bool(branch.get("documents"))
+
+
+def _has_enough_context(results: dict) -> bool:
+    """The local medical corpus is preferred; otherwise stop once enough documents arrived"""
+    if "retriever" in results and _is_success("retriever", results["retriever"]):
+        return True
+    documents = sum(len(branch.get("documents", [])) for name, branch in results.items()
+                    if _is_success(name, branch))
+    return documents >= env_int("FANOUT_MIN_DOCS", 3)
+
+
+def _merge(state: AgentState, results: dict, timed_out: set, started: float) -> AgentState:
+    """Combine source results in priority order into the state fed to ExecutorAgent"""
+    documents = []
+    source_label = None
+    for name, _, _, attempted_flag, success_flag, _, _ in SOURCES:
+        branch = results.get(name)
+        state[attempted_flag] = True
+        state[success_flag] = branch is not None and _is_success(name, branch)
+        if state[success_flag]:
+            documents.extend(branch["documents"])
+            if source_label is None:
+                source_label = branch.get("source")
+
+    state["documents"] = documents
+    if source_label:
+        state["source"] = source_label
+
+    succeeded = [name for name, _, _, _, flag, _, _ in SOURCES if state[flag]]
+    print(f"Fanout: {len(documents)} documents from {succeeded or 'no source'} "
+          f"in {time.monotonic() - started:.2f}s"
+          + (f", timed out: {sorted(timed_out)}" if timed_out else ""))
+    return state
+
+
+def SourceFanoutAgent(state: AgentState) -> AgentState:
+    """Query the vector DB, Wikipedia and Tavily concurrently with per-source deadlines"""
+    started = time.monotonic()
+    deadlines = _deadlines(started, state)
+    futures = {_executor.submit(agent, _branch_state(state)): name
+               for name, agent, _, _, _, _, _ in SOURCES}
+    results, timed_out = {}, set()
+
+    while futures:
+        now = time.monotonic()
+        for future, name in list(futures.items()):
+            if deadlines[name] <= now:
+                # A running thread can't be interrupted; its result is simply ignored
+                future.cancel()
+                timed_out.add(name)
+                del futures[future]
+        if not futures:
+            break
+
+        timeout = min(deadlines[name] for name in futures.values()) - now
+        done, _ = wait(futures, timeout=max(timeout, 0), return_when=FIRST_COMPLETED)
+        for future in done:
+            name = futures.pop(future)
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                print(f"Fanout: {name} failed - {e}")
+
+        if _has_enough_context(results):
+            for future in futures:
+                future.cancel()
+            break
+
+    return _merge(state, results, timed_out, started)
+
+
+async def SourceFanoutAgentAsync(state: AgentState) -> AgentState:
+    """Async SourceFanoutAgent; slower sources are cancelled once enough context arrived"""
+    started = time.monotonic()
+    deadlines = _deadlines(started, state)
+    tasks = {asyncio.create_task(agent(_branch_state(state))): name
+             for name, _, agent, _, _, _, _ in SOURCES}
+    results, timed_out = {}, set()
+
+    try:
+        while tasks:
+            now = time.monotonic()
+            for task, name in list(tasks.items()):
+                if deadlines[name] <= now:
+                    task.cancel()
+                    timed_out.add(name)
+                    del tasks[task]
+            if not tasks:
+                break
+
+            timeout = min(deadlines[name] for name in tasks.values()) - now
+            done, _ = await asyncio.wait(tasks, timeout=max(timeout, 0), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = tasks.pop(task)
+                try:
+                    results[name] = task.result()
+                except Exception as e:
+                    print(f"Fanout: {name} failed - {e}")
+
+            if _has_enough_context(results):
+                break
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    return _merge(state, results, timed_out, started)
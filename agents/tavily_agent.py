@@ -1,21 +1,23 @@
 from langchain_core.documents import Document
+from core.config import env_float
+from core.resilience import aguarded_call, guarded_call
 from core.state import AgentState
 from tools.search_tools import get_tavily_search
 
 
-def TavilyAgent(state: AgentState) -> AgentState:
-    tavily_search = get_tavily_search()
+def _no_tavily(state: AgentState) -> AgentState:
+    state["documents"] = []
+    state["tavily_success"] = False
+    state["tavily_attempted"] = True
+    return state
 
-    if not tavily_search:
-        state["documents"] = []
-        state["tavily_success"] = False
-        state["tavily_attempted"] = True
-        return state
 
+def _search_query(state: AgentState) -> str:
     # Add medical context to search
-    search_query = f"{state['question']} medical health treatment symptoms"
-    results = tavily_search.invoke(search_query)
+    return f"{state['question']} medical health treatment symptoms"
+
 
+def _apply_results(state: AgentState, results) -> AgentState:
     if results and len(results) > 0:
         valid_results = []
         for res in results:
@@ -42,3 +44,34 @@ def TavilyAgent(state: AgentState) -> AgentState:
 
     state["tavily_attempted"] = True
     return state
+
+
+def TavilyAgent(state: AgentState) -> AgentState:
+    tavily_search = get_tavily_search()
+
+    if not tavily_search:
+        return _no_tavily(state)
+
+    try:
+        results = guarded_call("tavily", tavily_search.invoke, _search_query(state), state=state,
+                               timeout=env_float("TAVILY_TIMEOUT", 6.0))
+    except Exception as e:
+        print(f"Tavily: Search failed - {e}")
+        return _no_tavily(state)
+    return _apply_results(state, results)
+
+
+async def TavilyAgentAsync(state: AgentState) -> AgentState:
+    """Async TavilyAgent for the ASGI serving path"""
+    tavily_search = get_tavily_search()
+
+    if not tavily_search:
+        return _no_tavily(state)
+
+    try:
+        results = await aguarded_call("tavily", tavily_search.ainvoke, _search_query(state), state=state,
+                                      timeout=env_float("TAVILY_TIMEOUT", 6.0))
+    except Exception as e:
+        print(f"Tavily: Search failed - {e}")
+        return _no_tavily(state)
+    return _apply_results(state, results)
@@ -1,25 +1,23 @@
+import asyncio
+
 from langchain_core.documents import Document
 
+from core.config import env_float
+from core.resilience import aguarded_call, guarded_call
 from core.state import AgentState
 from tools.search_tools import get_wikipedia_wrapper
 
-def WikipediaAgent(state: AgentState) -> AgentState:
-    wiki = get_wikipedia_wrapper()
-    
-    if not wiki:
-        state["documents"] = []
-        state["wiki_success"] = False
-        state["wiki_attempted"] = True
-        return state
-    
+def _no_wikipedia(state: AgentState) -> AgentState:
+    state["documents"] = []
+    state["wiki_success"] = False
+    state["wiki_attempted"] = True
+    return state
+
+def _search_query(state: AgentState) -> str:
     # Search with medical context
-    search_query = f"{state['question']} medical symptoms treatment"
-    content = wiki.run(search_query)
-    
-    if not content or len(content.strip()) < 100:
-        # Fallback to simpler search
-        content = wiki.run(state['question'])
-    
+    return f"{state['question']} medical symptoms treatment"
+
+def _apply_content(state: AgentState, content) -> AgentState:
     if content and len(content.strip()) > 100:
         state["documents"] = [Document(page_content=content)]
         state["wiki_success"] = True
@@ -32,3 +30,46 @@ def WikipediaAgent(state: AgentState) -> AgentState:
 
     state["wiki_attempted"] = True
     return state
+
+def _run(wiki, state: AgentState, query: str):
+    return guarded_call("wikipedia", wiki.run, query, state=state, timeout=env_float("WIKIPEDIA_TIMEOUT", 5.0))
+
+async def _arun(wiki, state: AgentState, query: str):
+    return await aguarded_call("wikipedia", asyncio.to_thread, wiki.run, query, state=state,
+                               timeout=env_float("WIKIPEDIA_TIMEOUT", 5.0))
+
+def WikipediaAgent(state: AgentState) -> AgentState:
+    wiki = get_wikipedia_wrapper()
+
+    if not wiki:
+        return _no_wikipedia(state)
+
+    try:
+        content = _run(wiki, state, _search_query(state))
+
+        if not content or len(content.strip()) < 100:
+            # Fallback to simpler search
+            content = _run(wiki, state, state['question'])
+    except Exception as e:
+        print(f"Wikipedia: Search failed - {e}")
+        return _no_wikipedia(state)
+
+    return _apply_content(state, content)
+
+async def WikipediaAgentAsync(state: AgentState) -> AgentState:
+    """Async WikipediaAgent; the wrapper is blocking, so it runs in a worker thread"""
+    wiki = get_wikipedia_wrapper()
+
+    if not wiki:
+        return _no_wikipedia(state)
+
+    try:
+        content = await _arun(wiki, state, _search_query(state))
+
+        if not content or len(content.strip()) < 100:
+            content = await _arun(wiki, state, state['question'])
+    except Exception as e:
+        print(f"Wikipedia: Search failed - {e}")
+        return _no_wikipedia(state)
+
+    return _apply_content(state, content)
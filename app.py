@@ -1,17 +1,14 @@
 import secrets
-from datetime import datetime
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
-from core.database import SupabaseDB
-from core.langgraph_workflow import create_workflow
-from core.state import initialize_conversation_state
-from core.state import reset_query_state
+from core import chat_service as service
+from core.chat_service import initialize_system
+from core.metrics import REGISTRY, CONTENT_TYPE
 from core.response import (
-    success_response, validation_error, internal_error, bad_request
+    ResponseCode, build_response_body, sse_event,
+    success_response, validation_error, internal_error, bad_request, service_unavailable
 )
-from tools.data_loader import process_data
-from tools.vector_store import get_or_create_vectorstore
 
 load_dotenv()
 
@@ -19,44 +16,6 @@ app = Flask(__name__)
 app.secret_key = secrets.token_hex(32)
 CORS(app)  # Enable CORS for all routes
 
-# Global workflow and conversation states
-workflow_app = None
-conversation_states = {}
-db = None
-
-
-def initialize_system():
-    global workflow_app, db
-
-    pdf_path = './data/medical_book.pdf'
-    json_path = './data/medical-data.json'
-    persist_dir = './medical_db/'
-
-    print("Initializing Medical Chat System...")
-
-    # Initialize Supabase Database
-    try:
-        db = SupabaseDB()
-        print("Connected to Supabase...")
-    except Exception as e:
-        print(f"Failed to connect to Supabase: {e}")
-        print("Chat history will not be saved!")
-
-    # Try to load an existing database
-    existing_db = get_or_create_vectorstore(persist_dir=persist_dir)
-
-    if not existing_db:
-        print("Creating vector database from data sources...")
-        doc_splits = process_data(pdf_path=pdf_path, json_path=json_path)
-        if doc_splits:
-            get_or_create_vectorstore(documents=doc_splits, persist_dir=persist_dir)
-        else:
-            print("No documents found to create database")
-
-    workflow_app = create_workflow()
-    print("Medical Chat API Ready!")
-
-
 @app.route('/', methods=['GET'])
 def health_check():
     return success_response(
@@ -69,13 +28,21 @@ def health_check():
     )
 
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """Readiness probe: 200 once every component is loaded, 503 while warming up or after a failed start"""
+    state = service.readiness()
+    if state['status'] == 'ready':
+        return success_response(message="Service is ready", data=state)
+    return service_unavailable(message="Service is not ready", data=state)
+
+
 @app.route('/api/v1/chat', methods=['POST'])
 def chat():
-    global workflow_app, conversation_states, db
-
     data = request.json
     message = data.get('message', '')
     session_id = data.get('conversation_id') or data.get('session_id')
+    debug = service.is_debug_request(data, request.args)
 
     if not message:
         return validation_error(message='No message provided')
@@ -83,70 +50,99 @@ def chat():
     if not session_id:
         return validation_error(message='No conversation_id provided')
 
-    if not workflow_app:
-        return internal_error(message='System not initialized')
+    if not service.wait_until_ready():
+        return service_unavailable(message='System not ready')
 
-    # Save user message to database
-    if db:
-        db.save_message(session_id, 'user', message)
-
-    # Initialize or get conversation state
-    if session_id not in conversation_states:
-        conversation_states[session_id] = initialize_conversation_state()
-    
-    # Load last 10 messages (5 user + 5 assistant) from DB for context
-    if db:
-        history = db.get_chat_history(session_id)
-        # Get last 10 messages for context (5 Q&A pairs)
-        recent_history = history[-10:] if len(history) >= 10 else history
-        conversation_states[session_id]["conversation_history"] = recent_history
-
-    conversation_state = conversation_states[session_id]
-    conversation_state = reset_query_state(conversation_state)
-    conversation_state["question"] = message
+    conversation_state = service.start_turn(session_id, message)
 
     # Process query through workflow
     try:
-        result = workflow_app.invoke(conversation_state)
-        conversation_states[session_id].update(result)
-
-        # Get current UTC timestamp in ISO 8601 format
-        timestamp = datetime.utcnow().isoformat() + 'Z'
-
-        # Extract response and source
-        response = result.get('generation', 'Unable to generate response.')
-        source = result.get('source', 'Unknown')
-
-        # Save assistant response to database
-        if db:
-            db.save_message(session_id, 'assistant', response)
-
+        result = service.run_workflow(conversation_state)
         return success_response(
             message="Chat response generated successfully",
-            data={
-                'response': response,
-                'source': source,
-                'timestamp': timestamp
-            }
+            data=service.finish_turn(session_id, conversation_state, result, debug)
         )
     except Exception as e:
         print(f"Error processing chat: {e}")
         return internal_error(message=str(e))
 
 
+@app.route('/api/v1/chat/stream', methods=['POST'])
+def chat_stream():
+    """Server-Sent Events: 'token' events with answer chunks, then 'done' with the full response"""
+    data = request.json or {}
+    message = data.get('message', '')
+    session_id = data.get('conversation_id') or data.get('session_id')
+    debug = service.is_debug_request(data, request.args)
+
+    if not message:
+        return validation_error(message='No message provided')
+
+    if not session_id:
+        return validation_error(message='No conversation_id provided')
+
+    if not service.wait_until_ready():
+        return service_unavailable(message='System not ready')
+
+    conversation_state = service.start_turn(session_id, message)
+
+    def generate():
+        try:
+            result = conversation_state
+            for kind, payload in service.stream_workflow(conversation_state):
+                if kind == 'token':
+                    yield sse_event('token', {'delta': payload})
+                elif kind == 'reset':
+                    yield sse_event('reset', {})
+                else:
+                    result = payload
+
+            yield sse_event('done', build_response_body(
+                success=True,
+                message="Chat response generated successfully",
+                code=ResponseCode.SUCCESS,
+                data=service.finish_turn(session_id, conversation_state, result, debug)
+            ))
+        except Exception as e:
+            print(f"Error streaming chat: {e}")
+            yield sse_event('error', build_response_body(
+                success=False,
+                message=str(e),
+                code=ResponseCode.INTERNAL_ERROR
+            ))
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text format: per-node latency histograms, outcomes, tokens and component stats"""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
 @app.route('/api/history', methods=['GET'])
 def get_history():
-    global db
     session_id = request.args.get('conversation_id') or request.args.get('session_id')
 
     if not session_id:
         return validation_error(message='No conversation_id provided')
 
-    if db:
-        messages = db.get_chat_history(session_id)
+    if not service.wait_until_ready():
+        return service_unavailable(message='System not ready')
+
+    limit, error = service.parse_history_limit(request.args.get('limit'))
+    if error:
+        return validation_error(message=error)
+
+    history = service.load_history(session_id, limit=limit, before=request.args.get('before'))
+    if history is not None:
         return success_response(
             message="Chat history retrieved successfully",
-            data={'messages': messages}
+            data=history
         )
 
     return success_response(
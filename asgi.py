@@ -0,0 +1,193 @@
+"""
+Asyncio-native serving mode for the Medical Chat API.
+
+Run with:  uvicorn asgi:app --port 8080
+
+The routes and response envelope match app.py, but each chat turn runs the
+workflow with ainvoke/astream so Gemini, Tavily and retrieval calls are
+awaited, and one worker process can hold many concurrent conversations.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from core import chat_service as service
+from core.metrics import REGISTRY, CONTENT_TYPE
+from core.response import ResponseCode, build_response_body, sse_event
+
+load_dotenv()
+
+
+def json_response(success: bool, message: str, code: ResponseCode, data=None, http_status: int = 200):
+    return JSONResponse(build_response_body(success, message, code, data), status_code=http_status)
+
+
+def success_response(message: str = "Thành công", data=None):
+    return json_response(True, message, ResponseCode.SUCCESS, data)
+
+
+def validation_error(message: str = "Dữ liệu không hợp lệ"):
+    return json_response(False, message, ResponseCode.VALIDATION_ERROR, http_status=400)
+
+
+def internal_error(message: str = "Lỗi hệ thống"):
+    return json_response(False, message, ResponseCode.INTERNAL_ERROR, http_status=500)
+
+
+def service_unavailable(message: str = "Hệ thống đang khởi động", data=None):
+    return json_response(False, message, ResponseCode.RETRY, data, http_status=503)
+
+
+async def _read_chat_request(request):
+    """Returns (message, session_id, debug flag, error response)"""
+    try:
+        data = await request.json()
+    except Exception:
+        data = None
+    if not isinstance(data, dict):
+        return None, None, False, validation_error(message='Invalid JSON body')
+
+    message = data.get('message', '')
+    session_id = data.get('conversation_id') or data.get('session_id')
+
+    if not message:
+        return None, None, False, validation_error(message='No message provided')
+
+    if not session_id:
+        return None, None, False, validation_error(message='No conversation_id provided')
+
+    if not await asyncio.to_thread(service.wait_until_ready):
+        return None, None, False, service_unavailable(message='System not ready')
+
+    return message, session_id, service.is_debug_request(data, request.query_params), None
+
+
+async def health_check(request):
+    return success_response(
+        message="Service is running",
+        data={
+            "status": "online",
+            "service": "MEDICAL CHAT API",
+            "version": "1.0.0"
+        }
+    )
+
+
+async def readiness_check(request):
+    state = service.readiness()
+    if state['status'] == 'ready':
+        return success_response(message="Service is ready", data=state)
+    return service_unavailable(message="Service is not ready", data=state)
+
+
+async def chat(request):
+    message, session_id, debug, error = await _read_chat_request(request)
+    if error:
+        return error
+
+    conversation_state = await service.astart_turn(session_id, message)
+
+    try:
+        result = await service.arun_workflow(conversation_state)
+        return success_response(
+            message="Chat response generated successfully",
+            data=await service.afinish_turn(session_id, conversation_state, result, debug)
+        )
+    except Exception as e:
+        print(f"Error processing chat: {e}")
+        return internal_error(message=str(e))
+
+
+async def chat_stream(request):
+    message, session_id, debug, error = await _read_chat_request(request)
+    if error:
+        return error
+
+    conversation_state = await service.astart_turn(session_id, message)
+
+    async def generate():
+        try:
+            result = conversation_state
+            async for kind, payload in service.astream_workflow(conversation_state):
+                if kind == 'token':
+                    yield sse_event('token', {'delta': payload})
+                elif kind == 'reset':
+                    yield sse_event('reset', {})
+                else:
+                    result = payload
+
+            yield sse_event('done', build_response_body(
+                success=True,
+                message="Chat response generated successfully",
+                code=ResponseCode.SUCCESS,
+                data=await service.afinish_turn(session_id, conversation_state, result, debug)
+            ))
+        except Exception as e:
+            print(f"Error streaming chat: {e}")
+            yield sse_event('error', build_response_body(
+                success=False,
+                message=str(e),
+                code=ResponseCode.INTERNAL_ERROR
+            ))
+
+    return StreamingResponse(
+        generate(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+async def get_history(request):
+    session_id = request.query_params.get('conversation_id') or request.query_params.get('session_id')
+
+    if not session_id:
+        return validation_error(message='No conversation_id provided')
+
+    if not await asyncio.to_thread(service.wait_until_ready):
+        return service_unavailable(message='System not ready')
+
+    limit, error = service.parse_history_limit(request.query_params.get('limit'))
+    if error:
+        return validation_error(message=error)
+
+    history = await service.aload_history(session_id, limit=limit, before=request.query_params.get('before'))
+    if history is not None:
+        return success_response(
+            message="Chat history retrieved successfully",
+            data=history
+        )
+
+    return success_response(
+        message="No database connection",
+        data={'messages': []}
+    )
+
+
+async def metrics(request):
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Loading models and opening stores is blocking work; with STARTUP_MODE=lazy
+    # it continues in a background thread and /ready reports when it is done
+    await asyncio.to_thread(service.initialize_system)
+    yield
+
+
+app = Starlette(
+    routes=[
+        Route('/', health_check, methods=['GET']),
+        Route('/ready', readiness_check, methods=['GET']),
+        Route('/api/v1/chat', chat, methods=['POST']),
+        Route('/api/v1/chat/stream', chat_stream, methods=['POST']),
+        Route('/api/history', get_history, methods=['GET']),
+        Route('/metrics', metrics, methods=['GET']),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan
+)
@@ -0,0 +1,104 @@
+"""
+Query-embedding latency, load time and vector agreement: torch vs ONNX.
+
+    python -m benchmarks.bench_embeddings --onnx-file onnx/model.onnx onnx/model_quint8_avx2.onnx
+
+Every ONNX variant is loaded before torch is imported, so its load time does
+not benefit from torch already being in memory. The vectors of each variant
+are compared with the torch vectors the index was built with; the run exits
+with status 1 if the lowest cosine similarity is below --min-cosine.
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from core.config import env_str
+from tools.onnx_embeddings import DEFAULT_ONNX_FILE, OnnxEmbeddings
+from tools.vector_store import EMBEDDING_MODEL_NAME
+
+QUERIES = [
+    "What are the symptoms of diabetes?",
+    "How is high blood pressure treated?",
+    "Can a child take ibuprofen for a fever?",
+    "What causes migraine headaches?",
+    "Is chest pain after exercise dangerous?",
+    "How long does the flu last?",
+    "What are the side effects of metformin?",
+    "How do I know if a cut is infected?",
+    "Triệu chứng của bệnh sốt xuất huyết là gì?",
+    "Bị đau dạ dày nên ăn gì?",
+    "Cao huyết áp có nguy hiểm không?",
+    "Trẻ bị ho kéo dài phải làm sao?",
+    "Bệnh tiểu đường type 2 có chữa khỏi được không?",
+    "Viêm phổi lây qua đường nào?",
+]
+
+
+def measure(name: str, load, repeat: int) -> dict:
+    started = time.perf_counter()
+    embeddings = load()
+    load_seconds = time.perf_counter() - started
+
+    embeddings.embed_query("warm up")
+    latencies = []
+    for _ in range(repeat):
+        for query in QUERIES:
+            started = time.perf_counter()
+            embeddings.embed_query(query)
+            latencies.append(time.perf_counter() - started)
+
+    latencies_ms = np.array(latencies) * 1000
+    vectors = np.array(embeddings.embed_documents(QUERIES), dtype=np.float32)
+    return {
+        "name": name,
+        "load_seconds": load_seconds,
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "vectors": vectors / np.linalg.norm(vectors, axis=1, keepdims=True),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--onnx-file', nargs='+', default=[DEFAULT_ONNX_FILE],
+                        help="ONNX files in the model repo (or in EMBEDDING_ONNX_PATH)")
+    parser.add_argument('--repeat', type=int, default=20, help="rounds over the sample queries")
+    parser.add_argument('--min-cosine', type=float, default=0.99,
+                        help="lowest acceptable cosine similarity to the torch vectors")
+    args = parser.parse_args()
+
+    results = []
+    for onnx_file in args.onnx_file:
+        results.append(measure(
+            f"onnx:{onnx_file}",
+            lambda: OnnxEmbeddings(EMBEDDING_MODEL_NAME, onnx_file=onnx_file,
+                                   local_dir=env_str("EMBEDDING_ONNX_PATH")),
+            args.repeat
+        ))
+
+    def load_torch():
+        from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+
+    reference = measure("torch", load_torch, args.repeat)
+
+    print(f"{'backend':<40}{'load s':>9}{'p50 ms':>9}{'p99 ms':>9}{'min cos':>10}{'mean cos':>10}")
+    print(f"{reference['name']:<40}{reference['load_seconds']:>9.2f}"
+          f"{reference['p50_ms']:>9.2f}{reference['p99_ms']:>9.2f}{'-':>10}{'-':>10}")
+
+    ok = True
+    for result in results:
+        cosines = (result["vectors"] * reference["vectors"]).sum(axis=1)
+        ok = ok and cosines.min() >= args.min_cosine
+        print(f"{result['name']:<40}{result['load_seconds']:>9.2f}{result['p50_ms']:>9.2f}"
+              f"{result['p99_ms']:>9.2f}{cosines.min():>10.5f}{cosines.mean():>10.5f}")
+
+    if not ok:
+        print(f"Some ONNX vectors are below the {args.min_cosine} cosine tolerance")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Recall vs latency of HNSW settings against brute-force search on our corpus.
+
+    python -m benchmarks.bench_hnsw --m 16 32 --construction-ef 100 200 --search-ef 10 50 100 200
+
+The stored chunk vectors are read from the vector database (nothing is
+embedded). Every (M, construction_ef) pair is built once in a temporary
+collection and queried at each search_ef with the vectors of --queries
+sampled chunks; the chunk itself is left out of both result lists. Recall@k
+is measured against exact cosine top-k computed with numpy.
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from chromadb.api.client import SharedSystemClient
+
+from tools.vector_store import open_vectorstore, sync_hnsw_settings
+
+
+def load_vectors(persist_dir: str, batch_size: int = 5000):
+    collection = open_vectorstore(persist_dir, with_embeddings=False)._collection
+    ids, vectors, offset = [], [], 0
+    while True:
+        page = collection.get(limit=batch_size, offset=offset, include=["embeddings"])
+        if not len(page["ids"]):
+            break
+        ids.extend(page["ids"])
+        vectors.extend(page["embeddings"])
+        offset += len(page["ids"])
+    return ids, np.asarray(vectors, dtype=np.float32)
+
+
+def brute_force(vectors: np.ndarray, query_rows: np.ndarray, k: int) -> list:
+    normalized = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+    truth = []
+    for row in query_rows:
+        scores = normalized @ normalized[row]
+        scores[row] = -np.inf
+        top = np.argpartition(-scores, k)[:k]
+        truth.append(set(top[np.argsort(-scores[top])].tolist()))
+    return truth
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--persist-dir', default='./medical_db/')
+    parser.add_argument('--m', type=int, nargs='+', default=[16, 32])
+    parser.add_argument('--construction-ef', type=int, nargs='+', default=[100, 200])
+    parser.add_argument('--search-ef', type=int, nargs='+', default=[10, 50, 100, 200])
+    parser.add_argument('--queries', type=int, default=200, help="sampled chunks used as queries")
+    parser.add_argument('--k', type=int, default=10)
+    args = parser.parse_args()
+
+    ids, vectors = load_vectors(args.persist_dir)
+    rng = np.random.default_rng(0)
+    query_rows = rng.choice(len(ids), size=min(args.queries, len(ids)), replace=False)
+    truth = brute_force(vectors, query_rows, args.k)
+    row_of = {chunk_id: row for row, chunk_id in enumerate(ids)}
+    print(f"{len(ids)} chunks, {len(query_rows)} queries, recall@{args.k} vs brute force")
+    print(f"{'M':>4}{'constr_ef':>11}{'build s':>9}{'search_ef':>11}{'recall':>9}{'p50 ms':>9}{'p99 ms':>9}")
+
+    for m in args.m:
+        for construction_ef in args.construction_ef:
+            directory = tempfile.mkdtemp(prefix="bench_hnsw_")
+            try:
+                metadata = {"hnsw:space": "cosine", "hnsw:M": m, "hnsw:construction_ef": construction_ef}
+                collection = open_vectorstore(directory, with_embeddings=False, metadata=metadata)._collection
+                started = time.perf_counter()
+                for start in range(0, len(ids), 5000):
+                    collection.add(ids=ids[start:start + 5000], embeddings=vectors[start:start + 5000])
+                build_seconds = time.perf_counter() - started
+
+                for search_ef in args.search_ef:
+                    sync_hnsw_settings(collection, {"hnsw:search_ef": search_ef})
+                    # A loaded index keeps the ef it was opened with
+                    SharedSystemClient.clear_system_cache()
+                    collection = open_vectorstore(directory, with_embeddings=False, metadata=metadata)._collection
+                    hits, latencies = 0, []
+                    for row, expected in zip(query_rows, truth):
+                        started = time.perf_counter()
+                        found = collection.query(query_embeddings=[vectors[row]], n_results=args.k + 1,
+                                                 include=[])["ids"][0]
+                        latencies.append(time.perf_counter() - started)
+                        found_rows = [row_of[chunk_id] for chunk_id in found if row_of[chunk_id] != row][:args.k]
+                        hits += len(expected.intersection(found_rows))
+                    latencies_ms = np.array(latencies) * 1000
+                    print(f"{m:>4}{construction_ef:>11}{build_seconds:>9.2f}{search_ef:>11}"
+                          f"{hits / (len(truth) * args.k):>9.4f}{np.percentile(latencies_ms, 50):>9.2f}"
+                          f"{np.percentile(latencies_ms, 99):>9.2f}")
+            finally:
+                shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Throughput of PDF extraction + chunking: serial path vs process pool.
+
+    python -m benchmarks.bench_ingest --pdf data/gale-encyclopedia.pdf --workers 2 4 8
+
+Only the CPU-bound part of ingestion is measured (pypdf text extraction and
+tiktoken splitting); nothing is embedded or written. Every parallel run is
+checked to produce exactly the same chunks, in the same order, as the
+serial one.
+"""
+import argparse
+import hashlib
+import os
+import time
+
+from tools.data_loader import get_text_splitter, iter_pdf, iter_pdf_split_parallel
+
+
+def _digest(digest, page, chunks):
+    digest.update(f"{page.metadata['page']}\0".encode('utf-8'))
+    for chunk in chunks:
+        digest.update(chunk.page_content.encode('utf-8'))
+        digest.update(b"\0")
+
+
+def run_serial(pdf_path: str):
+    splitter = get_text_splitter()
+    digest = hashlib.sha256()
+    pages = chunks = 0
+    started = time.perf_counter()
+    for page in iter_pdf(pdf_path):
+        page_chunks = splitter.split_documents([page])
+        _digest(digest, page, page_chunks)
+        pages += 1
+        chunks += len(page_chunks)
+    return time.perf_counter() - started, pages, chunks, digest.hexdigest()
+
+
+def run_parallel(pdf_path: str, workers: int, pages_per_shard: int):
+    digest = hashlib.sha256()
+    pages = chunks = 0
+    started = time.perf_counter()
+    for page, page_chunks in iter_pdf_split_parallel(pdf_path, workers, pages_per_shard):
+        _digest(digest, page, page_chunks)
+        pages += 1
+        chunks += len(page_chunks)
+    return time.perf_counter() - started, pages, chunks, digest.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pdf', default='data/gale-encyclopedia.pdf')
+    parser.add_argument('--workers', type=int, nargs='+', default=[2, 4, os.cpu_count() or 1])
+    parser.add_argument('--pages-per-shard', type=int, default=32)
+    args = parser.parse_args()
+
+    # Build the tiktoken encoder before timing
+    get_text_splitter()
+
+    print(f"{'mode':<12}{'seconds':>10}{'pages/s':>12}{'chunks/s':>12}{'speedup':>10}  same output")
+    seconds, pages, chunks, expected = run_serial(args.pdf)
+    baseline = seconds
+    print(f"{'serial':<12}{seconds:>10.2f}{pages / seconds:>12.1f}{chunks / seconds:>12.1f}{1.0:>10.2f}  -")
+
+    for workers in sorted(set(args.workers)):
+        seconds, pages, chunks, digest = run_parallel(args.pdf, workers, args.pages_per_shard)
+        print(f"{f'{workers} workers':<12}{seconds:>10.2f}{pages / seconds:>12.1f}{chunks / seconds:>12.1f}"
+              f"{baseline / seconds:>10.2f}  {digest == expected}")
+
+
+if __name__ == '__main__':
+    main()
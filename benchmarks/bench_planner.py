@@ -0,0 +1,103 @@
+"""
+Routing of the planner: accuracy and cost per question.
+
+    python -m benchmarks.bench_planner [--cases benchmarks/routing_cases.json] [--semantic]
+
+Every case names the route the planner should take: "retriever" for a
+medical question, "llm_agent" for general health advice or a follow-up,
+"direct" for greetings and thanks, "out_of_scope" for anything else. The
+keyword rule only tells "retriever" from "llm_agent", so for it the last
+three count as "llm_agent". The compiled KeywordMatcher is compared with the
+substring scan it replaced (`any(word in question for word in keywords)`
+over the English keywords). With --semantic the SemanticRouter is measured
+too, on the exact route, with the embedding model of the vector database;
+its time per question excludes embedding the question.
+
+Disease titles from the title index are left out. The run exits with status
+1 if the KeywordMatcher's accuracy is below --min-accuracy.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from tools.keyword_matcher import DEFAULT_LEXICON_PATH, KeywordMatcher
+
+DEFAULT_CASES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "routing_cases.json")
+
+
+def keyword_route(expected: str) -> str:
+    return "retriever" if expected == "retriever" else "llm_agent"
+
+
+def measure(name: str, route, cases: list, repeat: int, coarse: bool) -> dict:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for case in cases:
+            route(case["question"])
+    per_question_us = (time.perf_counter() - started) / (repeat * len(cases)) * 1e6
+
+    misrouted = []
+    for case in cases:
+        expected = keyword_route(case["expected"]) if coarse else case["expected"]
+        chosen = route(case["question"])
+        if chosen != expected:
+            misrouted.append((case["question"], expected, chosen))
+    return {
+        "name": name,
+        "per_question_us": per_question_us,
+        "accuracy": 1 - len(misrouted) / len(cases),
+        "misrouted": misrouted,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cases', default=DEFAULT_CASES_PATH)
+    parser.add_argument('--lexicon', default=DEFAULT_LEXICON_PATH)
+    parser.add_argument('--repeat', type=int, default=200, help="rounds over the cases")
+    parser.add_argument('--semantic', action='store_true', help="also measure the SemanticRouter")
+    parser.add_argument('--min-accuracy', type=float, default=0.95)
+    args = parser.parse_args()
+
+    with open(args.cases, 'r', encoding='utf-8') as f:
+        cases = json.load(f)
+    with open(args.lexicon, 'r', encoding='utf-8') as f:
+        lexicon = json.load(f)
+
+    english = lexicon["en"]
+    matcher = KeywordMatcher(lexicon)
+    substring = lambda question: any(word in question.lower() for word in english)
+    results = [
+        measure("substring scan", lambda question: keyword_route("retriever" if substring(question) else ""),
+                cases, args.repeat, coarse=True),
+        measure("KeywordMatcher", lambda question: keyword_route("retriever" if matcher.matches(question) else ""),
+                cases, args.repeat, coarse=True),
+    ]
+
+    if args.semantic:
+        from tools.semantic_router import SemanticRouter
+        router = SemanticRouter.from_env()
+        # Embed every case once, so the loop only times the centroid comparison
+        vectors = {case["question"]: router.embed_fn(case["question"]) for case in cases}
+        embed_fn, router.embed_fn = router.embed_fn, vectors.__getitem__
+        results.append(measure("SemanticRouter", lambda question: router.classify(question)[0],
+                               cases, args.repeat, coarse=False))
+        router.embed_fn = embed_fn
+
+    print(f"{len(cases)} cases, {matcher.size} keywords")
+    print(f"{'router':<20}{'us/question':>13}{'accuracy':>10}")
+    for result in results:
+        print(f"{result['name']:<20}{result['per_question_us']:>13.1f}{result['accuracy']:>10.1%}")
+    for result in results:
+        for question, expected, chosen in result["misrouted"]:
+            print(f"  {result['name']}: {question!r} -> {chosen} (expected {expected})")
+
+    if results[1]["accuracy"] < args.min_accuracy:
+        print(f"KeywordMatcher accuracy is below {args.min_accuracy:.0%}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
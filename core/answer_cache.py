@@ -0,0 +1,267 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from core.config import env_bool, env_float, env_int, env_str
+
+# Fallback answers must never be served from the cache
+UNCACHEABLE_SOURCES = {"System Message"}
+
+
+@dataclass
+class CacheLookup:
+    """Result of a lookup; keeps the embedding so a miss can be stored without re-embedding"""
+    vector: Optional[np.ndarray]
+    context_key: str
+    entry: Optional[dict] = None
+    similarity: float = 0.0
+
+    @property
+    def hit(self) -> bool:
+        return self.entry is not None
+
+
+class SemanticAnswerCache:
+    """
+    Semantic cache of final answers keyed by question embedding.
+
+    A lookup embeds the question, compares it by cosine similarity with cached
+    questions asked in the same conversation context (hash of the last
+    `history_window` messages) and returns the cached generation/source when
+    the best match is above `threshold`. Entries are evicted LRU beyond
+    `max_entries` and expire after `ttl` seconds. The index is saved to
+    `persist_path` (.npz) periodically and on shutdown.
+    """
+
+    def __init__(self, embed_fn: Callable[[str], List[float]], threshold: float = 0.95,
+                 max_entries: int = 2000, ttl: float = 86400.0, history_window: int = 4,
+                 persist_path: Optional[str] = None, persist_every: int = 20):
+        self.embed_fn = embed_fn
+        self.threshold = threshold
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.history_window = history_window
+        self.persist_path = persist_path
+        self.persist_every = persist_every
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # entry id -> entry dict, LRU order
+        self._matrix = None            # (max_entries, dim) normalized float32 vectors
+        self._slot_ids = [None] * self.max_entries
+        self._free_slots = list(range(self.max_entries - 1, -1, -1))
+        self._unsaved = 0
+
+        self._lookups = 0
+        self._hits = 0
+        self._stores = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._lookup_time = 0.0
+
+        if self.persist_path:
+            self.load()
+
+    @classmethod
+    def from_env(cls, embed_fn):
+        return cls(
+            embed_fn,
+            threshold=env_float("ANSWER_CACHE_THRESHOLD", 0.95),
+            max_entries=env_int("ANSWER_CACHE_MAX_ENTRIES", 2000),
+            ttl=env_float("ANSWER_CACHE_TTL", 86400.0),
+            history_window=env_int("ANSWER_CACHE_HISTORY_WINDOW", 4),
+            persist_path=env_str("ANSWER_CACHE_PATH", "./cache/answer_cache.npz")
+        )
+
+    @staticmethod
+    def normalize_question(question: str) -> str:
+        return " ".join(question.split())
+
+    def context_key(self, history: List[dict]) -> str:
+        """Fingerprint of the recent conversation; '' when there is no history"""
+        window = history[-self.history_window:] if self.history_window > 0 else []
+        if not window:
+            return ""
+        text = "\n".join(f"{item.get('role')}:{' '.join(str(item.get('content', '')).split())}"
+                         for item in window)
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def _embed(self, question: str) -> np.ndarray:
+        vector = np.asarray(self.embed_fn(self.normalize_question(question)), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _ensure_matrix(self, dim: int):
+        if self._matrix is None or self._matrix.shape[1] != dim:
+            self._matrix = np.zeros((self.max_entries, dim), dtype=np.float32)
+            self._slot_ids = [None] * self.max_entries
+            self._free_slots = list(range(self.max_entries - 1, -1, -1))
+            self._entries.clear()
+
+    def _remove(self, entry_id: str):
+        """Drop an entry and free its slot (lock held)"""
+        entry = self._entries.pop(entry_id)
+        self._slot_ids[entry['slot']] = None
+        self._matrix[entry['slot']] = 0.0
+        self._free_slots.append(entry['slot'])
+
+    def _expire(self, now: float):
+        if self.ttl <= 0:
+            return
+        expired = [entry_id for entry_id, entry in self._entries.items()
+                   if now - entry['created_at'] > self.ttl]
+        for entry_id in expired:
+            self._remove(entry_id)
+            self._expirations += 1
+
+    def lookup(self, question: str, history: List[dict]) -> CacheLookup:
+        started = time.perf_counter()
+        context_key = self.context_key(history)
+        try:
+            vector = self._embed(question)
+        except Exception as e:
+            print(f"AnswerCache: failed to embed question - {e}")
+            return CacheLookup(vector=None, context_key=context_key)
+
+        result = CacheLookup(vector=vector, context_key=context_key)
+        with self._lock:
+            self._lookups += 1
+            if self._entries and self._matrix is not None and self._matrix.shape[1] == vector.shape[0]:
+                self._expire(time.time())
+                similarities = self._matrix @ vector
+                # Free slots are zero vectors; walk candidates from the most similar down
+                for slot in np.argsort(-similarities):
+                    similarity = float(similarities[slot])
+                    if similarity < self.threshold:
+                        break
+                    entry_id = self._slot_ids[slot]
+                    if entry_id is None:
+                        continue
+                    entry = self._entries[entry_id]
+                    if entry['context_key'] != context_key:
+                        continue
+                    self._entries.move_to_end(entry_id)
+                    entry['hits'] += 1
+                    self._hits += 1
+                    result.entry = dict(entry)
+                    result.similarity = similarity
+                    break
+            self._lookup_time += time.perf_counter() - started
+        return result
+
+    def store(self, lookup: CacheLookup, question: str, generation: str, source: str):
+        """Cache an answer computed after a miss"""
+        if lookup.vector is None or not generation or source in UNCACHEABLE_SOURCES:
+            return
+
+        save_now = False
+        with self._lock:
+            self._ensure_matrix(lookup.vector.shape[0])
+            self._expire(time.time())
+            while not self._free_slots:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+            slot = self._free_slots.pop()
+            entry_id = uuid.uuid4().hex
+            self._matrix[slot] = lookup.vector
+            self._slot_ids[slot] = entry_id
+            self._entries[entry_id] = {
+                'slot': slot,
+                'question': self.normalize_question(question),
+                'context_key': lookup.context_key,
+                'generation': generation,
+                'source': source,
+                'created_at': time.time(),
+                'hits': 0
+            }
+            self._stores += 1
+            self._unsaved += 1
+            if self.persist_path and self.persist_every > 0 and self._unsaved >= self.persist_every:
+                save_now = True
+
+        if save_now:
+            self.save()
+
+    def save(self):
+        """Write the index to disk atomically (vectors + JSON metadata in one .npz)"""
+        if not self.persist_path:
+            return
+        with self._lock:
+            if self._matrix is None:
+                return
+            entries = list(self._entries.values())
+            vectors = np.stack([self._matrix[e['slot']] for e in entries]) if entries else \
+                np.zeros((0, self._matrix.shape[1]), dtype=np.float32)
+            metadata = json.dumps([{k: v for k, v in e.items() if k != 'slot'} for e in entries],
+                                  ensure_ascii=False)
+            self._unsaved = 0
+
+        directory = os.path.dirname(self.persist_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.persist_path}.{os.getpid()}.tmp.npz"
+        try:
+            np.savez(tmp_path, vectors=vectors, metadata=np.array(metadata))
+            os.replace(tmp_path, self.persist_path)
+        except Exception as e:
+            print(f"AnswerCache: failed to save index - {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def load(self):
+        """Load a previously saved index, skipping expired entries"""
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with np.load(self.persist_path) as data:
+                vectors = data['vectors']
+                metadata = json.loads(str(data['metadata']))
+        except Exception as e:
+            print(f"AnswerCache: failed to load index - {e}")
+            return
+
+        now = time.time()
+        with self._lock:
+            if len(metadata) == 0:
+                return
+            self._ensure_matrix(vectors.shape[1])
+            # Keep the most recently used entries that fit
+            for vector, entry in list(zip(vectors, metadata))[-self.max_entries:]:
+                if self.ttl > 0 and now - entry['created_at'] > self.ttl:
+                    continue
+                slot = self._free_slots.pop()
+                entry_id = uuid.uuid4().hex
+                self._matrix[slot] = vector
+                self._slot_ids[slot] = entry_id
+                self._entries[entry_id] = dict(entry, slot=slot)
+        print(f"AnswerCache: loaded {len(self._entries)} cached answers")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "lookups": self._lookups,
+                "hits": self._hits,
+                "misses": self._lookups - self._hits,
+                "hit_rate": round(self._hits / self._lookups, 4) if self._lookups else 0.0,
+                "stores": self._stores,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "avg_lookup_ms": round(1000 * self._lookup_time / self._lookups, 3) if self._lookups else 0.0,
+            }
+
+
+def create_answer_cache():
+    """Build the answer cache unless ANSWER_CACHE_ENABLED is off"""
+    if not env_bool("ANSWER_CACHE_ENABLED", True):
+        return None
+    from tools.vector_store import get_embeddings
+    return SemanticAnswerCache.from_env(lambda text: get_embeddings().embed_query(text))
@@ -0,0 +1,517 @@
+"""
+Chat turn logic shared by the Flask app (app.py) and the ASGI app (asgi.py)
+"""
+import asyncio
+import atexit
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from core.config import env_bool, env_float, env_str
+from core.instrumentation import observe_request, request_path
+from core.metrics import REGISTRY
+from core.resilience import breaker_stats, start_deadline
+from core.session_store import create_session_store
+from core.single_flight import coalescing_key, get_single_flight, shared_result
+from core.state import reset_query_state
+
+# Heavy modules (langgraph, chromadb, the embedding model, psycopg2, numpy) are
+# imported inside _warm_up(), so importing this module stays fast.
+
+# Global workflow and conversation states
+workflow_app = None
+session_store = None
+answer_cache = None
+db = None
+message_writer = None
+
+# Readiness of the components above, and seconds spent starting each of them
+_ready = threading.Event()
+_startup_done = threading.Event()
+_startup_begun = False
+startup_error = None
+startup_profile = {}
+
+# Number of messages (5 Q&A pairs) loaded as context for each chat turn
+HISTORY_CONTEXT_SIZE = 10
+
+# Paging limits for /api/history
+DEFAULT_HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 200
+
+# Graph nodes whose LLM tokens are relayed to streaming clients
+STREAMED_NODES = {"llm_agent", "executor"}
+
+
+def initialize_system(lazy: bool = None):
+    """
+    Start all components. With STARTUP_MODE=lazy (or lazy=True) the work runs
+    in a background warm-up thread and this returns at once; requests wait
+    for it through wait_until_ready() and /ready reports progress.
+    """
+    global _startup_begun
+    if lazy is None:
+        lazy = env_str("STARTUP_MODE", "eager").lower() == "lazy"
+    _startup_begun = True
+    if lazy:
+        print("Initializing Medical Chat System in the background...")
+        threading.Thread(target=_warm_up, name="warm-up", daemon=True).start()
+    else:
+        _warm_up()
+        if startup_error:
+            raise startup_error
+
+
+@contextmanager
+def _profile(component: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_profile[component] = round(time.perf_counter() - started, 3)
+
+
+def _warm_up():
+    global workflow_app, db, message_writer, session_store, answer_cache, startup_error
+
+    pdf_path = './data/medical_book.pdf'
+    json_path = './data/medical-data.json'
+    persist_dir = './medical_db/'
+
+    print("Initializing Medical Chat System...")
+    started = time.perf_counter()
+
+    try:
+        # Initialize Supabase Database
+        with _profile("database"):
+            try:
+                from core.database import SupabaseDB
+                from core.message_writer import MessageWriter
+
+                db = SupabaseDB()
+                atexit.register(db.close)
+                print("Connected to Supabase...")
+
+                # Persist messages in the background so chat replies don't wait on the DB
+                if env_bool("MESSAGE_WRITE_BEHIND", True):
+                    message_writer = MessageWriter.from_env(db).start()
+                    atexit.register(message_writer.close)
+            except Exception as e:
+                print(f"Failed to connect to Supabase: {e}")
+                print("Chat history will not be saved!")
+
+        # Try to load an existing database
+        with _profile("vectorstore"):
+            from tools.vector_store import get_or_create_vectorstore, retriever_mode
+            existing_db = get_or_create_vectorstore(persist_dir=persist_dir)
+
+            if not existing_db:
+                # Built through the incremental pipeline so later updates only embed what changed
+                from tools.ingest import ingest
+                print("Creating vector database from data sources...")
+                ingest(pdf_paths=[pdf_path], json_paths=[json_path], persist_dir=persist_dir)
+                if not get_or_create_vectorstore(persist_dir=persist_dir):
+                    print("No documents found to create database")
+
+        # Built from Chroma on first use when missing, so do it before serving
+        if retriever_mode() == "hybrid":
+            with _profile("lexical_index"):
+                from tools.vector_store import get_lexical_index
+                get_lexical_index()
+        if env_bool("RETRIEVAL_FILTER_ENABLED", True):
+            with _profile("title_index"):
+                from tools.vector_store import get_title_index
+                get_title_index()
+
+        # Embeds the routing examples unless their centroids are cached
+        from tools.semantic_router import get_semantic_router, planner_mode
+        if planner_mode() == "semantic":
+            with _profile("semantic_router"):
+                get_semantic_router()
+
+        # Conversation states are evicted when idle and rehydrated from the DB on a miss,
+        # or when another worker answered in the conversation since (SESSION_STORE_VALIDATE)
+        with _profile("session_store"):
+            session_store = create_session_store(
+                loader=load_recent_history if db else None,
+                validator=latest_message_id if db and env_bool("SESSION_STORE_VALIDATE", True) else None
+            )
+
+        # Near-identical questions are answered from the semantic cache
+        with _profile("answer_cache"):
+            from core.answer_cache import create_answer_cache
+            answer_cache = create_answer_cache()
+            if answer_cache:
+                atexit.register(answer_cache.save)
+
+        with _profile("workflow"):
+            from core.langgraph_workflow import create_workflow
+            workflow = create_workflow()
+
+        # First inference is much slower than the following ones
+        with _profile("warm_up"):
+            from tools.llm_client import LLMClient
+            from tools.reranker import get_reranker
+            from tools.vector_store import get_embeddings
+            get_embeddings().embed_query("warm up")
+            if get_reranker():
+                get_reranker().warm_up()
+            try:
+                LLMClient.get_llm()
+            except Exception as e:
+                print(f"LLM client not available: {e}")
+
+        _register_component_stats()
+        workflow_app = workflow
+        startup_profile["total"] = round(time.perf_counter() - started, 3)
+        _ready.set()
+        print(f"Medical Chat API Ready! Startup profile (s): {startup_profile}")
+    except Exception as e:
+        startup_error = e
+        print(f"Startup failed: {e}")
+    finally:
+        _startup_done.set()
+
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+
+def wait_until_ready(timeout: float = None) -> bool:
+    """Block until the warm-up finished, at most `timeout` seconds (STARTUP_WAIT_TIMEOUT)"""
+    if not _startup_begun:
+        return False
+    if timeout is None:
+        timeout = env_float("STARTUP_WAIT_TIMEOUT", 30.0)
+    _startup_done.wait(timeout)
+    return _ready.is_set()
+
+
+def readiness() -> dict:
+    if _ready.is_set():
+        status = "ready"
+    elif startup_error:
+        status = "failed"
+    elif _startup_begun:
+        status = "warming_up"
+    else:
+        status = "not_started"
+    return {"status": status, "startup_seconds": dict(startup_profile)}
+
+
+def _register_component_stats():
+    """Expose the stats() of long-lived components on /metrics"""
+    from core.llm_cache import get_llm_response_cache
+    from tools.reranker import get_reranker
+    from tools.semantic_router import get_semantic_router
+    from tools.vector_store import get_embeddings, get_lexical_index, retriever_mode
+
+    REGISTRY.register_stats("medical_chat_startup_seconds", lambda: startup_profile)
+    REGISTRY.register_stats("medical_chat_breaker", breaker_stats)
+    if get_single_flight():
+        REGISTRY.register_stats("medical_chat_single_flight", get_single_flight().stats)
+    if db:
+        REGISTRY.register_stats("medical_chat_db_pool", db.pool_stats)
+    if message_writer:
+        REGISTRY.register_stats("medical_chat_message_writer", message_writer.stats)
+    if session_store:
+        REGISTRY.register_stats("medical_chat_session_store", session_store.stats)
+    if answer_cache:
+        REGISTRY.register_stats("medical_chat_answer_cache", answer_cache.stats)
+    embeddings = get_embeddings()
+    if hasattr(embeddings, 'stats'):
+        REGISTRY.register_stats("medical_chat_embedding_cache", embeddings.stats)
+    if retriever_mode() == "hybrid" and get_lexical_index():
+        REGISTRY.register_stats("medical_chat_lexical_index", get_lexical_index().stats)
+    if get_reranker():
+        REGISTRY.register_stats("medical_chat_reranker", get_reranker().stats)
+    if get_semantic_router():
+        REGISTRY.register_stats("medical_chat_semantic_router", get_semantic_router().stats)
+    if get_llm_response_cache():
+        REGISTRY.register_stats("medical_chat_llm_cache", get_llm_response_cache().stats)
+
+
+def save_message(session_id: str, role: str, content: str):
+    """Queue a message for write-behind persistence, or save it directly; returns its id or None"""
+    if message_writer:
+        return message_writer.enqueue(session_id, role, content)
+    if db:
+        return db.save_message(session_id, role, content)
+    return None
+
+
+def latest_message_id(session_id: str):
+    """Id of the newest message of a session, counting the ones still in the write-behind queue"""
+    pending = message_writer.pending_messages(session_id) if message_writer else []
+    if pending:
+        return pending[-1]['id']
+    return db.get_latest_message_id(session_id)
+
+
+def load_recent_history(session_id: str, limit: int = None):
+    """Last messages of a session, including ones still waiting in the write-behind queue"""
+    limit = limit or HISTORY_CONTEXT_SIZE
+    # Snapshot pending messages before reading the DB, then drop the ones already written
+    pending = message_writer.pending_messages(session_id) if message_writer else []
+    history = db.get_recent_history(session_id, limit=limit)
+    saved_ids = {item['id'] for item in history}
+    history.extend(item for item in pending if item['id'] not in saved_ids)
+    return history[-limit:]
+
+
+def answer_from_cache(conversation_state):
+    """Look the question up in the answer cache; on a hit the state is filled in like ExecutorAgent does"""
+    if not answer_cache:
+        return None
+
+    question = conversation_state["question"]
+    lookup = answer_cache.lookup(question, conversation_state["conversation_history"])
+    if lookup.hit:
+        print(f"AnswerCache: hit (similarity {lookup.similarity:.3f})")
+        conversation_state["trace"] = [{"node": "answer_cache", "ms": 0.0, "outcome": "hit"}]
+        answer = lookup.entry['generation']
+        source = lookup.entry['source']
+        conversation_state["generation"] = answer
+        conversation_state["source"] = source
+        conversation_state["conversation_history"].append({'role': 'user', 'content': question})
+        conversation_state["conversation_history"].append(
+            {'role': 'assistant', 'content': answer, 'source': source}
+        )
+    return lookup
+
+
+def cache_answer(lookup, result):
+    if lookup is not None and not lookup.hit:
+        answer_cache.store(lookup, result.get('question', ''), result.get('generation', ''),
+                           result.get('source', ''))
+
+
+def run_workflow(conversation_state):
+    """Answer the current question, serving near-duplicate questions from the answer cache
+    and sharing the run of an identical question already in flight"""
+    started = time.perf_counter()
+    lookup = answer_from_cache(conversation_state)
+    if lookup is not None and lookup.hit:
+        observe_request(conversation_state, time.perf_counter() - started)
+        return conversation_state
+
+    single_flight = get_single_flight()
+    key = coalescing_key(conversation_state) if single_flight else None
+    if key is None:
+        result, shared = workflow_app.invoke(conversation_state), False
+    else:
+        # Concurrent identical first questions share one run
+        result, shared = single_flight.do(key, workflow_app.invoke, conversation_state)
+    if shared:
+        result = shared_result(result, time.perf_counter() - started)
+    else:
+        cache_answer(lookup, result)
+    observe_request(result, time.perf_counter() - started)
+    return result
+
+
+def _chunk_text(chunk) -> str:
+    content = getattr(chunk, 'content', '')
+    if isinstance(content, str):
+        return content
+    # Gemini may return a list of content parts
+    return "".join(part.get('text', '') if isinstance(part, dict) else str(part) for part in content)
+
+
+class _StreamRelay:
+    """Turns LangGraph (mode, payload) stream items into ('token', text) / ('reset', None) events"""
+
+    def __init__(self, conversation_state):
+        self.result = conversation_state
+        self.streaming_node = None
+
+    def events(self, mode, payload):
+        if mode == "values":
+            self.result = payload
+            return []
+
+        chunk, metadata = payload
+        node = metadata.get('langgraph_node')
+        text = _chunk_text(chunk) if node in STREAMED_NODES else ''
+        if not text:
+            return []
+
+        events = []
+        if self.streaming_node is not None and node != self.streaming_node:
+            events.append(('reset', None))
+        self.streaming_node = node
+        events.append(('token', text))
+        return events
+
+
+def stream_workflow(conversation_state):
+    """
+    Like run_workflow, but yields ('token', text) while the answer is generated,
+    ('reset', None) when a later node starts a new answer (e.g. a fallback after
+    a failed LLM attempt), and finally ('result', state).
+    """
+    started = time.perf_counter()
+    lookup = answer_from_cache(conversation_state)
+    if lookup is not None and lookup.hit:
+        observe_request(conversation_state, time.perf_counter() - started)
+        yield 'token', conversation_state["generation"]
+        yield 'result', conversation_state
+        return
+
+    relay = _StreamRelay(conversation_state)
+    for mode, payload in workflow_app.stream(conversation_state, stream_mode=["messages", "values"]):
+        yield from relay.events(mode, payload)
+
+    cache_answer(lookup, relay.result)
+    observe_request(relay.result, time.perf_counter() - started)
+    yield 'result', relay.result
+
+
+async def arun_workflow(conversation_state):
+    """Async run_workflow: the graph runs with ainvoke, blocking cache work goes to a thread"""
+    started = time.perf_counter()
+    lookup = await asyncio.to_thread(answer_from_cache, conversation_state)
+    if lookup is not None and lookup.hit:
+        observe_request(conversation_state, time.perf_counter() - started)
+        return conversation_state
+
+    single_flight = get_single_flight()
+    key = coalescing_key(conversation_state) if single_flight else None
+    if key is None:
+        result, shared = await workflow_app.ainvoke(conversation_state), False
+    else:
+        result, shared = await single_flight.ado(key, workflow_app.ainvoke, conversation_state)
+    if shared:
+        result = shared_result(result, time.perf_counter() - started)
+    else:
+        await asyncio.to_thread(cache_answer, lookup, result)
+    observe_request(result, time.perf_counter() - started)
+    return result
+
+
+async def astream_workflow(conversation_state):
+    """Async stream_workflow, yields the same events"""
+    started = time.perf_counter()
+    lookup = await asyncio.to_thread(answer_from_cache, conversation_state)
+    if lookup is not None and lookup.hit:
+        observe_request(conversation_state, time.perf_counter() - started)
+        yield 'token', conversation_state["generation"]
+        yield 'result', conversation_state
+        return
+
+    relay = _StreamRelay(conversation_state)
+    async for mode, payload in workflow_app.astream(conversation_state, stream_mode=["messages", "values"]):
+        for event in relay.events(mode, payload):
+            yield event
+
+    await asyncio.to_thread(cache_answer, lookup, relay.result)
+    observe_request(relay.result, time.perf_counter() - started)
+    yield 'result', relay.result
+
+
+def start_turn(session_id: str, message: str):
+    """Load the conversation state for a new question and save the user message"""
+    # Get conversation state; on a miss the last 10 messages are loaded from DB
+    conversation_state = session_store.get(session_id)
+
+    # Save user message to database
+    save_message(session_id, 'user', message)
+
+    conversation_state = reset_query_state(conversation_state)
+    conversation_state["question"] = message
+    return start_deadline(conversation_state)
+
+
+def finish_turn(session_id: str, conversation_state, result, debug: bool = False) -> dict:
+    """Store the updated state, save the answer and build the response payload"""
+    # Get current UTC timestamp in ISO 8601 format
+    timestamp = datetime.utcnow().isoformat() + 'Z'
+
+    # Extract response and source
+    response = result.get('generation', 'Unable to generate response.')
+    source = result.get('source', 'Unknown')
+
+    payload = {
+        'response': response,
+        'source': source,
+        'timestamp': timestamp
+    }
+    if debug:
+        # Per-request trace, read before the session store compacts the state
+        payload['debug'] = {
+            'path': request_path(result),
+            'route': result.get('current_tool'),
+            'route_confidence': result.get('route_confidence'),
+            'trace': list(result.get('trace') or []),
+            'token_usage': dict(result.get('token_usage') or {})
+        }
+
+    conversation_state.update(result)
+
+    # Save assistant response to database; the next turn checks its id is still the newest
+    message_id = save_message(session_id, 'assistant', response)
+    session_store.put(session_id, conversation_state, message_id)
+
+    return payload
+
+
+async def astart_turn(session_id: str, message: str):
+    # A session store miss reads history from the DB
+    return await asyncio.to_thread(start_turn, session_id, message)
+
+
+async def afinish_turn(session_id: str, conversation_state, result, debug: bool = False) -> dict:
+    return await asyncio.to_thread(finish_turn, session_id, conversation_state, result, debug)
+
+
+def parse_history_limit(value):
+    """Validate the `limit` query parameter, returns (limit, error message)"""
+    if value is None:
+        return None, None
+    try:
+        limit = int(value)
+    except ValueError:
+        return None, 'limit must be an integer'
+    if limit < 1 or limit > MAX_HISTORY_PAGE_SIZE:
+        return None, f'limit must be between 1 and {MAX_HISTORY_PAGE_SIZE}'
+    return limit, None
+
+
+def load_history(session_id: str, limit: int = None, before: str = None):
+    """
+    History for /api/history: the whole conversation, or one page (newest first,
+    use next_cursor as `before` for older pages) when limit/before is given.
+    Returns None when there is no database.
+    """
+    if not db:
+        return None
+
+    if limit is not None or before:
+        messages, next_cursor = db.get_history_page(
+            session_id, limit=limit or DEFAULT_HISTORY_PAGE_SIZE, before=before
+        )
+        return {
+            'messages': messages,
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None
+        }
+
+    messages = db.get_chat_history(session_id)
+    if message_writer:
+        saved_ids = {item['id'] for item in messages}
+        messages.extend(
+            item for item in message_writer.pending_messages(session_id)
+            if item['id'] not in saved_ids
+        )
+    return {'messages': messages}
+
+
+async def aload_history(session_id: str, limit: int = None, before: str = None):
+    return await asyncio.to_thread(load_history, session_id, limit, before)
+
+
+def is_debug_request(body: dict, query_params) -> bool:
+    """A per-request trace is returned when the body has "debug": true or the URL has ?debug=1"""
+    if isinstance(body, dict) and body.get('debug') is True:
+        return True
+    return str(query_params.get('debug', '')).lower() in ('1', 'true', 'yes')
@@ -0,0 +1,41 @@
+import os
+
+
+def env_str(name: str, default: str = None) -> str:
+    """Read a string setting from the environment"""
+    value = os.environ.get(name)
+    if value is None or value.strip() == "":
+        return default
+    return value.strip()
+
+
+def env_int(name: str, default: int) -> int:
+    """Read an integer setting, falling back to the default on bad values"""
+    value = env_str(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        print(f"Invalid value for {name}: {value!r}, using {default}")
+        return default
+
+
+def env_float(name: str, default: float) -> float:
+    """Read a float setting, falling back to the default on bad values"""
+    value = env_str(name)
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        print(f"Invalid value for {name}: {value!r}, using {default}")
+        return default
+
+
+def env_bool(name: str, default: bool = False) -> bool:
+    """Read a boolean setting ('1', 'true', 'yes', 'on' are truthy)"""
+    value = env_str(name)
+    if value is None:
+        return default
+    return value.lower() in ("1", "true", "yes", "on")
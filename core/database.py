@@ -1,8 +1,13 @@
 import os
+from contextlib import contextmanager
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 import uuid
 
+from core.config import env_float, env_int
+from core.db_pool import ConnectionPool, PoolTimeout
+from core.resilience import DEPENDENCY_TIMEOUTS, get_breaker
+
 
 class SupabaseDB:
     def __init__(self):
@@ -10,8 +15,54 @@ class SupabaseDB:
         if not self.db_url:
             raise ValueError("DATABASE_URL environment variable not set")
 
+        connect_kwargs = {"connect_timeout": env_int("DB_CONNECT_TIMEOUT", 10)}
+        statement_timeout_ms = env_int("DB_STATEMENT_TIMEOUT_MS", 0)
+        if statement_timeout_ms > 0:
+            connect_kwargs["options"] = f"-c statement_timeout={statement_timeout_ms}"
+
+        # Connections are opened lazily and reused across requests
+        self.pool = ConnectionPool(
+            self.db_url,
+            min_size=env_int("DB_POOL_MIN_SIZE", 1),
+            max_size=env_int("DB_POOL_MAX_SIZE", 10),
+            timeout=env_float("DB_POOL_TIMEOUT", 10.0),
+            max_lifetime=env_float("DB_POOL_MAX_LIFETIME", 1800.0),
+            max_idle=env_float("DB_POOL_MAX_IDLE", 300.0),
+            health_check_interval=env_float("DB_POOL_HEALTH_CHECK_INTERVAL", 30.0),
+            connect_kwargs=connect_kwargs
+        )
+        self.breaker = get_breaker("postgres")
+
+    @contextmanager
     def _get_connection(self):
-        return psycopg2.connect(self.db_url)
+        """
+        Borrow a pooled connection, use as `with self._get_connection() as conn:`.
+        Fails fast with CircuitOpenError after repeated connection errors or timeouts.
+        """
+        self.breaker.before_call()
+        try:
+            with self.pool.connection() as conn:
+                yield conn
+        except (PoolTimeout, psycopg2.extensions.QueryCanceledError):
+            DEPENDENCY_TIMEOUTS.inc(dependency="postgres", kind="timeout")
+            self.breaker.record_failure()
+            raise
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # A bad query or a caller error says nothing about the database being up
+            self.breaker.release()
+            raise
+        self.breaker.record_success()
+
+    def pool_stats(self):
+        """Connection pool metrics (checked-out, waits, wait time, ...)"""
+        return self.pool.stats()
+
+    def close(self):
+        """Close all pooled connections"""
+        self.pool.closeall()
 
     def save_message(self, session_id: str, role: str, content: str):
         """
@@ -19,116 +70,223 @@ class SupabaseDB:
         Maps 'session_id' -> 'conversation_id'
         Maps 'role' -> 'sender' ('user' or 'bot')
         Timestamps are stored in UTC timezone
+        Returns the message id, or None when it could not be saved
         """
         sender = 'user' if role == 'user' else 'bot'
         message_id = str(uuid.uuid4())
 
-        conn = None
         try:
-            conn = self._get_connection()
-            cur = conn.cursor()
+            with self._get_connection() as conn:
+                cur = conn.cursor()
 
-            # Insert message with UTC timestamp
-            # NOW() AT TIME ZONE 'UTC' ensures UTC timestamp regardless of server timezone
-            cur.execute("""
-                        INSERT INTO messages (id, conversation_id, content, sender, created_at, updated_at)
-                        VALUES (%s, %s, %s, %s, NOW() AT TIME ZONE 'UTC', NOW() AT TIME ZONE 'UTC')
-                        """, (message_id, session_id, content, sender))
+                # Insert message with UTC timestamp
+                # NOW() AT TIME ZONE 'UTC' ensures UTC timestamp regardless of server timezone
+                cur.execute("""
+                            INSERT INTO messages (id, conversation_id, content, sender, created_at, updated_at)
+                            VALUES (%s, %s, %s, %s, NOW() AT TIME ZONE 'UTC', NOW() AT TIME ZONE 'UTC')
+                            """, (message_id, session_id, content, sender))
 
-            conn.commit()
-            cur.close()
+                conn.commit()
+                cur.close()
+            return message_id
         except Exception as e:
             print(f"Error saving message to DB: {e}")
-        finally:
-            if conn:
-                conn.close()
+            return None
+
+    def save_messages(self, messages: list) -> bool:
+        """
+        Save several messages in one multi-row INSERT.
+        Each message is a dict with 'id', 'session_id', 'role', 'content' and
+        'created_at' (naive UTC datetime). Rows whose id already exists are skipped,
+        so a batch can safely be retried. Returns True on success.
+        """
+        if not messages:
+            return True
+
+        rows = []
+        for message in messages:
+            sender = 'user' if message['role'] == 'user' else 'bot'
+            rows.append((
+                message['id'], message['session_id'], message['content'], sender,
+                message['created_at'], message['created_at']
+            ))
+
+        try:
+            with self._get_connection() as conn:
+                cur = conn.cursor()
+
+                execute_values(cur, """
+                               INSERT INTO messages (id, conversation_id, content, sender, created_at, updated_at)
+                               VALUES %s
+                               ON CONFLICT (id) DO NOTHING
+                               """, rows, page_size=len(rows))
+
+                conn.commit()
+                cur.close()
+                return True
+        except Exception as e:
+            print(f"Error saving message batch to DB: {e}")
+            return False
 
     def get_chat_history(self, session_id: str):
         """
         Retrieve chat history for a session.
-        Returns a list of dicts with 'role', 'content', 'timestamp'.
+        Returns a list of dicts with 'id', 'role', 'content', 'timestamp'.
         """
-        conn = None
         try:
-            conn = self._get_connection()
-            cur = conn.cursor(cursor_factory=RealDictCursor)
+            with self._get_connection() as conn:
+                cur = conn.cursor(cursor_factory=RealDictCursor)
+
+                cur.execute("""
+                            SELECT id, content, sender, created_at
+                            FROM messages
+                            WHERE conversation_id = %s
+                            ORDER BY created_at ASC, id ASC
+                            """, (session_id,))
+
+                rows = cur.fetchall()
+                cur.close()
+                return [self._row_to_message(row) for row in rows]
+        except Exception as e:
+            print(f"Error fetching chat history from DB: {e}")
+            return []
 
+    def get_latest_message_id(self, session_id: str):
+        """
+        Id of the newest message of a session, None when it has none.
+        Errors are raised, so a failed read is not mistaken for an empty session.
+        """
+        with self._get_connection() as conn:
+            cur = conn.cursor()
             cur.execute("""
-                        SELECT content, sender, created_at
+                        SELECT id
                         FROM messages
                         WHERE conversation_id = %s
-                        ORDER BY created_at ASC
+                        ORDER BY created_at DESC, id DESC
+                        LIMIT 1
                         """, (session_id,))
+            row = cur.fetchone()
+            cur.close()
+            return str(row[0]) if row else None
 
-            rows = cur.fetchall()
-            messages = []
-            for row in rows:
-                role = 'user' if row['sender'] == 'user' else 'assistant'
-                messages.append({
-                    'role': role,
-                    'content': row['content'],
-                    'timestamp': row['created_at'].isoformat() if row['created_at'] else None
-                })
+    @staticmethod
+    def _row_to_message(row):
+        role = 'user' if row['sender'] == 'user' else 'assistant'
+        return {
+            'id': str(row['id']),
+            'role': role,
+            'content': row['content'],
+            'timestamp': row['created_at'].isoformat() if row['created_at'] else None
+        }
 
-            cur.close()
-            return messages
+    def get_recent_history(self, session_id: str, limit: int = 10):
+        """
+        Retrieve only the last `limit` messages of a session, oldest first.
+        Reads the tail with ORDER BY ... DESC LIMIT and reverses it in Python.
+        """
+        try:
+            with self._get_connection() as conn:
+                cur = conn.cursor(cursor_factory=RealDictCursor)
+
+                cur.execute("""
+                            SELECT id, content, sender, created_at
+                            FROM messages
+                            WHERE conversation_id = %s
+                            ORDER BY created_at DESC, id DESC
+                            LIMIT %s
+                            """, (session_id, limit))
+
+                rows = cur.fetchall()
+                cur.close()
+                return [self._row_to_message(row) for row in reversed(rows)]
         except Exception as e:
-            print(f"Error fetching chat history from DB: {e}")
+            print(f"Error fetching recent chat history from DB: {e}")
             return []
-        finally:
-            if conn:
-                conn.close()
+
+    def get_history_page(self, session_id: str, limit: int = 50, before: str = None):
+        """
+        Keyset pagination over a session's messages, newest page first.
+        `before` is the id of the oldest message of the previous page.
+        Returns (messages oldest first, next cursor or None when there are no older messages).
+        """
+        try:
+            with self._get_connection() as conn:
+                cur = conn.cursor(cursor_factory=RealDictCursor)
+
+                # Fetch one extra row to know whether an older page exists
+                if before:
+                    cur.execute("""
+                                SELECT m.id, m.content, m.sender, m.created_at
+                                FROM messages m
+                                JOIN messages c ON c.id = %s AND c.conversation_id = m.conversation_id
+                                WHERE m.conversation_id = %s
+                                  AND (m.created_at, m.id) < (c.created_at, c.id)
+                                ORDER BY m.created_at DESC, m.id DESC
+                                LIMIT %s
+                                """, (before, session_id, limit + 1))
+                else:
+                    cur.execute("""
+                                SELECT id, content, sender, created_at
+                                FROM messages
+                                WHERE conversation_id = %s
+                                ORDER BY created_at DESC, id DESC
+                                LIMIT %s
+                                """, (session_id, limit + 1))
+
+                rows = cur.fetchall()
+                cur.close()
+
+                has_more = len(rows) > limit
+                rows = rows[:limit]
+                messages = [self._row_to_message(row) for row in reversed(rows)]
+                next_cursor = messages[0]['id'] if has_more and messages else None
+                return messages, next_cursor
+        except Exception as e:
+            print(f"Error fetching chat history page from DB: {e}")
+            return [], None
 
     def get_all_sessions(self):
         """
         Get all conversations.
         """
-        conn = None
         try:
-            conn = self._get_connection()
-            cur = conn.cursor(cursor_factory=RealDictCursor)
+            with self._get_connection() as conn:
+                cur = conn.cursor(cursor_factory=RealDictCursor)
 
-            # Assuming the 'conversations' table has 'id', 'created_at', 'updated_at', 'title'
-            cur.execute("""
-                        SELECT id, created_at, updated_at, title
-                        FROM conversations
-                        ORDER BY updated_at DESC
-                        """)
-
-            rows = cur.fetchall()
-            sessions = []
-            for row in rows:
-                sessions.append({
-                    'session_id': row['id'],
-                    'created_at': row['created_at'].isoformat() if row['created_at'] else None,
-                    'last_active': row['updated_at'].isoformat() if row['updated_at'] else None,
-                    'preview': row['title'] or 'No Title'
-                })
+                # Assuming the 'conversations' table has 'id', 'created_at', 'updated_at', 'title'
+                cur.execute("""
+                            SELECT id, created_at, updated_at, title
+                            FROM conversations
+                            ORDER BY updated_at DESC
+                            """)
 
-            cur.close()
-            return sessions
+                rows = cur.fetchall()
+                sessions = []
+                for row in rows:
+                    sessions.append({
+                        'session_id': row['id'],
+                        'created_at': row['created_at'].isoformat() if row['created_at'] else None,
+                        'last_active': row['updated_at'].isoformat() if row['updated_at'] else None,
+                        'preview': row['title'] or 'No Title'
+                    })
+
+                cur.close()
+                return sessions
         except Exception as e:
             print(f"Error fetching sessions from DB: {e}")
             return []
-        finally:
-            if conn:
-                conn.close()
 
     def delete_session(self, session_id: str):
         """
         Delete a conversation.
         """
-        conn = None
         try:
-            conn = self._get_connection()
-            cur = conn.cursor()
+            with self._get_connection() as conn:
+                cur = conn.cursor()
 
-            cur.execute("DELETE FROM conversations WHERE id = %s", (session_id,))
+                cur.execute("DELETE FROM conversations WHERE id = %s", (session_id,))
 
-            conn.commit()
-            cur.close()
+                conn.commit()
+                cur.close()
         except Exception as e:
             print(f"Error deleting session from DB: {e}")
-        finally:
-            if conn:
-                conn.close()
@@ -0,0 +1,241 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available before the checkout timeout"""
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of psycopg2 connections.
+
+    - At most `max_size` connections are open at once; callers wait up to
+      `timeout` seconds for one to be returned before PoolTimeout is raised.
+    - Connections older than `max_lifetime` seconds are recycled.
+    - Connections idle for more than `max_idle` seconds are closed, as long as
+      at least `min_size` stay open.
+    - A connection idle for longer than `health_check_interval` seconds is
+      pinged with SELECT 1 before it is handed out.
+    """
+
+    def __init__(self, dsn: str, min_size: int = 1, max_size: int = 10,
+                 timeout: float = 10.0, max_lifetime: float = 1800.0,
+                 max_idle: float = 300.0, health_check_interval: float = 30.0,
+                 connect_kwargs: dict = None):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.dsn = dsn
+        self.min_size = max(0, min(min_size, max_size))
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.health_check_interval = health_check_interval
+        self.connect_kwargs = connect_kwargs or {}
+
+        self._cond = threading.Condition()
+        self._idle = deque()   # (conn, last_used) - most recently returned on the right
+        self._created_at = {}  # id(conn) -> creation time
+        self._size = 0         # open connections, idle + checked out
+        self._closed = False
+
+        self._checked_out = 0
+        self._connections_created = 0
+        self._connections_recycled = 0
+        self._connections_discarded = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._timeouts = 0
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn, **self.connect_kwargs)
+        with self._cond:
+            self._created_at[id(conn)] = time.monotonic()
+            self._connections_created += 1
+        return conn
+
+    def _close_quietly(self, conn):
+        self._created_at.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_expired(self, conn, now: float) -> bool:
+        created = self._created_at.get(id(conn), now)
+        return self.max_lifetime > 0 and now - created > self.max_lifetime
+
+    def _is_healthy(self, conn, last_used: float, now: float) -> bool:
+        if conn.closed:
+            return False
+        if now - last_used < self.health_check_interval:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchone()
+            cur.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _prune_idle(self, now: float):
+        """Close idle connections past max_idle while keeping min_size open (lock held)"""
+        while self._idle and self._size > self.min_size:
+            conn, last_used = self._idle[0]
+            if self.max_idle <= 0 or now - last_used <= self.max_idle:
+                break
+            self._idle.popleft()
+            self._size -= 1
+            self._connections_recycled += 1
+            self._close_quietly(conn)
+
+    def getconn(self):
+        """Check out a connection, waiting up to `timeout` seconds for a free slot"""
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        wait_started = None
+
+        while True:
+            candidate = None
+            open_new = False
+            with self._cond:
+                if self._closed:
+                    raise psycopg2.InterfaceError("connection pool is closed")
+
+                now = time.monotonic()
+                self._prune_idle(now)
+
+                if self._idle:
+                    candidate = self._idle.pop()
+                elif self._size < self.max_size:
+                    self._size += 1
+                    open_new = True
+                else:
+                    if not waited:
+                        waited = True
+                        wait_started = now
+                        self._waits += 1
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        self._wait_time += now - wait_started
+                        raise PoolTimeout(
+                            f"No database connection available within {self.timeout}s "
+                            f"(max_size={self.max_size})"
+                        )
+                    self._cond.wait(remaining)
+                    continue
+
+            if open_new:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                return self._mark_checked_out(conn, waited, wait_started)
+
+            # Validate the idle connection outside the lock, the ping may be slow
+            conn, last_used = candidate
+            now = time.monotonic()
+            if self._is_expired(conn, now) or not self._is_healthy(conn, last_used, now):
+                with self._cond:
+                    self._size -= 1
+                    if self._is_expired(conn, now):
+                        self._connections_recycled += 1
+                    else:
+                        self._connections_discarded += 1
+                    self._close_quietly(conn)
+                    self._cond.notify()
+                continue
+            return self._mark_checked_out(conn, waited, wait_started)
+
+    def _mark_checked_out(self, conn, waited: bool, wait_started: float):
+        with self._cond:
+            self._checked_out += 1
+            self._checkouts += 1
+            if waited:
+                self._wait_time += time.monotonic() - wait_started
+        return conn
+
+    def putconn(self, conn, discard: bool = False):
+        """Return a connection to the pool; broken or discarded connections are closed"""
+        if not discard and not conn.closed:
+            try:
+                # Never hand out a connection in the middle of a transaction
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                discard = True
+        else:
+            discard = True
+
+        with self._cond:
+            self._checked_out -= 1
+            now = time.monotonic()
+            if discard or self._closed or self._is_expired(conn, now):
+                self._size -= 1
+                if discard:
+                    self._connections_discarded += 1
+                else:
+                    self._connections_recycled += 1
+                self._close_quietly(conn)
+            else:
+                self._idle.append((conn, now))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context manager yielding a pooled connection; rolls back on error"""
+        conn = self.getconn()
+        discard = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # The connection itself is likely broken, don't put it back
+            discard = True
+            raise
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+            raise
+        finally:
+            self.putconn(conn, discard=discard)
+
+    def closeall(self):
+        """Close idle connections and refuse new checkouts"""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.popleft()
+                self._size -= 1
+                self._close_quietly(conn)
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "checked_out": self._checked_out,
+                "max_size": self.max_size,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "wait_time_seconds": round(self._wait_time, 6),
+                "timeouts": self._timeouts,
+                "connections_created": self._connections_created,
+                "connections_recycled": self._connections_recycled,
+                "connections_discarded": self._connections_discarded,
+            }
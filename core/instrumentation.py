@@ -0,0 +1,123 @@
+"""
+Per-node latency and outcome instrumentation for the agent graph.
+
+Every node registered in create_workflow() is wrapped by instrument_node(),
+which records wall time, outcome, LLM token usage and re-entries (retries)
+into the metrics registry and appends an entry to state["trace"] for the
+current request.
+"""
+import time
+
+from core.metrics import REGISTRY
+from core.state import AgentState
+
+NODE_DURATION = REGISTRY.histogram(
+    "medical_chat_node_duration_seconds", "Wall time of each agent graph node", ("node", "outcome")
+)
+NODE_RUNS = REGISTRY.counter(
+    "medical_chat_node_runs_total", "Agent graph node executions", ("node", "outcome")
+)
+NODE_RETRIES = REGISTRY.counter(
+    "medical_chat_node_retries_total", "Node executions beyond the first within one request", ("node",)
+)
+LLM_TOKENS = REGISTRY.counter(
+    "medical_chat_llm_tokens_total", "LLM tokens used per node", ("node", "type")
+)
+REQUEST_DURATION = REGISTRY.histogram(
+    "medical_chat_request_duration_seconds", "Wall time of a chat turn by path through the graph", ("path",)
+)
+
+# Flag telling whether a node found what it was looking for
+SUCCESS_FLAGS = {
+    "llm_agent": ("llm_success",),
+    "retriever": ("rag_success",),
+    "wikipedia": ("wiki_success",),
+    "tavily": ("tavily_success",),
+    "sources": ("rag_success", "wiki_success", "tavily_success"),
+}
+
+
+def record_token_usage(state: AgentState, response):
+    """Add the usage metadata of an LLM response to state["token_usage"]"""
+    usage = getattr(response, 'usage_metadata', None) or {}
+    totals = state.get("token_usage")
+    if totals is None:
+        totals = state["token_usage"] = {}
+    for key in ("input_tokens", "output_tokens"):
+        if usage.get(key):
+            totals[key] = totals.get(key, 0) + usage[key]
+
+
+def _outcome(name: str, state: AgentState) -> str:
+    if name == "executor":
+        return "fallback" if state.get("source") == "System Message" else "success"
+    flags = SUCCESS_FLAGS.get(name)
+    if not flags:
+        return "success"
+    return "success" if any(state.get(flag) for flag in flags) else "failure"
+
+
+def _start(state: AgentState):
+    return time.perf_counter(), dict(state.get("token_usage") or {})
+
+
+def _finish(name: str, state: AgentState, started: float, tokens_before: dict, outcome: str = None):
+    elapsed = time.perf_counter() - started
+    outcome = outcome or _outcome(name, state)
+
+    tokens = {}
+    for key, value in (state.get("token_usage") or {}).items():
+        used = value - tokens_before.get(key, 0)
+        if used:
+            tokens[key] = used
+            LLM_TOKENS.inc(used, node=name, type=key.replace("_tokens", ""))
+
+    trace = state.get("trace")
+    if trace is None:
+        trace = state["trace"] = []
+    if any(entry["node"] == name for entry in trace):
+        NODE_RETRIES.inc(node=name)
+
+    entry = {"node": name, "ms": round(elapsed * 1000, 2), "outcome": outcome}
+    if tokens:
+        entry["tokens"] = tokens
+    trace.append(entry)
+
+    NODE_DURATION.observe(elapsed, node=name, outcome=outcome)
+    NODE_RUNS.inc(node=name, outcome=outcome)
+
+
+def instrument_node(name: str, func, afunc=None):
+    """Wrap a node's sync (and optional async) implementation with timing and outcome recording"""
+    from langchain_core.runnables import RunnableLambda
+
+    def wrapped(state: AgentState) -> AgentState:
+        started, tokens_before = _start(state)
+        try:
+            result = func(state)
+        except Exception:
+            _finish(name, state, started, tokens_before, outcome="error")
+            raise
+        _finish(name, result, started, tokens_before)
+        return result
+
+    async def awrapped(state: AgentState) -> AgentState:
+        started, tokens_before = _start(state)
+        try:
+            result = await afunc(state)
+        except Exception:
+            _finish(name, state, started, tokens_before, outcome="error")
+            raise
+        _finish(name, result, started, tokens_before)
+        return result
+
+    return RunnableLambda(wrapped, afunc=awrapped if afunc else None, name=name)
+
+
+def request_path(state: AgentState) -> str:
+    """Nodes visited by a request, e.g. 'memory>planner>retriever>executor'"""
+    return ">".join(entry["node"] for entry in state.get("trace") or []) or "none"
+
+
+def observe_request(state: AgentState, seconds: float, path: str = None):
+    REQUEST_DURATION.observe(seconds, path=path or request_path(state))
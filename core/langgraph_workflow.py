@@ -2,17 +2,24 @@ from langgraph.graph import StateGraph, END
 from core.state import AgentState
 from agents.memory_agent import MemoryAgent
 from agents.planner_agent import PlannerAgent
-from agents.llm_agent import LLMAgent
-from agents.retriever_agent import RetrieverAgent
-from agents.wikipedia_agent import WikipediaAgent
-from agents.tavily_agent import TavilyAgent
-from agents.executor_agent import ExecutorAgent
+from agents.llm_agent import LLMAgent, LLMAgentAsync
+from agents.retriever_agent import RetrieverAgent, RetrieverAgentAsync
+from agents.wikipedia_agent import WikipediaAgent, WikipediaAgentAsync
+from agents.tavily_agent import TavilyAgent, TavilyAgentAsync
+from agents.executor_agent import ExecutorAgent, ExecutorAgentAsync
 from agents.explanation_agent import ExplanationAgent
+from agents.source_fanout_agent import SourceFanoutAgent, SourceFanoutAgentAsync
+from core.config import env_str
+from core.instrumentation import instrument_node
+from core.resilience import deadline_passed
 
 
 def route_after_planner(state: AgentState):
     if state["current_tool"] == "retriever":
         return "retriever"
+    # Greetings and off-topic questions get a fixed answer from the executor
+    elif state["current_tool"] in ("direct", "out_of_scope"):
+        return "executor"
     else:
         return "llm_agent"
 
@@ -20,8 +27,8 @@ def route_after_planner(state: AgentState):
 def route_after_llm(state: AgentState):
     if state.get("llm_success", False):
         return "executor"
-    # Chỉ đi tới retriever nếu chưa thử RAG
-    elif not state.get("rag_attempted", False):
+    # Chỉ đi tới retriever nếu chưa thử RAG và request còn thời gian
+    elif not state.get("rag_attempted", False) and not deadline_passed(state):
         return "retriever"
     else:
         return "executor"  # Fallback to executor
@@ -30,22 +37,22 @@ def route_after_llm(state: AgentState):
 def route_after_rag(state: AgentState):
     if state.get("rag_success", False):
         return "executor"
-    # Chỉ thử LLM nếu chưa thử
-    elif not state.get("llm_attempted", False):
+    # Chỉ thử LLM nếu chưa thử và request còn thời gian
+    elif not state.get("llm_attempted", False) and not deadline_passed(state):
         return "llm_agent"
     else:
         return "executor"  # Fallback to executor
 
 
 def route_after_llm_fallback(state: AgentState):
-    if state.get("llm_success", False):
+    if state.get("llm_success", False) or deadline_passed(state):
         return "executor"
     else:
         return "wikipedia"
 
 
 def route_after_wiki(state: AgentState):
-    if state.get("wiki_success", False):
+    if state.get("wiki_success", False) or deadline_passed(state):
         return "executor"
     else:
         return "tavily"
@@ -55,18 +62,85 @@ def route_after_tavily(state: AgentState):
     return "executor"
 
 
-def create_workflow():
+def route_after_sources(state: AgentState):
+    if state.get("rag_success") or state.get("wiki_success") or state.get("tavily_success"):
+        return "executor"
+    # Chỉ thử LLM nếu chưa thử và request còn thời gian
+    elif not state.get("llm_attempted", False) and not deadline_passed(state):
+        return "llm_agent"
+    else:
+        return "executor"
+
+
+def create_parallel_workflow():
+    """
+    Graph where the vector DB, Wikipedia and Tavily are queried concurrently by
+    one fan-out node instead of one after another.
+    """
+    workflow = StateGraph(AgentState)
+
+    workflow.add_node("memory", instrument_node("memory", MemoryAgent))
+    workflow.add_node("planner", instrument_node("planner", PlannerAgent))
+    workflow.add_node("llm_agent", instrument_node("llm_agent", LLMAgent, LLMAgentAsync))
+    workflow.add_node("sources", instrument_node("sources", SourceFanoutAgent, SourceFanoutAgentAsync))
+    workflow.add_node("executor", instrument_node("executor", ExecutorAgent, ExecutorAgentAsync))
+
+    workflow.set_entry_point("memory")
+    workflow.add_edge("memory", "planner")
+
+    # The "retriever" route now means all knowledge sources at once
+    workflow.add_conditional_edges(
+        "planner",
+        route_after_planner,
+        {
+            "retriever": "sources",
+            "llm_agent": "llm_agent",
+            "executor": "executor"
+        }
+    )
+
+    workflow.add_conditional_edges(
+        "llm_agent",
+        route_after_llm,
+        {
+            "executor": "executor",
+            "retriever": "sources"
+        }
+    )
+
+    workflow.add_conditional_edges(
+        "sources",
+        route_after_sources,
+        {
+            "executor": "executor",
+            "llm_agent": "llm_agent"
+        }
+    )
+
+    workflow.add_edge("executor", END)
+
+    return workflow.compile()
+
+
+def create_workflow(mode: str = None):
+    """Build the agent graph; WORKFLOW_MODE=parallel selects create_parallel_workflow()"""
+    mode = (mode or env_str("WORKFLOW_MODE", "sequential")).lower()
+    if mode == "parallel":
+        return create_parallel_workflow()
+    if mode != "sequential":
+        raise ValueError(f"Unknown WORKFLOW_MODE: {mode}")
+
     workflow = StateGraph(AgentState)
 
     # Add nodes
-    workflow.add_node("memory", MemoryAgent)
-    workflow.add_node("planner", PlannerAgent)
-    workflow.add_node("llm_agent", LLMAgent)
-    workflow.add_node("retriever", RetrieverAgent)
-    workflow.add_node("wikipedia", WikipediaAgent)
-    workflow.add_node("tavily", TavilyAgent)
-    workflow.add_node("executor", ExecutorAgent)
-    workflow.add_node("explanation", ExplanationAgent)
+    workflow.add_node("memory", instrument_node("memory", MemoryAgent))
+    workflow.add_node("planner", instrument_node("planner", PlannerAgent))
+    workflow.add_node("llm_agent", instrument_node("llm_agent", LLMAgent, LLMAgentAsync))
+    workflow.add_node("retriever", instrument_node("retriever", RetrieverAgent, RetrieverAgentAsync))
+    workflow.add_node("wikipedia", instrument_node("wikipedia", WikipediaAgent, WikipediaAgentAsync))
+    workflow.add_node("tavily", instrument_node("tavily", TavilyAgent, TavilyAgentAsync))
+    workflow.add_node("executor", instrument_node("executor", ExecutorAgent, ExecutorAgentAsync))
+    workflow.add_node("explanation", instrument_node("explanation", ExplanationAgent))
 
     # Set an entry point
     workflow.set_entry_point("memory")
@@ -80,7 +154,8 @@ def create_workflow():
         route_after_planner,
         {
             "retriever": "retriever",
-            "llm_agent": "llm_agent"
+            "llm_agent": "llm_agent",
+            "executor": "executor"
         }
     )
 
@@ -0,0 +1,212 @@
+"""
+Exact-match cache of Gemini responses, shared by worker processes.
+
+Gemini runs with temperature=0, so the same prompt (system prompt, history,
+question and retrieved content) gives the same answer; the cache returns it
+without paying for or waiting on a second call. It plugs into LangChain's
+model-level cache (ChatGoogleGenerativeAI(cache=...)), so invoke, ainvoke
+and the streaming paths all go through it.
+
+Entries are keyed by a SHA-256 of the model settings (model name,
+temperature, ...) and the full prompt, and stored in an SQLite file in WAL
+mode that every worker opens. Entries expire after LLM_CACHE_TTL seconds;
+beyond LLM_CACHE_MAX_ENTRIES the least recently used are evicted. Cached
+responses carry no token usage, since they cost none. Blank answers are not
+stored, and a failed store never fails the call that produced the answer.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Sequence
+
+from langchain_core.caches import BaseCache
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, Generation
+
+from core.config import env_bool, env_float, env_int, env_str
+from core.metrics import REGISTRY
+
+LLM_CACHE_LOOKUPS = REGISTRY.counter(
+    "medical_chat_llm_cache_lookups_total", "LLM response cache lookups by outcome (hit, miss)", ("outcome",)
+)
+
+# Global instance
+_llm_cache = None
+
+
+def _content(generation: Generation):
+    message = getattr(generation, 'message', None)
+    return message.content if message is not None else generation.text
+
+
+def _is_blank(generation: Generation) -> bool:
+    content = _content(generation)
+    if not isinstance(content, str):
+        # Gemini may return a list of content parts
+        content = "".join(part.get('text', '') if isinstance(part, dict) else str(part) for part in content)
+    return not content.strip()
+
+
+def _serialize(generations: Sequence[Generation]) -> str:
+    items = []
+    for generation in generations:
+        message = getattr(generation, 'message', None)
+        items.append({
+            "content": _content(generation),
+            "response_metadata": getattr(message, 'response_metadata', None) or {},
+            "generation_info": generation.generation_info,
+        })
+    # Metadata values JSON can't encode (enums, protobuf objects) are kept as strings
+    return json.dumps(items, ensure_ascii=False, default=str)
+
+
+def _deserialize(value: str) -> list:
+    return [
+        ChatGeneration(
+            message=AIMessage(content=item["content"], response_metadata=item["response_metadata"]),
+            generation_info=item["generation_info"]
+        )
+        for item in json.loads(value)
+    ]
+
+
+class LLMResponseCache(BaseCache):
+    def __init__(self, path: str, max_entries: int = 5000, ttl: float = 86400.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "created_at REAL NOT NULL, used_at REAL NOT NULL, latency REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at)")
+        self._db.commit()
+
+        # Start time of each missed lookup, to know what a later hit on it saves
+        self._pending = {}
+        self._hits = 0
+        self._misses = 0
+        self._stores = 0
+        self._evictions = 0
+        self._saved_seconds = 0.0
+
+    @classmethod
+    def from_env(cls) -> 'LLMResponseCache':
+        return cls(
+            env_str("LLM_CACHE_PATH", "./cache/llm_cache.db"),
+            max_entries=env_int("LLM_CACHE_MAX_ENTRIES", 5000),
+            ttl=env_float("LLM_CACHE_TTL", 86400.0)
+        )
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\0{prompt}".encode('utf-8')).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[list]:
+        key = self._key(prompt, llm_string)
+        now = time.time()
+        try:
+            with self._lock:
+                row = self._db.execute("SELECT value, created_at, latency FROM responses WHERE key = ?",
+                                       (key,)).fetchone()
+                if row is not None and self.ttl > 0 and now - row[1] > self.ttl:
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+                    row = None
+                if row is None:
+                    self._misses += 1
+                    self._pending[key] = time.perf_counter()
+                    if len(self._pending) > 1024:
+                        # Misses whose call failed are never stored
+                        self._pending.pop(next(iter(self._pending)))
+                else:
+                    self._db.execute("UPDATE responses SET used_at = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                    self._hits += 1
+                    self._saved_seconds += row[2]
+        except sqlite3.Error as e:
+            print(f"LLMCache: lookup failed - {e}")
+            return None
+
+        LLM_CACHE_LOOKUPS.inc(outcome="miss" if row is None else "hit")
+        return None if row is None else _deserialize(row[0])
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        key = self._key(prompt, llm_string)
+        now = time.time()
+        if all(_is_blank(generation) for generation in return_val):
+            # A blank answer would otherwise be replayed for the whole TTL
+            with self._lock:
+                self._pending.pop(key, None)
+            return
+        try:
+            value = _serialize(return_val)
+            with self._lock:
+                started = self._pending.pop(key, None)
+                latency = time.perf_counter() - started if started is not None else 0.0
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created_at, used_at, latency) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, value, now, now, latency)
+                )
+                self._stores += 1
+                self._evict(now)
+                self._db.commit()
+        except Exception as e:
+            # Gemini has answered already; a failed store only means a later miss
+            print(f"LLMCache: store failed - {e}")
+
+    def _evict(self, now: float):
+        """Drop expired entries and the least recently used beyond max_entries (lock held)"""
+        evicted = 0
+        if self.ttl > 0:
+            evicted += self._db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,)).rowcount
+        count = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if self.max_entries > 0 and count > self.max_entries:
+            evicted += self._db.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY used_at LIMIT ?)", (count - self.max_entries,)
+            ).rowcount
+        self._evictions += evicted
+
+    def clear(self, **kwargs) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+            self._pending.clear()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            lookups = self._hits + self._misses
+            return {
+                "entries": entries,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "stores": self._stores,
+                "evictions": self._evictions,
+                "time_saved_seconds": round(self._saved_seconds, 3),
+            }
+
+
+def get_llm_response_cache():
+    """The shared LLMResponseCache, or None when LLM_CACHE_ENABLED is off"""
+    global _llm_cache
+    if _llm_cache is None and env_bool("LLM_CACHE_ENABLED", True):
+        _llm_cache = LLMResponseCache.from_env()
+    return _llm_cache
@@ -0,0 +1,210 @@
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from core.config import env_float, env_int
+
+_STOP = object()
+
+
+class MessageWriter:
+    """
+    Write-behind persistence for chat messages.
+
+    Messages are put on a bounded queue and a single background thread writes
+    them to the database in batches with SupabaseDB.save_messages. One worker
+    draining a FIFO queue keeps messages of each conversation in order, and a
+    failed batch is retried before anything queued after it is written.
+
+    When the queue is full, enqueue() blocks for up to `enqueue_timeout`
+    seconds (backpressure) and then drops the message.
+    """
+
+    def __init__(self, db, max_queue_size: int = 1000, batch_size: int = 50,
+                 flush_interval: float = 0.5, enqueue_timeout: float = 2.0,
+                 max_retries: int = 3, retry_backoff: float = 0.5):
+        self.db = db
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Condition()
+        self._pending = {}  # session_id -> {message_id: message}, insertion ordered
+        self._thread = None
+        self._closed = False
+
+        self._queued = 0
+        self._flushed = 0
+        self._dropped = 0
+        self._batches = 0
+        self._failed_batches = 0
+
+    @classmethod
+    def from_env(cls, db):
+        return cls(
+            db,
+            max_queue_size=env_int("MESSAGE_QUEUE_MAX_SIZE", 1000),
+            batch_size=env_int("MESSAGE_BATCH_SIZE", 50),
+            flush_interval=env_float("MESSAGE_FLUSH_INTERVAL", 0.5),
+            enqueue_timeout=env_float("MESSAGE_ENQUEUE_TIMEOUT", 2.0),
+            max_retries=env_int("MESSAGE_MAX_RETRIES", 3)
+        )
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="message-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def enqueue(self, session_id: str, role: str, content: str):
+        """Queue a message for saving. Returns its id, or None if it was dropped."""
+        if self._closed:
+            print("MessageWriter: closed, message dropped")
+            with self._lock:
+                self._dropped += 1
+            return None
+
+        message = {
+            'id': str(uuid.uuid4()),
+            'session_id': session_id,
+            'role': role,
+            'content': content,
+            # Captured at enqueue time so batched rows keep their real order
+            'created_at': datetime.utcnow()
+        }
+
+        with self._lock:
+            self._pending.setdefault(session_id, {})[message['id']] = message
+
+        try:
+            self._queue.put(message, timeout=self.enqueue_timeout)
+        except queue.Full:
+            print(f"MessageWriter: queue full, message for {session_id} dropped")
+            with self._lock:
+                self._forget(message)
+                self._dropped += 1
+            return None
+
+        with self._lock:
+            self._queued += 1
+        return message['id']
+
+    def pending_messages(self, session_id: str) -> list:
+        """Messages of a session that are queued but not yet written, in history format"""
+        with self._lock:
+            messages = list(self._pending.get(session_id, {}).values())
+        return [{
+            'id': m['id'],
+            'role': 'user' if m['role'] == 'user' else 'assistant',
+            'content': m['content'],
+            'timestamp': m['created_at'].isoformat()
+        } for m in messages]
+
+    def _forget(self, message):
+        """Remove a message from the pending index (lock held)"""
+        session_messages = self._pending.get(message['session_id'])
+        if session_messages is not None:
+            session_messages.pop(message['id'], None)
+            if not session_messages:
+                del self._pending[message['session_id']]
+
+    def _next_batch(self):
+        """Block for the first message, then collect more until the batch is full or the interval ends"""
+        first = self._queue.get()
+        if first is _STOP:
+            return [], True
+
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _write(self, batch):
+        for attempt in range(self.max_retries + 1):
+            if self.db.save_messages(batch):
+                with self._lock:
+                    self._batches += 1
+                    self._flushed += len(batch)
+                    for message in batch:
+                        self._forget(message)
+                    self._lock.notify_all()
+                return
+
+            with self._lock:
+                self._failed_batches += 1
+            if attempt < self.max_retries:
+                time.sleep(self.retry_backoff * (2 ** attempt))
+
+        print(f"MessageWriter: giving up on a batch of {len(batch)} messages")
+        with self._lock:
+            self._dropped += len(batch)
+            for message in batch:
+                self._forget(message)
+            self._lock.notify_all()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self._next_batch()
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    print(f"MessageWriter: unexpected error writing batch - {e}")
+                    with self._lock:
+                        self._dropped += len(batch)
+                        for message in batch:
+                            self._forget(message)
+                        self._lock.notify_all()
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Wait until every queued message has been written or dropped"""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while self._pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._lock.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 10.0):
+        """Stop accepting messages and flush what is queued before returning"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            print("MessageWriter: queue still full at shutdown")
+        self._thread.join(timeout)
+        with self._lock:
+            unsaved = sum(len(messages) for messages in self._pending.values())
+        if unsaved:
+            print(f"MessageWriter: {unsaved} messages were not saved at shutdown")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queued": self._queued,
+                "flushed": self._flushed,
+                "dropped": self._dropped,
+                "batches": self._batches,
+                "failed_batches": self._failed_batches,
+                "queue_depth": self._queue.qsize(),
+            }
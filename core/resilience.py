@@ -0,0 +1,252 @@
+"""
+Request deadlines and circuit breakers for the external dependencies.
+
+Every request gets a deadline (REQUEST_DEADLINE seconds from its start,
+state["deadline"]). A call to Gemini, Wikipedia or Tavily goes through
+guarded_call() / aguarded_call(), which gives it the smaller of its own
+timeout and the time the request has left, and is skipped once the
+deadline has passed. Timed-out sync calls keep running in their worker
+thread, but the request no longer waits for them.
+
+Each dependency (gemini, wikipedia, tavily, postgres) has a circuit breaker:
+after BREAKER_FAILURE_THRESHOLD consecutive failures or timeouts (errors of
+the dependency or its transport, not of the calling code) it opens
+and calls fail immediately with CircuitOpenError for BREAKER_RESET_TIMEOUT
+seconds. Then one trial call is let through; its success closes the
+breaker, its failure opens it again.
+"""
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Optional
+
+from core.config import env_float, env_int
+from core.metrics import REGISTRY
+
+BREAKER_TRIPS = REGISTRY.counter(
+    "medical_chat_breaker_trips_total", "Circuit breakers opened by dependency", ("dependency",)
+)
+BREAKER_REJECTIONS = REGISTRY.counter(
+    "medical_chat_breaker_rejections_total", "Calls failed fast by an open circuit breaker", ("dependency",)
+)
+DEPENDENCY_TIMEOUTS = REGISTRY.counter(
+    "medical_chat_dependency_timeouts_total",
+    "External calls cut off (timeout) or not started (deadline) for lack of time", ("dependency", "kind")
+)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+# Exceptions from these packages come from the dependency or its transport
+DEPENDENCY_ERROR_MODULES = {
+    "google", "grpc", "langchain_google_genai", "requests", "urllib3", "httpx", "httpcore", "aiohttp",
+    "wikipedia", "tavily", "psycopg2", "psycopg_pool",
+}
+
+# Sync calls run here so the request can stop waiting at its deadline
+_executor = ThreadPoolExecutor(max_workers=env_int("EXTERNAL_CALL_THREADS", 32), thread_name_prefix="external")
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit breaker is open"""
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a call did not finish, or could not start, before its deadline"""
+
+
+def is_dependency_error(error: BaseException) -> bool:
+    """
+    True for timeouts, connection errors and errors raised by a dependency's
+    client library, False for errors of the calling code (ValueError, KeyError, ...)
+    """
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return type(error).__module__.split(".")[0] in DEPENDENCY_ERROR_MODULES
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._trips = 0
+        self._rejections = 0
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go through now"""
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = HALF_OPEN
+                self._trial_running = False
+            if self._state == CLOSED:
+                return
+            if self._state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return
+            self._rejections += 1
+        BREAKER_REJECTIONS.inc(dependency=self.name)
+        raise CircuitOpenError(f"{self.name} circuit breaker is open")
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            tripped = self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold)
+            if tripped:
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._trial_running = False
+                self._trips += 1
+        if tripped:
+            print(f"Breaker: {self.name} opened after {self._failures} consecutive failures")
+            BREAKER_TRIPS.inc(dependency=self.name)
+
+    def release(self):
+        """Let another trial through after one that ended without an outcome"""
+        with self._lock:
+            self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def stats(self) -> dict:
+        state = self.state
+        with self._lock:
+            return {
+                "open": int(state == OPEN),
+                "consecutive_failures": self._failures,
+                "trips": self._trips,
+                "rejections": self._rejections,
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(dependency: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(dependency)
+        if breaker is None:
+            breaker = _breakers[dependency] = CircuitBreaker(
+                dependency,
+                failure_threshold=env_int("BREAKER_FAILURE_THRESHOLD", 5),
+                reset_timeout=env_float("BREAKER_RESET_TIMEOUT", 30.0)
+            )
+        return breaker
+
+
+def breaker_stats() -> dict:
+    """Stats of every breaker created so far, as <dependency>_<key>"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {f"{breaker.name}_{key}": value for breaker in breakers for key, value in breaker.stats().items()}
+
+
+def start_deadline(state: dict, seconds: float = None) -> dict:
+    """Give the request in `state` its deadline (REQUEST_DEADLINE, 0 for none)"""
+    seconds = env_float("REQUEST_DEADLINE", 30.0) if seconds is None else seconds
+    state["deadline"] = time.monotonic() + seconds if seconds > 0 else None
+    return state
+
+
+def time_left(state: dict) -> Optional[float]:
+    """Seconds until the request's deadline, None when it has none"""
+    deadline = state.get("deadline") if state else None
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def deadline_passed(state: dict) -> bool:
+    remaining = time_left(state)
+    return remaining is not None and remaining <= 0
+
+
+def _call_budget(dependency: str, state: dict, timeout: float = None) -> Optional[float]:
+    remaining = time_left(state)
+    if remaining is not None and remaining <= 0:
+        DEPENDENCY_TIMEOUTS.inc(dependency=dependency, kind="deadline")
+        raise DeadlineExceeded(f"No time left in the request for {dependency}")
+    budgets = [budget for budget in (remaining, timeout) if budget is not None and budget > 0]
+    return min(budgets) if budgets else None
+
+
+def _timed_out(breaker: CircuitBreaker, dependency: str, budget: Optional[float]) -> DeadlineExceeded:
+    breaker.record_failure()
+    DEPENDENCY_TIMEOUTS.inc(dependency=dependency, kind="timeout")
+    within = f" within {budget:.1f}s" if budget is not None else ""
+    return DeadlineExceeded(f"{dependency} did not answer{within}")
+
+
+def _failed(breaker: CircuitBreaker, error: BaseException):
+    """Count the error against the breaker only when it says the dependency is failing"""
+    if is_dependency_error(error):
+        breaker.record_failure()
+    else:
+        breaker.release()
+
+
+def guarded_call(dependency: str, func, *args, state: dict = None, timeout: float = None, **kwargs):
+    """
+    func(*args, **kwargs) under the dependency's circuit breaker, given at most
+    `timeout` seconds and the time left before state["deadline"]
+    """
+    budget = _call_budget(dependency, state, timeout)
+    breaker = get_breaker(dependency)
+    breaker.before_call()
+    future = None
+    if budget is not None:
+        # The copied context keeps LangChain callbacks (token streaming) working in the thread
+        future = _executor.submit(contextvars.copy_context().run, func, *args, **kwargs)
+        done, _ = wait([future], timeout=budget)
+        if not done:
+            raise _timed_out(breaker, dependency, budget)
+    try:
+        result = future.result() if future is not None else func(*args, **kwargs)
+    except BaseException as e:
+        _failed(breaker, e)
+        raise
+    breaker.record_success()
+    return result
+
+
+async def aguarded_call(dependency: str, coroutine_func, *args, state: dict = None, timeout: float = None,
+                        **kwargs):
+    """Async guarded_call: the awaited call is cancelled when it runs out of time"""
+    budget = _call_budget(dependency, state, timeout)
+    breaker = get_breaker(dependency)
+    breaker.before_call()
+    task = asyncio.ensure_future(coroutine_func(*args, **kwargs))
+    try:
+        done, _ = await asyncio.wait({task}, timeout=budget)
+    except asyncio.CancelledError:
+        # The request gave up on the call (e.g. the fan-out had enough sources), which says nothing of the dependency
+        task.cancel()
+        breaker.release()
+        raise
+    if not done:
+        task.cancel()
+        raise _timed_out(breaker, dependency, budget)
+    try:
+        result = task.result()
+    except BaseException as e:
+        _failed(breaker, e)
+        raise
+    breaker.record_success()
+    return result
@@ -1,3 +1,4 @@
+import json
 from enum import Enum
 from typing import Any, Optional
 from flask import jsonify
@@ -17,6 +18,30 @@ class ResponseCode(str, Enum):
     BAD_REQUEST = '10010'
 
 
+def build_response_body(
+    success: bool,
+    message: str,
+    code: ResponseCode,
+    data: Optional[Any] = None
+) -> dict:
+    """Body chuẩn của response (success, message, code, data)"""
+    response_body = {
+        'success': success,
+        'message': message,
+        'code': code.value
+    }
+
+    if data is not None:
+        response_body['data'] = data
+
+    return response_body
+
+
+def sse_event(event: str, data: Any) -> str:
+    """Đóng gói một sự kiện Server-Sent Events với data dạng JSON"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
 def create_response(
     success: bool,
     message: str,
@@ -37,15 +62,7 @@ def create_response(
     Returns:
         Flask response object
     """
-    response_body = {
-        'success': success,
-        'message': message,
-        'code': code.value
-    }
-    
-    if data is not None:
-        response_body['data'] = data
-    
+    response_body = build_response_body(success, message, code, data)
     return jsonify(response_body), http_status
 
 
@@ -114,3 +131,13 @@ def bad_request(message: str = "Yêu cầu không hợp lệ", data: Optional[An
         http_status=400,
         data=data
     )
+
+
+def service_unavailable(message: str = "Hệ thống đang khởi động", data: Optional[Any] = None):
+    """Response khi hệ thống chưa sẵn sàng"""
+    return error_response(
+        message=message,
+        code=ResponseCode.RETRY,
+        http_status=503,
+        data=data
+    )
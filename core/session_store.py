@@ -0,0 +1,230 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+from core.config import env_float, env_int, env_str
+from core.state import AgentState, initialize_conversation_state
+
+# Same window MemoryAgent keeps for the workflow
+MAX_HISTORY_MESSAGES = 20
+
+
+def estimate_size(obj, _seen=None) -> int:
+    """Rough resident size in bytes of a state value (dicts, lists, strings, Documents)"""
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_size(k, _seen) + estimate_size(v, _seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(estimate_size(item, _seen) for item in obj)
+    elif hasattr(obj, 'page_content'):
+        size += estimate_size(obj.page_content, _seen)
+        size += estimate_size(getattr(obj, 'metadata', {}), _seen)
+    return size
+
+
+class SessionStore:
+    """
+    Interface for per-conversation AgentState storage.
+
+    get() always returns a state: on a miss a fresh one is created and its
+    conversation history is rehydrated with `loader(session_id)` when a
+    loader is configured.
+
+    put() takes the id of the last message the state includes (`version`).
+    With a `validator` (session_id -> id of the session's newest message), a
+    cached state whose version no longer matches was left behind by a turn
+    served elsewhere (another worker), and is rehydrated like a miss.
+    """
+
+    def get(self, session_id: str) -> AgentState:
+        raise NotImplementedError
+
+    def put(self, session_id: str, state: AgentState, version: Optional[str] = None):
+        raise NotImplementedError
+
+    def delete(self, session_id: str):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        raise NotImplementedError
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    Process-local session store with LRU + TTL eviction and a memory budget.
+
+    - At most `max_sessions` states are kept; the least recently used go first.
+    - States not accessed for `ttl` seconds are evicted.
+    - The estimated size of all states is kept under `max_bytes`.
+    - With a validator, a hit is checked against the DB's newest message, so
+      several workers can serve the same conversation (one small query per turn).
+    Per-turn data (retrieved documents, trace) is dropped when a state is stored,
+    since reset_query_state clears it before the next turn anyway.
+    """
+
+    def __init__(self, max_sessions: int = 1000, ttl: float = 3600.0,
+                 max_bytes: int = 64 * 1024 * 1024,
+                 loader: Optional[Callable[[str], List[dict]]] = None,
+                 validator: Optional[Callable[[str], Optional[str]]] = None):
+        self.max_sessions = max(1, max_sessions)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.loader = loader
+        self.validator = validator
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # session_id -> (state, size, last_access, version)
+        self._resident_bytes = 0
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._rehydrations = 0
+        self._stale = 0
+
+    def _remove(self, session_id: str):
+        _, size, _, _ = self._entries.pop(session_id)
+        self._resident_bytes -= size
+
+    def _expire(self, now: float):
+        """Drop expired entries; LRU order means they sit at the front (lock held)"""
+        if self.ttl <= 0:
+            return
+        while self._entries:
+            session_id, (_, _, last_access, _) = next(iter(self._entries.items()))
+            if now - last_access <= self.ttl:
+                break
+            self._remove(session_id)
+            self._expirations += 1
+
+    def _enforce_limits(self, keep: str):
+        """Evict least recently used entries until within limits, never evicting `keep` (lock held)"""
+        while self._entries and (len(self._entries) > self.max_sessions or
+                                 (self.max_bytes > 0 and self._resident_bytes > self.max_bytes)):
+            session_id = next(iter(self._entries))
+            if session_id == keep:
+                if len(self._entries) == 1:
+                    break
+                self._entries.move_to_end(keep)
+                continue
+            self._remove(session_id)
+            self._evictions += 1
+
+    @staticmethod
+    def _compact(state: AgentState) -> AgentState:
+        state["documents"] = []
+        state["trace"] = []
+        history = state.get("conversation_history") or []
+        if len(history) > MAX_HISTORY_MESSAGES:
+            state["conversation_history"] = history[-MAX_HISTORY_MESSAGES:]
+        return state
+
+    def get(self, session_id: str) -> AgentState:
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                state, size, _, version = entry
+                self._entries[session_id] = (state, size, now, version)
+                self._entries.move_to_end(session_id)
+
+        if entry is not None and self._is_current(session_id, version):
+            with self._lock:
+                self._hits += 1
+            return state
+        with self._lock:
+            self._misses += 1
+
+        # Miss: rebuild the state outside the lock, the loader may hit the DB
+        state = initialize_conversation_state()
+        version = None
+        if self.loader:
+            try:
+                history = self.loader(session_id) or []
+                state["conversation_history"] = history
+                version = history[-1].get('id') if history else None
+                with self._lock:
+                    self._rehydrations += 1
+            except Exception as e:
+                print(f"SessionStore: failed to rehydrate {session_id} - {e}")
+        self.put(session_id, state, version)
+        return state
+
+    def _is_current(self, session_id: str, version: Optional[str]) -> bool:
+        """Whether a cached state still includes the session's newest message"""
+        if not self.validator:
+            return True
+        try:
+            latest = self.validator(session_id)
+        except Exception as e:
+            # Without the DB the cached state is the best there is
+            print(f"SessionStore: failed to validate {session_id} - {e}")
+            return True
+        if latest == version:
+            return True
+        with self._lock:
+            self._stale += 1
+        return False
+
+    def put(self, session_id: str, state: AgentState, version: Optional[str] = None):
+        state = self._compact(state)
+        size = estimate_size(state)
+        now = time.monotonic()
+        with self._lock:
+            if session_id in self._entries:
+                self._remove(session_id)
+            self._entries[session_id] = (state, size, now, version)
+            self._resident_bytes += size
+            self._expire(now)
+            self._enforce_limits(keep=session_id)
+
+    def delete(self, session_id: str):
+        with self._lock:
+            if session_id in self._entries:
+                self._remove(session_id)
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._entries
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "backend": "memory",
+                "sessions": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "rehydrations": self._rehydrations,
+                "stale": self._stale,
+                "resident_bytes": self._resident_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+def create_session_store(loader: Optional[Callable[[str], List[dict]]] = None,
+                         validator: Optional[Callable[[str], Optional[str]]] = None) -> SessionStore:
+    """Build the session store selected by SESSION_STORE_BACKEND"""
+    backend = env_str("SESSION_STORE_BACKEND", "memory").lower()
+    if backend == "memory":
+        return InMemorySessionStore(
+            max_sessions=env_int("SESSION_STORE_MAX_SESSIONS", 1000),
+            ttl=env_float("SESSION_STORE_TTL", 3600.0),
+            max_bytes=env_int("SESSION_STORE_MAX_BYTES", 64 * 1024 * 1024),
+            loader=loader,
+            validator=validator
+        )
+    raise ValueError(f"Unknown SESSION_STORE_BACKEND: {backend}")
@@ -0,0 +1,131 @@
+"""
+Single-flight coalescing of identical in-flight questions.
+
+When a question spikes (an outbreak in the news), many sessions send the
+same text at once and each would run retrieval and a Gemini call of its own.
+The answer to the first question of a conversation depends only on its text,
+so concurrent requests with the same normalized question and no conversation
+history share one workflow run: the first request (the leader) runs it, the
+others wait for it and get a copy of its result. An error of the run is
+raised to every request waiting on it.
+
+Requests with conversation history are never coalesced, since their answer
+depends on it, and neither are the streaming endpoints, which relay the
+tokens of their own run. Turn off with SINGLE_FLIGHT_ENABLED=false.
+"""
+import asyncio
+import copy
+import threading
+import unicodedata
+from typing import Optional
+
+from core.config import env_bool
+from core.metrics import REGISTRY
+
+COALESCED_REQUESTS = REGISTRY.counter(
+    "medical_chat_coalesced_requests_total", "Chat requests answered by the in-flight run of an identical question"
+)
+
+# Global instance
+_single_flight = None
+
+
+def coalescing_key(state) -> Optional[str]:
+    """Key shared by identical questions, None when the conversation has history"""
+    if state.get("conversation_history"):
+        return None
+    question = " ".join(unicodedata.normalize("NFC", state.get("question") or "").casefold().split())
+    return question or None
+
+
+def shared_result(result, seconds: float):
+    """A waiting request's copy of the leader's result; it used no tokens of its own"""
+    result = dict(result)
+    result["conversation_history"] = copy.deepcopy(result.get("conversation_history") or [])
+    result["documents"] = list(result.get("documents") or [])
+    result["trace"] = [{"node": "single_flight", "ms": round(seconds * 1000, 2), "outcome": "coalesced"}]
+    result["token_usage"] = {}
+    return result
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> _Call of a sync run
+        self._tasks = {}  # key -> asyncio.Task of an async run
+        self._runs = 0
+        self._coalesced = 0
+
+    def do(self, key: str, func, *args):
+        """func(*args), run once for all concurrent callers with the same key; returns (result, shared)"""
+        with self._lock:
+            call = self._calls.get(key)
+            shared = call is not None
+            if shared:
+                self._coalesced += 1
+            else:
+                call = self._calls[key] = _Call()
+                self._runs += 1
+
+        if shared:
+            COALESCED_REQUESTS.inc()
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func(*args)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    async def ado(self, key: str, coroutine_func, *args):
+        """Async do(): callers on the event loop share one task"""
+        with self._lock:
+            task = self._tasks.get(key)
+            shared = task is not None
+            if shared:
+                self._coalesced += 1
+            else:
+                task = self._tasks[key] = asyncio.ensure_future(coroutine_func(*args))
+                task.add_done_callback(lambda _: self._forget(key, task))
+                self._runs += 1
+
+        if shared:
+            COALESCED_REQUESTS.inc()
+        # Shielded so a client that disconnects doesn't cancel the run for the others
+        return await asyncio.shield(task), shared
+
+    def _forget(self, key: str, task):
+        with self._lock:
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": len(self._calls) + len(self._tasks),
+                "runs": self._runs,
+                "coalesced": self._coalesced,
+            }
+
+
+def get_single_flight():
+    """The shared SingleFlight, or None when SINGLE_FLIGHT_ENABLED is off"""
+    global _single_flight
+    if _single_flight is None and env_bool("SINGLE_FLIGHT_ENABLED", True):
+        _single_flight = SingleFlight()
+    return _single_flight
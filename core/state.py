@@ -17,7 +17,12 @@ class AgentState(TypedDict):
     tavily_attempted: bool
     tavily_success: bool
     current_tool: Optional[str]
+    route_confidence: Optional[float]
+    retrieval_filter: Optional[dict]
     retry_count: int
+    deadline: Optional[float]
+    trace: List[dict]
+    token_usage: dict
 
 def initialize_conversation_state():
     return {
@@ -36,7 +41,12 @@ def initialize_conversation_state():
         "tavily_attempted": False,
         "tavily_success": False,
         "current_tool": None,
-        "retry_count": 0
+        "route_confidence": None,
+        "retrieval_filter": None,
+        "retry_count": 0,
+        "deadline": None,
+        "trace": [],
+        "token_usage": {}
     }
 
 def reset_query_state(state: AgentState) -> AgentState:
@@ -56,6 +66,11 @@ def reset_query_state(state: AgentState) -> AgentState:
         "tavily_attempted": False,
         "tavily_success": False,
         "current_tool": None,
-        "retry_count": 0
+        "route_confidence": None,
+        "retrieval_filter": None,
+        "retry_count": 0,
+        "deadline": None,
+        "trace": [],
+        "token_usage": {}
     })
     return state
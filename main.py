@@ -1,14 +1,20 @@
+import threading
+import time
 from dotenv import load_dotenv
-from core.langgraph_workflow import create_workflow
-from core.state import initialize_conversation_state, reset_query_state
-from tools.data_loader import process_data
-from tools.vector_store import get_or_create_vectorstore
+from core.config import env_str
+from core.session_store import create_session_store
+from core.resilience import start_deadline
+from core.state import reset_query_state
 
 load_dotenv()
 
 
 def initialize_system():
     """Initialize the system and create a vector database if needed"""
+    # Imported here so the CLI starts without loading chromadb and the embedding model
+    from tools.ingest import ingest
+    from tools.vector_store import get_or_create_vectorstore
+
     pdf_path = './data/medical_book.pdf'
     json_path = './data/medical-data.json'
     persist_dir = './medical_db/'
@@ -22,10 +28,10 @@ def initialize_system():
 
     if not existing_db:
         print("Processing data sources and creating vector database...")
-        doc_splits = process_data(pdf_path=pdf_path, json_path=json_path)
+        stats = ingest(pdf_paths=[pdf_path], json_paths=[json_path], persist_dir=persist_dir)
 
-        if doc_splits:
-            vectorstore = get_or_create_vectorstore(documents=doc_splits, persist_dir=persist_dir)
+        if stats and stats["units"]:
+            vectorstore = get_or_create_vectorstore(persist_dir=persist_dir)
             if vectorstore:
                 print("Vector database created successfully!")
             else:
@@ -35,16 +41,31 @@ def initialize_system():
             print("System will work with limited functionality (no RAG)")
 
 
-def main():
-    # Initialize system
+def load_workflow(profile: dict):
+    """Initialize the system and build the workflow, recording seconds per step in `profile`"""
+    started = time.perf_counter()
     initialize_system()
+    profile["vectorstore"] = round(time.perf_counter() - started, 3)
 
     # Create workflow
     print("\nCreating workflow...")
-    app = create_workflow()
+    started = time.perf_counter()
+    from core.langgraph_workflow import create_workflow
+    profile["app"] = create_workflow()
+    profile["workflow"] = round(time.perf_counter() - started, 3)
+
 
-    # Initialize conversation state
-    conversation_state = initialize_conversation_state()
+def main():
+    # With STARTUP_MODE=lazy the models load while the user types the first question
+    profile = {}
+    loader = threading.Thread(target=load_workflow, args=(profile,), name="warm-up", daemon=True)
+    loader.start()
+    if env_str("STARTUP_MODE", "eager").lower() != "lazy":
+        loader.join()
+
+    # Conversation state lives in the session store under a single CLI session
+    session_store = create_session_store()
+    session_id = "cli"
 
     print("\n" + "=" * 60)
     print("Medical AI Assistant Ready!")
@@ -60,7 +81,7 @@ def main():
             break
 
         if query.lower() == "clear":
-            conversation_state = initialize_conversation_state()
+            session_store.delete(session_id)
             print("\nConversation cleared. Starting fresh!\n")
             continue
 
@@ -69,14 +90,27 @@ def main():
             continue
 
         # Reset state for a new query but keep conversation history
-        conversation_state = reset_query_state(conversation_state)
+        conversation_state = reset_query_state(session_store.get(session_id))
         conversation_state["question"] = query
+        start_deadline(conversation_state)
+
+        if loader.is_alive():
+            print("\nStill loading models...")
+            loader.join()
+        app = profile.get("app")
+        if app is None:
+            print("\nSystem failed to start, see the errors above.")
+            break
+        if "reported" not in profile:
+            profile["reported"] = True
+            print(f"Startup profile (s): vectorstore {profile['vectorstore']}, workflow {profile['workflow']}")
 
         print("\nProcessing your question...")
 
         # Process the query
         result = app.invoke(conversation_state)
         conversation_state.update(result)
+        session_store.put(session_id, conversation_state)
 
         # Display the response with a source
         if result.get("generation"):
@@ -0,0 +1,22 @@
+import pytest
+
+from tools.data_loader import detect_language
+
+
+@pytest.mark.parametrize("question", [
+    "What causes Ménière's disease?",
+    "Symptoms of Guillain-Barré syndrome",
+    "What are café-au-lait spots?",
+    "How is Sjögren's syndrome treated?",
+])
+def test_accented_english_terms_are_english(question):
+    assert detect_language(question) == "en"
+
+
+@pytest.mark.parametrize("question", [
+    "Triệu chứng của bệnh sốt xuất huyết là gì?",
+    "Cao huyết áp có nguy hiểm không?",
+    "bé bị sốt",
+])
+def test_vietnamese_questions_are_vietnamese(question):
+    assert detect_language(question) == "vi"
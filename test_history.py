@@ -0,0 +1,79 @@
+from datetime import datetime
+
+import pytest
+
+from core import chat_service
+from core.message_writer import MessageWriter
+
+
+class FakeDB:
+    def __init__(self, messages):
+        self.messages = messages
+
+    def get_chat_history(self, session_id):
+        return [dict(message) for message in self.messages]
+
+
+def test_unpaginated_history_includes_pending_messages(monkeypatch):
+    saved = [{'id': '1', 'role': 'user', 'content': 'hello', 'timestamp': '2024-01-01T00:00:00'}]
+    db = FakeDB(saved)
+    # Not started, so queued messages stay pending
+    writer = MessageWriter(db)
+    writer.enqueue('s1', 'assistant', 'hi there')
+    monkeypatch.setattr(chat_service, 'db', db)
+    monkeypatch.setattr(chat_service, 'message_writer', writer)
+
+    history = chat_service.load_history('s1')
+
+    assert [m['content'] for m in history['messages']] == ['hello', 'hi there']
+
+
+def test_get_chat_history_rows_have_ids(monkeypatch):
+    pytest.importorskip("psycopg2")
+    from contextlib import contextmanager
+    from core.database import SupabaseDB
+
+    rows = [{'id': 7, 'content': 'hello', 'sender': 'user', 'created_at': datetime(2024, 1, 1)}]
+
+    class Cursor:
+        def execute(self, query, params):
+            self.query = query
+
+        def fetchall(self):
+            return rows
+
+        def close(self):
+            pass
+
+    class Connection:
+        def cursor(self, cursor_factory=None):
+            return Cursor()
+
+    @contextmanager
+    def connection():
+        yield Connection()
+
+    db = SupabaseDB.__new__(SupabaseDB)
+    monkeypatch.setattr(db, '_get_connection', connection, raising=False)
+
+    assert db.get_chat_history('s1') == [
+        {'id': '7', 'role': 'user', 'content': 'hello', 'timestamp': '2024-01-01T00:00:00'}
+    ]
+
+
+def test_session_store_reloads_history_written_elsewhere():
+    from core.session_store import InMemorySessionStore
+
+    db = {'s1': [{'id': '1', 'role': 'user', 'content': 'hello'}]}
+    store = InMemorySessionStore(loader=lambda sid: list(db[sid]), validator=lambda sid: db[sid][-1]['id'])
+
+    state = store.get('s1')
+    store.put('s1', state, '1')
+    assert store.get('s1') is state
+
+    # Another worker answered in the same conversation
+    db['s1'].append({'id': '2', 'role': 'assistant', 'content': 'hi'})
+    reloaded = store.get('s1')
+    assert reloaded is not state
+    assert [m['id'] for m in reloaded['conversation_history']] == ['1', '2']
+    assert store.stats()['stale'] == 1
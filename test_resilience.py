@@ -0,0 +1,138 @@
+import asyncio
+import time
+
+import pytest
+
+from core import resilience
+from core.resilience import (
+    CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, DeadlineExceeded,
+    aguarded_call, get_breaker, guarded_call, start_deadline,
+)
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers(monkeypatch):
+    monkeypatch.setattr(resilience, '_breakers', {})
+
+
+def fail():
+    raise ConnectionError('down')
+
+
+def test_breaker_opens_half_opens_and_closes():
+    breaker = CircuitBreaker('dep', failure_threshold=2, reset_timeout=0.05)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    time.sleep(0.06)
+    assert breaker.state == HALF_OPEN
+    breaker.before_call()
+    # Only one trial at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    breaker.before_call()
+
+
+def test_failed_trial_reopens_breaker():
+    breaker = CircuitBreaker('dep', failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert breaker.stats()['trips'] == 2
+
+
+def test_guarded_call_trips_breaker(monkeypatch):
+    monkeypatch.setenv('BREAKER_FAILURE_THRESHOLD', '2')
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            guarded_call('test-trips', fail)
+    calls = []
+    with pytest.raises(CircuitOpenError):
+        guarded_call('test-trips', calls.append, 1)
+    assert calls == []
+
+
+def test_passed_deadline_skips_the_call():
+    state = start_deadline({}, 0.01)
+    time.sleep(0.02)
+    calls = []
+    with pytest.raises(DeadlineExceeded):
+        guarded_call('test-deadline', calls.append, 1, state=state)
+    assert calls == []
+    assert get_breaker('test-deadline').stats()['consecutive_failures'] == 0
+
+
+def test_slow_call_times_out():
+    with pytest.raises(DeadlineExceeded):
+        guarded_call('test-slow', time.sleep, 1, timeout=0.05)
+    assert get_breaker('test-slow').stats()['consecutive_failures'] == 1
+
+
+def test_timeout_error_of_the_call_propagates_unchanged():
+    error = TimeoutError('read timed out')
+
+    def call():
+        raise error
+
+    with pytest.raises(TimeoutError) as raised:
+        guarded_call('test-own-timeout', call, timeout=5)
+    assert raised.value is error
+    assert not isinstance(raised.value, DeadlineExceeded)
+    assert get_breaker('test-own-timeout').stats()['consecutive_failures'] == 1
+
+
+def test_value_error_does_not_trip_breaker(monkeypatch):
+    monkeypatch.setenv('BREAKER_FAILURE_THRESHOLD', '1')
+
+    def call():
+        raise ValueError('bad input')
+
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            guarded_call('test-value-error', call, timeout=5)
+    breaker = get_breaker('test-value-error')
+    assert breaker.state == CLOSED
+    assert breaker.stats()['consecutive_failures'] == 0
+
+
+def test_async_call_is_cancelled_on_timeout():
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def run():
+        with pytest.raises(DeadlineExceeded):
+            await aguarded_call('test-async-timeout', slow, timeout=0.05)
+        # Let the cancellation reach the task
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert cancelled == [True]
+    assert get_breaker('test-async-timeout').stats()['consecutive_failures'] == 1
+
+
+def test_async_passed_deadline_skips_the_call():
+    calls = []
+
+    async def call():
+        calls.append(1)
+
+    state = {'deadline': time.monotonic() - 1}
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(aguarded_call('test-async-deadline', call, state=state))
+    assert calls == []
@@ -0,0 +1,138 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from core.single_flight import SingleFlight, coalescing_key, shared_result
+
+N = 8
+
+
+def wait_for_followers(flight, count):
+    deadline = time.monotonic() + 5
+    while flight.stats()['coalesced'] < count:
+        assert time.monotonic() < deadline, 'followers never joined'
+        time.sleep(0.005)
+
+
+def test_concurrent_callers_share_one_run():
+    flight = SingleFlight()
+    runs = []
+    release = threading.Event()
+
+    def answer(question):
+        runs.append(question)
+        release.wait(5)
+        return {'answer': question.upper()}
+
+    results = []
+
+    def ask():
+        results.append(flight.do('key', answer, 'flu'))
+
+    threads = [threading.Thread(target=ask) for _ in range(N)]
+    for thread in threads:
+        thread.start()
+    wait_for_followers(flight, N - 1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert runs == ['flu']
+    assert [result for result, _ in results] == [{'answer': 'FLU'}] * N
+    assert sum(shared for _, shared in results) == N - 1
+    assert flight.stats() == {'in_flight': 0, 'runs': 1, 'coalesced': N - 1}
+
+
+def test_leader_error_reaches_every_caller():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def answer():
+        release.wait(5)
+        raise RuntimeError('gemini down')
+
+    errors = []
+
+    def ask():
+        try:
+            flight.do('key', answer)
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=ask) for _ in range(N)]
+    for thread in threads:
+        thread.start()
+    wait_for_followers(flight, N - 1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(errors) == N
+    assert all(str(e) == 'gemini down' for e in errors)
+
+
+def test_concurrent_tasks_share_one_run():
+    flight = SingleFlight()
+    runs = []
+
+    async def answer(question):
+        runs.append(question)
+        await asyncio.sleep(0.05)
+        return {'answer': question.upper()}
+
+    async def run():
+        return await asyncio.gather(*(flight.ado('key', answer, 'flu') for _ in range(N)))
+
+    results = asyncio.run(run())
+
+    assert runs == ['flu']
+    assert [result for result, _ in results] == [{'answer': 'FLU'}] * N
+    assert sum(shared for _, shared in results) == N - 1
+    assert flight.stats()['in_flight'] == 0
+
+
+def test_async_leader_error_reaches_every_task():
+    flight = SingleFlight()
+
+    async def answer():
+        await asyncio.sleep(0.05)
+        raise RuntimeError('gemini down')
+
+    async def run():
+        return await asyncio.gather(*(flight.ado('key', answer) for _ in range(N)), return_exceptions=True)
+
+    results = asyncio.run(run())
+
+    assert len(results) == N
+    assert all(isinstance(e, RuntimeError) and str(e) == 'gemini down' for e in results)
+
+
+def test_shared_result_gives_each_follower_its_own_history():
+    result = {
+        'answer': 'Rest and fluids',
+        'conversation_history': [{'role': 'user', 'content': 'flu?'}],
+        'documents': ['doc'],
+        'token_usage': {'total_tokens': 120},
+    }
+
+    first = shared_result(result, 0.5)
+    second = shared_result(result, 0.5)
+    first['conversation_history'].append({'role': 'user', 'content': 'and then?'})
+    first['conversation_history'][0]['content'] = 'changed'
+
+    assert second['conversation_history'] == [{'role': 'user', 'content': 'flu?'}]
+    assert result['conversation_history'] == [{'role': 'user', 'content': 'flu?'}]
+    assert first['token_usage'] == {}
+    assert first['trace'] == [{'node': 'single_flight', 'ms': 500.0, 'outcome': 'coalesced'}]
+
+
+@pytest.mark.parametrize('state, key', [
+    ({'question': '  Sốt   xuất huyết? '}, 'sốt xuất huyết?'),
+    ({'question': 'FLU', 'conversation_history': []}, 'flu'),
+    ({'question': 'flu', 'conversation_history': [{'role': 'user', 'content': 'hi'}]}, None),
+    ({'question': '   '}, None),
+])
+def test_coalescing_key(state, key):
+    assert coalescing_key(state) == key
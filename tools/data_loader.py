@@ -1,76 +1,244 @@
 ﻿import json
 import os
-from typing import List
-from langchain_community.document_loaders import PyPDFLoader
+import unicodedata
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Iterable, Iterator, List, TextIO, Tuple
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from pypdf import PdfReader
 
+# Corpus metadata of each loader, used to filter retrieval
+PDF_CORPUS = "pdf"
+JSON_CORPUS = "diseases"
 
-def load_pdf(pdf_path: str) -> List[Document]:
-    """Load documents from a PDF file"""
+# Title of disease entries that have no ten_benh
+UNKNOWN_DISEASE_TITLE = 'Unknown Disease'
+
+# Letters with Vietnamese diacritics: tells a question typed with diacritics
+# from one typed without. à, é, ô, ... also occur in English loanwords and
+# eponyms (café, Ménière), so this says nothing about the language.
+VIETNAMESE_CHARS = frozenset(
+    "ăâđêôơưàáảãạằắẳẵặầấẩẫậèéẻẽẹềếểễệìíỉĩịòóỏõọồốổỗộờớởỡợùúủũụừứửữựỳýỷỹỵ"
+)
+
+# Letters that only occur in Vietnamese: ă đ ơ ư and the tone forms other
+# languages don't use (dot below, hook above, tones on â ê ô, tilde on e i u y)
+VIETNAMESE_ONLY_CHARS = frozenset(
+    "ăằắẳẵặđơờớởỡợưừứửữựầấẩẫậềếểễệồốổỗộạẹịọụỵảẻỉỏủỷẽĩũỹ"
+)
+
+
+def detect_language(text: str) -> str:
+    """'vi' when letters found only in Vietnamese make up more than 2% of the letters, else 'en'"""
+    letters = vietnamese = 0
+    for ch in unicodedata.normalize("NFC", text.lower()):
+        if ch.isalpha():
+            letters += 1
+            if ch in VIETNAMESE_ONLY_CHARS:
+                vietnamese += 1
+    return "vi" if letters and vietnamese / letters > 0.02 else "en"
+
+
+def count_pdf_pages(pdf_path: str) -> int:
+    return len(PdfReader(pdf_path).pages)
+
+
+def iter_pdf_pages(pdf_path: str, start: int = 0, stop: int = None) -> Iterator[Document]:
+    """Yield pages start..stop of a PDF one at a time"""
+    # A reader of its own, dropped with the generator: pypdf keeps every
+    # object it resolves, so a reader held across calls grows with the file
+    reader = PdfReader(pdf_path)
+    stop = len(reader.pages) if stop is None else min(stop, len(reader.pages))
+    for page_number in range(start, stop):
+        text = reader.pages[page_number].extract_text() or ""
+        yield Document(page_content=text, metadata={
+            "source": pdf_path,
+            "page": page_number,
+            "corpus": PDF_CORPUS,
+            "language": detect_language(text)
+        })
+
+
+def iter_pdf(pdf_path: str) -> Iterator[Document]:
+    """Yield the pages of a PDF one at a time"""
     if not os.path.exists(pdf_path):
         print(f"PDF file not found at {pdf_path}")
-        return []
+        return
 
+    yield from iter_pdf_pages(pdf_path)
+
+
+def _split_pdf_shard(pdf_path: str, start: int, stop: int) -> List[Tuple[Document, List[Document]]]:
+    """Worker: extract and split one page range"""
+    splitter = get_text_splitter()
+    return [(page, splitter.split_documents([page])) for page in iter_pdf_pages(pdf_path, start, stop)]
+
+
+def iter_pdf_split_parallel(pdf_path: str, workers: int,
+                            pages_per_shard: int = 32) -> Iterator[Tuple[Document, List[Document]]]:
+    """
+    Yield (page, chunks) for every page, extracting and splitting page ranges
+    in a process pool. Results come back in page order, and at most
+    2 * workers shards are in flight so memory stays bounded.
+    """
+    if not os.path.exists(pdf_path):
+        print(f"PDF file not found at {pdf_path}")
+        return
+
+    total = count_pdf_pages(pdf_path)
+    shards = iter(range(0, total, pages_per_shard))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for start in shards:
+            pending.append(pool.submit(_split_pdf_shard, pdf_path, start, start + pages_per_shard))
+            if len(pending) >= 2 * workers:
+                break
+        while pending:
+            yield from pending.popleft().result()
+            start = next(shards, None)
+            if start is not None:
+                pending.append(pool.submit(_split_pdf_shard, pdf_path, start, start + pages_per_shard))
+
+
+def load_pdf(pdf_path: str) -> List[Document]:
+    """Load documents from a PDF file"""
     try:
-        loader = PyPDFLoader(pdf_path)
-        docs = loader.load()
-        print(f"Loaded {len(docs)} pages from PDF")
+        docs = list(iter_pdf(pdf_path))
+        if docs:
+            print(f"Loaded {len(docs)} pages from PDF")
         return docs
     except Exception as e:
         print(f"Error loading PDF: {e}")
         return []
 
 
-def load_json(json_path: str) -> List[Document]:
-    """Load documents from a JSON file"""
-    if not os.path.exists(json_path):
-        print(f"JSON file not found at {json_path}")
-        return []
+def iter_json_array(f: TextIO, read_size: int = 1 << 16) -> Iterator[Any]:
+    """Yield the elements of a top-level JSON array, reading the file in blocks"""
+    decoder = json.JSONDecoder()
+    buffer, eof = "", False
 
-    try:
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+    def read_more(buffer):
+        data = f.read(read_size)
+        return buffer + data, not data
+
+    while not eof and not buffer.strip():
+        buffer, eof = read_more(buffer)
+    buffer = buffer.lstrip()
+    if not buffer.startswith('['):
+        raise ValueError("Expected a JSON array")
+    buffer = buffer[1:]
+
+    while True:
+        buffer = buffer.lstrip()
+        if not buffer:
+            if eof:
+                raise ValueError("Unterminated JSON array")
+            buffer, eof = read_more(buffer)
+            continue
+        if buffer[0] == ']':
+            return
+        if buffer[0] == ',':
+            buffer = buffer[1:]
+            continue
 
-        docs = []
-        for entry in data:
-            # Construct content from all fields
-            content_parts = []
+        try:
+            value, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # Element continues in the next block
+            buffer, eof = read_more(buffer)
+            continue
+        if not eof and (end == len(buffer) or buffer[end] not in ' \t\r\n,]'):
+            # A number cut at the end of the block may have more digits
+            buffer, eof = read_more(buffer)
+            continue
 
-            # Add disease name as header
-            if 'ten_benh' in entry:
-                content_parts.append(f"Bệnh: {entry['ten_benh']}")
+        yield value
+        buffer = buffer[end:]
 
-            # Add other fields
-            for key, value in entry.items():
-                if key not in ['ten_benh', 'url_nguon'] and isinstance(value, str):
-                    content_parts.append(f"{key}: {value}")
 
-            text_content = "\n\n".join(content_parts)
+def entry_to_document(entry: dict) -> Document:
+    """Build a Document from one disease entry of the JSON database"""
+    # Construct content from all fields
+    content_parts = []
 
-            # Create metadata
-            metadata = {
-                "source": entry.get('url_nguon', 'Medical JSON Database'),
-                "title": entry.get('ten_benh', 'Unknown Disease')
-            }
+    # Add disease name as header
+    if 'ten_benh' in entry:
+        content_parts.append(f"Bệnh: {entry['ten_benh']}")
 
-            docs.append(Document(page_content=text_content, metadata=metadata))
+    # Add other fields
+    for key, value in entry.items():
+        if key not in ['ten_benh', 'url_nguon'] and isinstance(value, str):
+            content_parts.append(f"{key}: {value}")
 
-        print(f"Loaded {len(docs)} entries from JSON")
+    text_content = "\n\n".join(content_parts)
+
+    # Create metadata
+    metadata = {
+        "source": entry.get('url_nguon', 'Medical JSON Database'),
+        "title": entry.get('ten_benh', UNKNOWN_DISEASE_TITLE),
+        "corpus": JSON_CORPUS,
+        "language": detect_language(text_content)
+    }
+
+    return Document(page_content=text_content, metadata=metadata)
+
+
+def iter_json(json_path: str) -> Iterator[Document]:
+    """Yield one Document per entry without loading the whole file"""
+    if not os.path.exists(json_path):
+        print(f"JSON file not found at {json_path}")
+        return
+
+    with open(json_path, 'r', encoding='utf-8') as f:
+        for entry in iter_json_array(f):
+            yield entry_to_document(entry)
+
+
+def load_json(json_path: str) -> List[Document]:
+    """Load documents from a JSON file"""
+    try:
+        docs = list(iter_json(json_path))
+        if docs:
+            print(f"Loaded {len(docs)} entries from JSON")
         return docs
     except Exception as e:
         print(f"Error loading JSON: {e}")
         return []
 
 
+def iter_batches(items: Iterable, size: int) -> Iterator[list]:
+    """Group an iterable into lists of at most `size` items"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+_text_splitter = None
+
+
+def get_text_splitter() -> RecursiveCharacterTextSplitter:
+    """Shared splitter, building the tiktoken encoder once"""
+    global _text_splitter
+    if _text_splitter is None:
+        _text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+            chunk_size=512,
+            chunk_overlap=128,
+            separators=["\n\n", ". ", "\n", " "]
+        )
+    return _text_splitter
+
+
 def split_documents(docs: List[Document]) -> List[Document]:
     """Split documents into smaller chunks"""
-    text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-        chunk_size=512,
-        chunk_overlap=128,
-        separators=["\n\n", ". ", "\n", " "]
-    )
-    splits = text_splitter.split_documents(docs)
+    splits = get_text_splitter().split_documents(docs)
     print(f"Split into {len(splits)} chunks")
     return splits
 
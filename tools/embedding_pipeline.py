@@ -0,0 +1,159 @@
+"""
+Batched, pipelined embedding for vector database builds.
+
+Chunks are embedded in fixed-size batches by a pool of workers (threads by
+default, or processes that each load their own copy of the model) while one
+writer thread upserts finished batches into the Chroma collection in
+submission order. Embedding the next batches therefore overlaps with
+writing the previous ones.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+from langchain_core.documents import Document
+
+from core.config import env_int, env_str
+
+# Model loaded once per worker process in "processes" mode
+_process_embeddings = None
+
+
+def _init_process_worker(batch_size: int):
+    global _process_embeddings
+    # Imported here: tools.vector_store imports this module
+    from tools.vector_store import create_base_embeddings
+    _process_embeddings = create_base_embeddings(batch_size)
+
+
+def _embed_in_process(texts: List[str]):
+    return _timed_embed(_process_embeddings.embed_documents, texts)
+
+
+def _timed_embed(embed_documents: Callable, texts: List[str]):
+    started = time.perf_counter()
+    vectors = embed_documents(texts)
+    return vectors, time.perf_counter() - started
+
+
+class EmbeddingPipeline:
+    """
+    submit() splits chunks into batches and hands them to the embedding pool;
+    at most `max_pending` batches wait for the writer, so submit() blocks when
+    embedding or writing falls behind. drain() waits until everything
+    submitted is stored and re-raises the first failure.
+    """
+
+    def __init__(self, embeddings, collection, batch_size: int = 64, workers: int = 1,
+                 pool: str = "threads", max_pending: int = None):
+        self.collection = collection
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers)
+
+        if pool == "processes":
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_process_worker,
+                initargs=(self.batch_size,)
+            )
+            self._embed = lambda texts: self._pool.submit(_embed_in_process, texts)
+        elif pool == "threads":
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="embed")
+            self._embed = lambda texts: self._pool.submit(_timed_embed, embeddings.embed_documents, texts)
+        else:
+            raise ValueError(f"Unknown embedding pool: {pool}")
+
+        # (future, ids, documents, on_written) in submission order; None stops the writer
+        self._queue = queue.Queue(maxsize=max_pending or 2 * self.workers)
+        self._error = None
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._chunks_submitted = 0
+        self._chunks_written = 0
+        self._batches = 0
+        self._embed_seconds = 0.0
+        self._write_seconds = 0.0
+
+        self._writer = threading.Thread(target=self._write_loop, name="embedding-writer", daemon=True)
+        self._writer.start()
+
+    @classmethod
+    def from_env(cls, embeddings, collection) -> 'EmbeddingPipeline':
+        return cls(
+            embeddings,
+            collection,
+            batch_size=env_int("EMBEDDING_BATCH_SIZE", 64),
+            workers=env_int("EMBEDDING_WORKERS", 1),
+            pool=env_str("EMBEDDING_POOL", "threads").lower()
+        )
+
+    def _raise_if_failed(self):
+        if self._error is not None:
+            raise self._error
+
+    def submit(self, documents: List[Document], ids: List[str], on_written: Optional[Callable] = None):
+        """Queue chunks for embedding; on_written runs in the writer thread once all of them are stored"""
+        self._raise_if_failed()
+        starts = list(range(0, len(ids), self.batch_size)) or [0]
+        for start in starts:
+            batch_docs = documents[start:start + self.batch_size]
+            batch_ids = ids[start:start + self.batch_size]
+            future = self._embed([doc.page_content for doc in batch_docs]) if batch_ids else None
+            callback = on_written if start == starts[-1] else None
+            self._queue.put((future, batch_ids, batch_docs, callback))
+        with self._lock:
+            self._chunks_submitted += len(ids)
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                if self._error is not None:
+                    continue
+                future, ids, documents, on_written = item
+                if ids:
+                    vectors, embed_seconds = future.result()
+                    started = time.perf_counter()
+                    self.collection.upsert(
+                        ids=ids,
+                        embeddings=vectors,
+                        documents=[doc.page_content for doc in documents],
+                        metadatas=[doc.metadata for doc in documents]
+                    )
+                    with self._lock:
+                        self._write_seconds += time.perf_counter() - started
+                        self._embed_seconds += embed_seconds
+                        self._chunks_written += len(ids)
+                        self._batches += 1
+                if on_written:
+                    on_written()
+            except Exception as e:
+                self._error = e
+                print(f"EmbeddingPipeline: write failed - {e}")
+            finally:
+                self._queue.task_done()
+
+    def drain(self):
+        self._queue.join()
+        self._raise_if_failed()
+
+    def close(self):
+        self._queue.put(None)
+        self._writer.join()
+        self._pool.shutdown(cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            elapsed = time.perf_counter() - self._started
+            return {
+                "chunks_submitted": self._chunks_submitted,
+                "chunks_written": self._chunks_written,
+                "batches": self._batches,
+                "embed_seconds": round(self._embed_seconds, 2),
+                "write_seconds": round(self._write_seconds, 2),
+                "chunks_per_second": round(self._chunks_written / elapsed, 1) if elapsed else 0.0,
+            }
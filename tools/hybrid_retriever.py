@@ -0,0 +1,90 @@
+"""
+Hybrid retrieval: Chroma vector search fused with the BM25 lexical index.
+
+Both stages over-fetch `fetch_k` candidates; reciprocal rank fusion
+(score = sum of 1 / (rrf_k + rank) over the stages that returned a chunk)
+picks the final k, so a chunk found only by its exact drug or disease name
+can still make the cut. A Chroma `filter` (e.g. {"language": "vi"}) applies
+to both stages. The time spent in each stage is recorded in
+medical_chat_retrieval_stage_seconds.
+"""
+import asyncio
+import time
+from typing import Dict, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from core.metrics import REGISTRY
+from tools.lexical_index import LexicalIndex
+
+RETRIEVAL_STAGE_DURATION = REGISTRY.histogram(
+    "medical_chat_retrieval_stage_seconds", "Wall time of each retrieval stage", ("stage",)
+)
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], rrf_k: int = 60) -> List[str]:
+    """Merge ranked id lists, best first; ties keep the order of first appearance"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores, key=lambda chunk_id: -scores[chunk_id])
+
+
+class HybridRetriever(BaseRetriever):
+    vectorstore: object
+    lexical_index: LexicalIndex
+    k: int = 3
+    fetch_k: int = 20
+    rrf_k: int = 60
+    filter: Optional[dict] = None
+
+    def _vector_search(self, query: str) -> List[Document]:
+        started = time.perf_counter()
+        docs = self.vectorstore.similarity_search(query, k=self.fetch_k, filter=self.filter)
+        RETRIEVAL_STAGE_DURATION.observe(time.perf_counter() - started, stage="vector")
+        return docs
+
+    def _lexical_search(self, query: str) -> List[str]:
+        started = time.perf_counter()
+        if not self.filter:
+            ids = [chunk_id for chunk_id, _ in self.lexical_index.search(query, self.fetch_k)]
+        else:
+            # The lexical index has no metadata: over-fetch and ask Chroma which hits pass the filter
+            ids = [chunk_id for chunk_id, _ in self.lexical_index.search(query, 4 * self.fetch_k)]
+            allowed = set(self.vectorstore._collection.get(ids=ids, where=self.filter, include=[])["ids"]) if ids else set()
+            ids = [chunk_id for chunk_id in ids if chunk_id in allowed][:self.fetch_k]
+        RETRIEVAL_STAGE_DURATION.observe(time.perf_counter() - started, stage="lexical")
+        return ids
+
+    def _fuse(self, vector_docs: List[Document], lexical_ids: List[str]) -> List[Document]:
+        started = time.perf_counter()
+        by_id = {doc.id: doc for doc in vector_docs if doc.id}
+        ranked = reciprocal_rank_fusion([[doc.id for doc in vector_docs if doc.id], lexical_ids], self.rrf_k)
+        top = ranked[:self.k]
+
+        # Chunks only the lexical index found are loaded from Chroma
+        missing = [chunk_id for chunk_id in top if chunk_id not in by_id]
+        if missing:
+            found = self.vectorstore._collection.get(ids=missing, include=["documents", "metadatas"])
+            for chunk_id, text, metadata in zip(found["ids"], found["documents"], found["metadatas"]):
+                by_id[chunk_id] = Document(id=chunk_id, page_content=text or "", metadata=metadata or {})
+
+        docs = [by_id[chunk_id] for chunk_id in top if chunk_id in by_id]
+        RETRIEVAL_STAGE_DURATION.observe(time.perf_counter() - started, stage="fusion")
+        return docs
+
+    def _get_relevant_documents(self, query: str, *,
+                                run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self._fuse(self._vector_search(query), self._lexical_search(query))
+
+    async def _aget_relevant_documents(self, query: str, *,
+                                       run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        # Both stages block (embedding, SQLite), so run them side by side in threads
+        vector_docs, lexical_ids = await asyncio.gather(
+            asyncio.to_thread(self._vector_search, query),
+            asyncio.to_thread(self._lexical_search, query)
+        )
+        return await asyncio.to_thread(self._fuse, vector_docs, lexical_ids)
@@ -0,0 +1,379 @@
+"""
+Incremental, resumable ingestion into the Chroma vector database.
+
+    python -m tools.ingest --pdf data/gale-encyclopedia.pdf --json data/medical-data.json [--workers 4]
+
+Every PDF page and JSON entry is a unit. The manifest in the persist
+directory records each unit's content hash and the ids of its chunks, so a
+re-run only embeds chunks of new or changed units and deletes the chunks of
+changed or removed ones. Chunk ids are derived from the unit and the chunk
+text, and the manifest is saved after every batch: an interrupted run picks
+up where it stopped without embedding the same chunk twice.
+
+Sources are streamed: PDF pages and JSON entries are read one at a time and
+chunks reach the embedder in INGEST_BATCH_SIZE batches, so memory stays flat
+however large the corpus is. Embedding and writing to Chroma run in an
+EmbeddingPipeline (EMBEDDING_BATCH_SIZE, EMBEDDING_WORKERS, EMBEDDING_POOL);
+the manifest entry of a unit is saved once its chunks are stored. Progress
+lines report docs/sec, chunks/sec and peak RSS. The BM25 lexical index
+(tools.lexical_index) receives the same chunk additions and deletions, and
+the disease title index (tools.title_index) is rebuilt when anything changed.
+With --workers N, PDF page ranges are extracted and split in N processes and
+merged back in page order, producing the same chunks as the serial path.
+
+Units are only removed for sources ingested in the current run; the chunks
+of a source that is no longer passed are left alone. Sources are keyed by
+their path relative to the project root, so "./data/x.pdf", "data/x.pdf"
+and the absolute path are one source and are never embedded twice.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from core.config import env_int
+from tools.data_loader import get_text_splitter, iter_json, iter_pdf, iter_pdf_split_parallel
+from tools.embedding_pipeline import EmbeddingPipeline
+from tools.lexical_index import LexicalIndex, open_lexical_index
+from tools.title_index import index_path as title_index_path, rebuild_title_index
+from tools.vector_store import EMBEDDING_MODEL_NAME, get_embeddings, open_vectorstore
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MANIFEST_NAME = "ingest_manifest.json"
+MANIFEST_VERSION = 1
+# Print progress at least every this many units, even when nothing needs embedding
+PROGRESS_EVERY_UNITS = 1000
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process so far"""
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def chunk_ids(unit_key: str, chunks: List[Document]) -> List[str]:
+    """Deterministic ids: an unchanged chunk keeps its id when its unit is edited elsewhere"""
+    ids, seen = [], {}
+    for chunk in chunks:
+        digest = hashlib.sha1(f"{unit_key}\0{chunk.page_content}".encode('utf-8')).hexdigest()
+        # Repeated text within a unit gets its own id
+        seen[digest] = seen.get(digest, 0) + 1
+        ids.append(digest if seen[digest] == 1 else f"{digest}-{seen[digest]}")
+    return ids
+
+
+def source_path(path: str) -> str:
+    """The spelling of a source path used in unit keys: relative to the project root, with '/'"""
+    path = os.path.abspath(os.path.normpath(path))
+    try:
+        path = os.path.relpath(path, PROJECT_ROOT)
+    except ValueError:  # Windows, another drive
+        pass
+    return path.replace(os.sep, "/")
+
+
+def _normalize_sources(units: Dict[str, dict]) -> List[str]:
+    """
+    Re-key units recorded under another spelling of their source path (by
+    manifests older than source_path()). Returns the chunk ids of units that
+    turn out to be a second copy of another unit, to be deleted.
+    """
+    duplicates = []
+    for key in list(units):
+        record = units[key]
+        old_source = record["source"]
+        source = source_path(old_source)
+        kind, _, rest = key.partition(":")
+        if source == old_source or not rest.startswith(old_source):
+            continue
+        del units[key]
+        record["source"] = source
+        new_key = f"{kind}:{source}{rest[len(old_source):]}"
+        if new_key in units:
+            duplicates.extend(chunk_id for chunk_id in record["chunks"] if chunk_id not in units[new_key]["chunks"])
+        else:
+            units[new_key] = record
+    return duplicates
+
+
+def manifest_path(persist_dir: str) -> str:
+    return os.path.join(persist_dir, MANIFEST_NAME)
+
+
+def load_manifest(persist_dir: str) -> dict:
+    path = manifest_path(persist_dir)
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {"version": MANIFEST_VERSION, "embedding_model": EMBEDDING_MODEL_NAME, "units": {}}
+
+
+def save_manifest(persist_dir: str, manifest: dict):
+    """Write to a temp file and rename, so a crash never leaves a truncated manifest"""
+    path = manifest_path(persist_dir)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def iter_units(pdf_paths: Iterable[str] = (), json_paths: Iterable[str] = (),
+               workers: int = 1) -> Iterator[Tuple[str, str, Document, Optional[List[Document]]]]:
+    """
+    Yield (source path, unit key, document, chunks) for every PDF page and JSON
+    entry. With workers > 1 PDF pages arrive already split by the process
+    pool; otherwise chunks is None and the caller splits changed units.
+    """
+    for path in pdf_paths:
+        source = source_path(path)
+        if workers > 1:
+            pages = iter_pdf_split_parallel(path, workers, env_int("INGEST_PAGES_PER_SHARD", 32))
+        else:
+            pages = ((doc, None) for doc in iter_pdf(path))
+        for doc, chunks in pages:
+            # The same spelling in the metadata, so the unit hash doesn't depend on how the path was passed
+            for document in [doc, *(chunks or [])]:
+                document.metadata["source"] = source
+            yield source, f"pdf:{source}#page={doc.metadata.get('page', 0)}", doc, chunks
+
+    for path in json_paths:
+        source = source_path(path)
+        seen = {}
+        for doc in iter_json(path):
+            title = doc.metadata.get('title', '')
+            seen[title] = seen.get(title, 0) + 1
+            suffix = f"#{seen[title]}" if seen[title] > 1 else ""
+            yield source, f"json:{source}#{title}{suffix}", doc, None
+
+
+def _reset_collection(vectorstore, batch_size: int):
+    """Delete every chunk, including ones written before manifests existed"""
+    collection = vectorstore._collection
+    while True:
+        ids = collection.get(limit=batch_size, include=[])['ids']
+        if not ids:
+            break
+        collection.delete(ids=ids)
+
+
+class _Batch:
+    """
+    Units waiting to be written: (unit key, record, new chunks, new ids, stale ids),
+    plus the unchanged chunks of changed units, whose metadata may still differ
+    """
+
+    def __init__(self):
+        self.units = []
+        self.kept = []
+        self.chunk_count = 0
+
+    def add(self, key: str, record: dict, chunks: List[Document], ids: List[str], stale: List[str],
+            kept: List[Tuple[Document, str]] = ()):
+        self.units.append((key, record, chunks, ids, stale))
+        self.kept.extend(kept)
+        self.chunk_count += len(ids) + len(kept)
+
+
+def _flush(pipeline: EmbeddingPipeline, lexical: LexicalIndex, persist_dir: str, manifest: dict,
+           batch: _Batch, stats: dict):
+    """Hand a batch of units to the embedding pipeline; the manifest is saved once they are stored"""
+    if not batch.units:
+        return
+
+    new_ids = [chunk_id for _, _, _, ids, _ in batch.units for chunk_id in ids]
+    # Chunks written by a run that crashed before saving the manifest
+    written = set(pipeline.collection.get(ids=new_ids, include=[])['ids']) if new_ids else set()
+
+    documents, ids = [], []
+    for _, _, chunks, unit_ids, _ in batch.units:
+        for chunk, chunk_id in zip(chunks, unit_ids):
+            if chunk_id not in written:
+                documents.append(chunk)
+                ids.append(chunk_id)
+
+    units, kept = batch.units, batch.kept
+    stale = [chunk_id for _, _, _, _, stale_ids in units for chunk_id in stale_ids]
+
+    def on_written():
+        # Runs in the writer thread after the new chunks are stored
+        if stale:
+            pipeline.collection.delete(ids=stale)
+            lexical.delete(stale)
+        if kept:
+            # Same text, so no embedding: only the metadata is rewritten
+            pipeline.collection.update(ids=[chunk_id for _, chunk_id in kept],
+                                       metadatas=[chunk.metadata for chunk, _ in kept])
+        # Resumed chunks too: a crash may have come between the Chroma and the lexical write
+        lexical.add(new_ids, [chunk.page_content for _, _, chunks, _, _ in units for chunk in chunks])
+        for key, record, _, _, _ in units:
+            manifest["units"][key] = record
+        save_manifest(persist_dir, manifest)
+
+    pipeline.submit(documents, ids, on_written)
+
+    stats["chunks_resumed"] += len(written)
+    stats["chunks_deleted"] += len(stale)
+    batch.units, batch.kept, batch.chunk_count = [], [], 0
+
+
+def _report(stats: dict, started: float, pipeline: EmbeddingPipeline):
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    stats["chunks_embedded"] = pipeline.stats()["chunks_written"]
+    print(f"Ingest: {stats['units']} units scanned ({stats['units'] / elapsed:.1f} docs/s), "
+          f"{stats['chunks_embedded']} chunks embedded ({stats['chunks_embedded'] / elapsed:.1f} chunks/s), "
+          f"peak RSS {peak_rss_mb()} MB")
+
+
+def ingest(pdf_paths: Iterable[str] = (), json_paths: Iterable[str] = (),
+           persist_dir: str = './medical_db/', batch_size: int = None, rebuild: bool = False,
+           workers: int = None) -> dict:
+    """Bring the vector database in persist_dir up to date with the given sources"""
+    batch_size = batch_size or env_int("INGEST_BATCH_SIZE", 256)
+    workers = workers or env_int("INGEST_WORKERS", 1)
+    started = time.perf_counter()
+
+    vectorstore = open_vectorstore(persist_dir)
+    has_manifest = os.path.exists(manifest_path(persist_dir))
+    manifest = load_manifest(persist_dir)
+
+    if manifest.get("embedding_model") != EMBEDDING_MODEL_NAME and not rebuild:
+        print(f"Ingest: index was built with {manifest.get('embedding_model')}, run with --rebuild")
+        return None
+    if not has_manifest and vectorstore._collection.count() and not rebuild:
+        print("Ingest: vector database has no manifest, run once with --rebuild to adopt it")
+        return None
+    if rebuild:
+        print("Ingest: rebuilding vector database from scratch")
+        _reset_collection(vectorstore, batch_size)
+        manifest = {"version": MANIFEST_VERSION, "embedding_model": EMBEDDING_MODEL_NAME, "units": {}}
+    # Written before the first chunk, so a crashed first build is resumed rather than refused
+    save_manifest(persist_dir, manifest)
+    lexical = open_lexical_index(persist_dir, vectorstore._collection)
+    units: Dict[str, dict] = manifest["units"]
+    duplicates = _normalize_sources(units)
+    if duplicates:
+        print(f"Ingest: deleting {len(duplicates)} chunks ingested twice under another path spelling")
+        vectorstore.delete(ids=duplicates)
+        lexical.delete(duplicates)
+        save_manifest(persist_dir, manifest)
+
+    splitter = get_text_splitter()
+    pipeline = EmbeddingPipeline.from_env(get_embeddings(), vectorstore._collection)
+    stats = {"units": 0, "unchanged": 0, "changed": 0, "added": 0, "removed": 0,
+             "chunks_embedded": 0, "chunks_resumed": 0, "chunks_deleted": 0}
+    seen_units, loaded_sources = set(), set()
+    batch = _Batch()
+
+    try:
+        for source, key, doc, chunks in iter_units(pdf_paths, json_paths, workers):
+            seen_units.add(key)
+            loaded_sources.add(source)
+            stats["units"] += 1
+
+            # Metadata is part of the hash: a changed source URL or title must reach the index too
+            unit_hash = content_hash(doc.page_content + "\0" + json.dumps(doc.metadata, sort_keys=True, default=str))
+            old = units.get(key)
+            if old and old["hash"] == unit_hash:
+                stats["unchanged"] += 1
+                if stats["units"] % PROGRESS_EVERY_UNITS == 0:
+                    _report(stats, started, pipeline)
+                continue
+            stats["changed" if old else "added"] += 1
+
+            if chunks is None:
+                chunks = splitter.split_documents([doc])
+            ids = chunk_ids(key, chunks)
+            old_ids = set(old["chunks"]) if old else set()
+            new = [(chunk, chunk_id) for chunk, chunk_id in zip(chunks, ids) if chunk_id not in old_ids]
+            kept = [(chunk, chunk_id) for chunk, chunk_id in zip(chunks, ids) if chunk_id in old_ids]
+            stale = sorted(old_ids - set(ids))
+            batch.add(key, {"hash": unit_hash, "source": source, "chunks": ids},
+                      [chunk for chunk, _ in new], [chunk_id for _, chunk_id in new], stale, kept)
+
+            if batch.chunk_count >= batch_size:
+                _flush(pipeline, lexical, persist_dir, manifest, batch, stats)
+                _report(stats, started, pipeline)
+
+        _flush(pipeline, lexical, persist_dir, manifest, batch, stats)
+        pipeline.drain()
+    except Exception as e:
+        # Keep what was read so far; removals are skipped since the source wasn't read to the end
+        try:
+            _flush(pipeline, lexical, persist_dir, manifest, batch, stats)
+            pipeline.drain()
+        except Exception as write_error:
+            print(f"Ingest: could not store the last batch - {write_error}")
+        print(f"Ingest: stopped after {stats['units']} units - {e}. Run again to resume.")
+        return None
+    finally:
+        pipeline.close()
+    stats["chunks_embedded"] = pipeline.stats()["chunks_written"]
+
+    # Units that disappeared from a source that was read in this run
+    removed = [key for key, record in units.items()
+               if record["source"] in loaded_sources and key not in seen_units]
+    stale = [chunk_id for key in removed for chunk_id in units[key]["chunks"]]
+    if stale:
+        vectorstore.delete(ids=stale)
+        lexical.delete(stale)
+    for key in removed:
+        del units[key]
+    stats["removed"] = len(removed)
+    stats["chunks_deleted"] += len(stale)
+    save_manifest(persist_dir, manifest)
+    if stats["added"] or stats["changed"] or removed or not os.path.exists(title_index_path(persist_dir)):
+        rebuild_title_index(persist_dir, vectorstore._collection)
+
+    elapsed = time.perf_counter() - started
+    stats["seconds"] = round(elapsed, 2)
+    stats["docs_per_second"] = round(stats["units"] / elapsed, 1) if elapsed else 0.0
+    stats["chunks_per_second"] = round(stats["chunks_embedded"] / elapsed, 1) if elapsed else 0.0
+    stats["peak_rss_mb"] = peak_rss_mb()
+    print(f"Ingest: done in {stats['seconds']}s - {stats['added']} added, {stats['changed']} changed, "
+          f"{stats['removed']} removed, {stats['unchanged']} unchanged units; "
+          f"{stats['chunks_embedded']} chunks embedded, {stats['chunks_deleted']} deleted; "
+          f"{stats['docs_per_second']} docs/s, {stats['chunks_per_second']} chunks/s, "
+          f"peak RSS {stats['peak_rss_mb']} MB")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally ingest medical documents into the vector database")
+    parser.add_argument('--pdf', action='append', default=[], help="PDF file (repeatable)")
+    parser.add_argument('--json', action='append', default=[], help="JSON file (repeatable)")
+    parser.add_argument('--persist-dir', default='./medical_db/')
+    parser.add_argument('--batch-size', type=int, default=None, help="chunks per write (INGEST_BATCH_SIZE)")
+    parser.add_argument('--rebuild', action='store_true', help="drop the existing index and ingest everything")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="processes extracting and splitting PDF pages (INGEST_WORKERS)")
+    args = parser.parse_args()
+
+    if not args.pdf and not args.json:
+        parser.error("pass at least one --pdf or --json source")
+
+    stats = ingest(args.pdf, args.json, persist_dir=args.persist_dir,
+                   batch_size=args.batch_size, rebuild=args.rebuild, workers=args.workers)
+    raise SystemExit(0 if stats is not None else 1)
+
+
+if __name__ == '__main__':
+    main()
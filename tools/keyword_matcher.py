@@ -0,0 +1,70 @@
+"""
+Compiled bilingual keyword matcher for routing questions.
+
+The lexicon (data/medical_keywords.json, or MEDICAL_KEYWORDS_PATH) lists
+English and Vietnamese keywords. They are compiled once into word-boundary
+regexes, longest keyword first, so "head" no longer matches inside "ahead"
+and a question is scanned in a single pass instead of once per keyword.
+English keywords also match their plural ("headaches").
+
+Vietnamese is matched diacritic-insensitively: a question typed without
+tone marks is compared with the folded keywords ("dau dau" finds "đau
+đầu"). Folded single syllables collide with everyday words ("dau" is also
+"đâu", "tim" is also "tìm", "ho" is also "họ"), so only multi-syllable
+Vietnamese keywords take part in that comparison; a question with
+diacritics is matched exactly against every keyword.
+"""
+import json
+import os
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Optional
+
+from core.config import env_str
+from tools.data_loader import VIETNAMESE_CHARS
+from tools.lexical_index import fold
+
+DEFAULT_LEXICON_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                    "data", "medical_keywords.json")
+
+
+def _compile(keywords: Iterable[str], plural: bool) -> Optional[re.Pattern]:
+    keywords = sorted(set(keywords), key=len, reverse=True)
+    if not keywords:
+        return None
+    alternatives = "|".join(r"\s+".join(re.escape(word) for word in keyword.split()) for keyword in keywords)
+    suffix = "(?:e?s)?" if plural else ""
+    return re.compile(rf"\b(?:{alternatives}){suffix}\b")
+
+
+class KeywordMatcher:
+    def __init__(self, lexicon: Dict[str, List[str]]):
+        normalize = lambda keyword: unicodedata.normalize("NFC", keyword.strip().lower())
+        english = [normalize(keyword) for keyword in lexicon.get("en", []) if keyword.strip()]
+        vietnamese = [normalize(keyword) for keyword in lexicon.get("vi", []) if keyword.strip()]
+
+        self._english = _compile(english, plural=True)
+        self._vietnamese = _compile(vietnamese, plural=False)
+        self._folded = _compile([fold(keyword) for keyword in vietnamese if len(keyword.split()) > 1], plural=False)
+        self.size = len(english) + len(vietnamese)
+
+    @classmethod
+    def load(cls, path: str = None) -> 'KeywordMatcher':
+        with open(path or env_str("MEDICAL_KEYWORDS_PATH", DEFAULT_LEXICON_PATH), 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def find(self, question: str) -> Optional[str]:
+        """The first keyword found in the question, or None"""
+        text = unicodedata.normalize("NFC", question.lower())
+        if any(ch in VIETNAMESE_CHARS for ch in text):
+            patterns = ((self._english, text), (self._vietnamese, text))
+        else:
+            patterns = ((self._english, text), (self._folded, fold(text)))
+        for pattern, subject in patterns:
+            match = pattern.search(subject) if pattern else None
+            if match:
+                return match.group(0)
+        return None
+
+    def matches(self, question: str) -> bool:
+        return self.find(question) is not None
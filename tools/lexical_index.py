@@ -0,0 +1,213 @@
+"""
+Persisted BM25 index over the chunks of the vector database.
+
+MiniLM only knows English, so dense search misses exact drug names and
+Vietnamese disease names. This inverted index, stored in SQLite next to
+the Chroma files, scores the same chunk ids with Okapi BM25. Tokens are
+lower-cased and folded to ASCII ("sốt xuất huyết" -> "sot xuat huyet"), so
+queries typed without diacritics still match.
+
+tools.ingest keeps it in step with Chroma; open_lexical_index() rebuilds it
+from the collection when the two disagree (e.g. a database built before this
+index existed).
+
+    python -m tools.lexical_index --persist-dir ./medical_db/
+"""
+import argparse
+import heapq
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import Counter
+from typing import Iterable, List, Tuple
+
+INDEX_NAME = "lexical_index.db"
+
+_TOKEN_RE = re.compile(r"\w+")
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from has have how i if in into is it its
+may of on or so such than that the their them then there these they this to was were
+what when where which who why will with you your
+""".split())
+
+
+def fold(text: str) -> str:
+    """Lower-case and strip diacritics; đ has no decomposition, so map it explicitly"""
+    if text.isascii():
+        return text.lower()
+    text = unicodedata.normalize("NFD", text.lower().replace("đ", "d"))
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in _TOKEN_RE.findall(fold(text))
+            if token not in STOPWORDS and (len(token) > 1 or token.isdigit())]
+
+
+def index_path(persist_dir: str) -> str:
+    # Not *.sqlite3: get_or_create_vectorstore takes those for Chroma files
+    return os.path.join(persist_dir, INDEX_NAME)
+
+
+class LexicalIndex:
+    """BM25 (k1, b) over chunks keyed by their Chroma id"""
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chunks (rowid INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, "
+            "length INTEGER NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, chunk INTEGER NOT NULL, "
+            "tf INTEGER NOT NULL, PRIMARY KEY (term, chunk)) WITHOUT ROWID"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings (chunk)")
+        self._db.commit()
+
+        self._totals = None  # (chunk count, average length), reset by every write
+        self._searches = 0
+        self._search_time = 0.0
+
+    def _delete(self, ids: Iterable[str]):
+        """Delete chunks and their postings (lock held, caller commits)"""
+        for chunk_id in ids:
+            row = self._db.execute("SELECT rowid FROM chunks WHERE id = ?", (chunk_id,)).fetchone()
+            if row:
+                self._db.execute("DELETE FROM postings WHERE chunk = ?", row)
+                self._db.execute("DELETE FROM chunks WHERE rowid = ?", row)
+
+    def add(self, ids: List[str], texts: List[str]):
+        """Index chunks, replacing any already stored under the same ids"""
+        with self._lock:
+            self._delete(ids)
+            postings = []
+            for chunk_id, text in zip(ids, texts):
+                terms = Counter(tokenize(text))
+                cursor = self._db.execute(
+                    "INSERT INTO chunks (id, length) VALUES (?, ?)", (chunk_id, sum(terms.values()))
+                )
+                postings.extend((term, cursor.lastrowid, tf) for term, tf in terms.items())
+            # In key order, so SQLite appends to its B-tree pages instead of splitting them at random
+            postings.sort()
+            self._db.executemany("INSERT INTO postings (term, chunk, tf) VALUES (?, ?, ?)", postings)
+            self._db.commit()
+            self._totals = None
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            self._delete(ids)
+            self._db.commit()
+            self._totals = None
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM postings")
+            self._db.execute("DELETE FROM chunks")
+            self._db.commit()
+            self._totals = None
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """The k best (chunk id, BM25 score) pairs, best first"""
+        started = time.perf_counter()
+        with self._lock:
+            if self._totals is None:
+                count, total_length = self._db.execute("SELECT COUNT(*), SUM(length) FROM chunks").fetchone()
+                self._totals = (count, (total_length or 0) / count if count else 0.0)
+            count, avg_length = self._totals
+
+            scores = {}
+            for term in set(tokenize(query)):
+                rows = self._db.execute(
+                    "SELECT p.chunk, p.tf, c.length FROM postings p JOIN chunks c ON c.rowid = p.chunk "
+                    "WHERE p.term = ?", (term,)
+                ).fetchall()
+                if not rows:
+                    continue
+                idf = math.log(1 + (count - len(rows) + 0.5) / (len(rows) + 0.5))
+                for chunk, tf, length in rows:
+                    norm = self.k1 * (1 - self.b + self.b * length / avg_length) if avg_length else self.k1
+                    scores[chunk] = scores.get(chunk, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+            best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            results = []
+            for chunk, score in best:
+                chunk_id = self._db.execute("SELECT id FROM chunks WHERE rowid = ?", (chunk,)).fetchone()[0]
+                results.append((chunk_id, score))
+
+            self._searches += 1
+            self._search_time += time.perf_counter() - started
+        return results
+
+    def rebuild_from(self, collection, batch_size: int = 1000) -> int:
+        """Replace the index with every chunk stored in a Chroma collection"""
+        self.clear()
+        offset = 0
+        while True:
+            page = collection.get(limit=batch_size, offset=offset, include=["documents"])
+            if not page["ids"]:
+                break
+            self.add(page["ids"], [text or "" for text in page["documents"]])
+            offset += len(page["ids"])
+        return offset
+
+    def stats(self) -> dict:
+        chunks = self.count()
+        with self._lock:
+            return {
+                "chunks": chunks,
+                "searches": self._searches,
+                "avg_search_ms": round(1000 * self._search_time / self._searches, 3) if self._searches else 0.0,
+            }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def open_lexical_index(persist_dir: str, collection=None) -> LexicalIndex:
+    """Open the index in persist_dir, rebuilding it when it doesn't cover the collection"""
+    index = LexicalIndex(index_path(persist_dir))
+    if collection is not None:
+        expected = collection.count()
+        if index.count() != expected:
+            print(f"Lexical index out of date ({index.count()} of {expected} chunks), rebuilding...")
+            started = time.perf_counter()
+            index.rebuild_from(collection)
+            print(f"Lexical index rebuilt with {index.count()} chunks in {time.perf_counter() - started:.1f}s")
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the BM25 index from the vector database")
+    parser.add_argument('--persist-dir', default='./medical_db/')
+    args = parser.parse_args()
+
+    from tools.vector_store import open_vectorstore
+    collection = open_vectorstore(args.persist_dir)._collection
+    index = LexicalIndex(index_path(args.persist_dir))
+    started = time.perf_counter()
+    chunks = index.rebuild_from(collection)
+    print(f"Lexical index: {chunks} chunks indexed in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
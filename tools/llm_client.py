@@ -1,5 +1,7 @@
 ﻿import os
 from langchain_google_genai import ChatGoogleGenerativeAI
+from core.config import env_float, env_int
+from core.llm_cache import get_llm_response_cache
 
 class LLMClient:
     _instance = None
@@ -14,8 +16,11 @@ class LLMClient:
                 model="gemini-2.5-flash",
                 temperature=0,
                 max_tokens=None,
-                timeout=None,
-                max_retries=2,
-                google_api_key=api_key
+                # Also capped per call by the request deadline (core.resilience)
+                timeout=env_float("LLM_TIMEOUT", 20.0),
+                max_retries=env_int("LLM_MAX_RETRIES", 2),
+                google_api_key=api_key,
+                # Identical prompts are answered from the response cache (None: no cache)
+                cache=get_llm_response_cache()
             )
         return LLMClient._instance
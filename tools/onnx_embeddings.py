@@ -0,0 +1,84 @@
+"""
+ONNX Runtime backend for the sentence-transformers embedding model.
+
+Runs the ONNX export published in the model's Hugging Face repo (or an
+int8-quantized variant of it, e.g. onnx/model_quint8_avx2.onnx) with the
+same tokenization, mean pooling and L2 normalization as the
+sentence-transformers pipeline, so vectors match the existing index within
+a small tolerance (see benchmarks/bench_embeddings.py) without loading torch.
+"""
+import os
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_ONNX_FILE = "onnx/model.onnx"
+# max_seq_length of all-MiniLM-L6-v2 in sentence-transformers
+DEFAULT_MAX_LENGTH = 256
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    `local_dir`, when set, must contain `onnx_file` and tokenizer.json;
+    otherwise both are fetched from the Hugging Face Hub (and cached there).
+    """
+
+    def __init__(self, model_name: str, onnx_file: str = DEFAULT_ONNX_FILE, local_dir: str = None,
+                 max_length: int = DEFAULT_MAX_LENGTH, batch_size: int = 64, threads: int = 0):
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError("EMBEDDING_BACKEND=onnx requires onnxruntime and tokenizers "
+                              "(pip install onnxruntime tokenizers)") from e
+
+        if local_dir:
+            model_path = os.path.join(local_dir, onnx_file)
+            tokenizer_path = os.path.join(local_dir, "tokenizer.json")
+        else:
+            from huggingface_hub import hf_hub_download
+            model_path = hf_hub_download(model_name, onnx_file)
+            tokenizer_path = hf_hub_download(model_name, "tokenizer.json")
+
+        self.model_name = model_name
+        self.onnx_file = onnx_file
+        self.batch_size = max(1, batch_size)
+
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {node.name for node in self.session.get_inputs()}
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        # HuggingFaceEmbeddings replaces newlines before encoding, so do the same
+        encodings = self.tokenizer.encode_batch([text.replace("\n", " ") for text in texts])
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+
+        feed = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feed["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        output = self.session.run(None, feed)[0]
+
+        if output.ndim == 3:
+            # Mean pooling over real tokens
+            mask = attention_mask[..., None].astype(output.dtype)
+            output = (output * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(output, axis=1, keepdims=True)
+        return (output / np.clip(norms, 1e-12, None)).astype(np.float32).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors.extend(self._embed(texts[start:start + self.batch_size]))
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text])[0]
@@ -0,0 +1,133 @@
+"""
+Offline rebuild / compaction of the vector database.
+
+    python -m tools.rebuild_index --persist-dir ./medical_db/ [--m 32 --construction-ef 200 --search-ef 100]
+
+Copies every chunk with its stored vector (nothing is re-embedded) into a
+fresh collection created with the requested HNSW settings (HNSW_M,
+HNSW_CONSTRUCTION_EF, HNSW_SEARCH_EF unless given on the command line),
+next to the current one. The ingest manifest, lexical index and title index
+are copied along. Once the copy has the same number of chunks, the new
+directory is swapped in and the old one is kept as <persist-dir>.old
+(unless --delete-old). A fresh build also drops the space of deleted and
+replaced vectors, so it is worth running after heavy updates.
+
+Stop the server first: Chroma does not expect its directory to be replaced
+under an open client.
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import time
+
+from chromadb.api.client import SharedSystemClient
+
+from tools.ingest import MANIFEST_NAME
+from tools.lexical_index import index_path as lexical_index_path
+from tools.title_index import index_path as title_index_path
+from tools.vector_store import hnsw_metadata, open_vectorstore
+
+
+def directory_size_mb(path: str) -> float:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return round(total / (1024 * 1024), 1)
+
+
+def _copy_sidecars(source_dir: str, target_dir: str):
+    manifest = os.path.join(source_dir, MANIFEST_NAME)
+    if os.path.exists(manifest):
+        shutil.copy2(manifest, os.path.join(target_dir, MANIFEST_NAME))
+    if os.path.exists(title_index_path(source_dir)):
+        shutil.copy2(title_index_path(source_dir), title_index_path(target_dir))
+    if os.path.exists(lexical_index_path(source_dir)):
+        # Backup API instead of a file copy, so the WAL is included
+        source = sqlite3.connect(lexical_index_path(source_dir))
+        target = sqlite3.connect(lexical_index_path(target_dir))
+        source.backup(target)
+        target.close()
+        source.close()
+
+
+def rebuild_index(persist_dir: str = './medical_db/', metadata: dict = None, batch_size: int = 1000,
+                  delete_old: bool = False) -> dict:
+    """Rebuild persist_dir into a fresh collection and swap it in; returns the build stats"""
+    persist_dir = persist_dir.rstrip('/\\')
+    new_dir = persist_dir + ".rebuild"
+    old_dir = persist_dir + ".old"
+    metadata = metadata or hnsw_metadata()
+    started = time.perf_counter()
+
+    source = open_vectorstore(persist_dir, with_embeddings=False)._collection
+    expected = source.count()
+    if os.path.exists(new_dir):
+        # Left behind by an interrupted rebuild
+        shutil.rmtree(new_dir)
+    target = open_vectorstore(new_dir, with_embeddings=False, metadata=metadata)._collection
+    print(f"Rebuild: copying {expected} chunks into {new_dir} with {metadata}")
+
+    offset = 0
+    while True:
+        page = source.get(limit=batch_size, offset=offset, include=["embeddings", "documents", "metadatas"])
+        if not len(page["ids"]):
+            break
+        target.add(ids=page["ids"], embeddings=page["embeddings"],
+                   documents=page["documents"], metadatas=page["metadatas"])
+        offset += len(page["ids"])
+        print(f"Rebuild: {offset}/{expected} chunks copied")
+
+    copied = target.count()
+    if copied != expected:
+        raise RuntimeError(f"Rebuild copied {copied} of {expected} chunks, keeping {persist_dir}")
+    _copy_sidecars(persist_dir, new_dir)
+
+    # Let go of both databases before their directories move
+    del source, target
+    SharedSystemClient.clear_system_cache()
+
+    size_before, size_after = directory_size_mb(persist_dir), directory_size_mb(new_dir)
+    if os.path.exists(old_dir):
+        shutil.rmtree(old_dir)
+    os.rename(persist_dir, old_dir)
+    try:
+        os.rename(new_dir, persist_dir)
+    except OSError:
+        os.rename(old_dir, persist_dir)
+        raise
+    if delete_old:
+        shutil.rmtree(old_dir)
+
+    stats = {
+        "chunks": copied,
+        "seconds": round(time.perf_counter() - started, 2),
+        "size_before_mb": size_before,
+        "size_after_mb": size_after,
+    }
+    print(f"Rebuild: done in {stats['seconds']}s - {copied} chunks, "
+          f"{size_before} MB -> {size_after} MB" + ("" if delete_old else f", previous index kept in {old_dir}"))
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the vector database with new HNSW settings and swap it in")
+    parser.add_argument('--persist-dir', default='./medical_db/')
+    parser.add_argument('--m', type=int, default=None, help="HNSW max neighbours per node (HNSW_M)")
+    parser.add_argument('--construction-ef', type=int, default=None, help="HNSW_CONSTRUCTION_EF")
+    parser.add_argument('--search-ef', type=int, default=None, help="HNSW_SEARCH_EF")
+    parser.add_argument('--batch-size', type=int, default=1000, help="chunks copied per batch")
+    parser.add_argument('--delete-old', action='store_true', help="remove the previous index after the swap")
+    args = parser.parse_args()
+
+    metadata = hnsw_metadata()
+    for key, value in (("hnsw:M", args.m), ("hnsw:construction_ef", args.construction_ef),
+                       ("hnsw:search_ef", args.search_ef)):
+        if value:
+            metadata[key] = value
+    rebuild_index(args.persist_dir, metadata, batch_size=args.batch_size, delete_old=args.delete_old)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""
+Cross-encoder re-ranking of retrieved chunks under a latency budget.
+
+The retriever over-fetches RERANK_CANDIDATES chunks; a small cross-encoder
+(RERANK_MODEL, ms-marco MiniLM by default) scores every (question, chunk)
+pair in batches on the CPU and the best RERANK_TOP_N are kept. Scoring runs
+in its own thread: when it has not finished within RERANK_BUDGET_MS the
+chunks are returned in retrieval order, and the remaining batches are
+skipped.
+
+The model runs on the same runtime as the embeddings (EMBEDDING_BACKEND),
+so the onnx backend still never loads torch.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import List
+
+import numpy as np
+from langchain_core.documents import Document
+
+from core.config import env_bool, env_int, env_str
+from core.metrics import REGISTRY
+from tools.vector_store import embedding_backend
+
+DEFAULT_RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+RERANK_DURATION = REGISTRY.histogram(
+    "medical_chat_rerank_seconds", "Wall time of re-ranking by outcome", ("outcome",)
+)
+RERANK_RUNS = REGISTRY.counter(
+    "medical_chat_rerank_runs_total", "Re-ranking runs by outcome (ok, budget_exceeded, error)", ("outcome",)
+)
+RERANK_PROMOTED = REGISTRY.counter(
+    "medical_chat_rerank_promoted_total", "Chunks moved into the kept top N from beyond it"
+)
+RERANK_REORDERED = REGISTRY.counter(
+    "medical_chat_rerank_reordered_total", "Re-rankings whose top N differs from the retrieval order"
+)
+
+# Global instance
+_reranker = None
+
+
+class _TorchCrossEncoder:
+    def __init__(self, model_name: str, batch_size: int):
+        from sentence_transformers import CrossEncoder
+        self.model = CrossEncoder(model_name, max_length=512, device="cpu")
+        self.batch_size = batch_size
+
+    def score(self, pairs: List[tuple]) -> List[float]:
+        return [float(s) for s in self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)]
+
+
+class _OnnxCrossEncoder:
+    def __init__(self, model_name: str, onnx_file: str, local_dir: str = None, threads: int = 0):
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError("The onnx reranker requires onnxruntime and tokenizers") from e
+
+        if local_dir:
+            model_path = os.path.join(local_dir, onnx_file)
+            tokenizer_path = os.path.join(local_dir, "tokenizer.json")
+        else:
+            from huggingface_hub import hf_hub_download
+            model_path = hf_hub_download(model_name, onnx_file)
+            tokenizer_path = hf_hub_download(model_name, "tokenizer.json")
+
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=512)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {node.name for node in self.session.get_inputs()}
+
+    def score(self, pairs: List[tuple]) -> List[float]:
+        encodings = self.tokenizer.encode_batch(pairs)
+        feed = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+        }
+        if "token_type_ids" in self.input_names:
+            feed["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        logits = self.session.run(None, feed)[0]
+        return logits.reshape(len(pairs), -1)[:, 0].astype(float).tolist()
+
+
+class Reranker:
+    """
+    rerank() keeps the `top_n` best chunks for a question; it never takes much
+    longer than `budget_ms` (plus thread hand-off), falling back to the order
+    the chunks came in.
+    """
+
+    def __init__(self, scorer, top_n: int = 3, budget_ms: float = 300, batch_size: int = 16):
+        self.scorer = scorer
+        self.top_n = max(1, top_n)
+        self.budget_ms = budget_ms
+        self.batch_size = max(1, batch_size)
+        # One scoring at a time: the model already uses every core
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+        self._lock = threading.Lock()
+        self._runs = 0
+        self._fallbacks = 0
+
+    @classmethod
+    def from_env(cls) -> 'Reranker':
+        model_name = env_str("RERANK_MODEL", DEFAULT_RERANK_MODEL)
+        batch_size = env_int("RERANK_BATCH_SIZE", 16)
+        if embedding_backend() == "onnx":
+            scorer = _OnnxCrossEncoder(
+                model_name,
+                onnx_file=env_str("RERANK_ONNX_FILE", "onnx/model.onnx"),
+                local_dir=env_str("RERANK_ONNX_PATH"),
+                threads=env_int("EMBEDDING_ONNX_THREADS", 0)
+            )
+        else:
+            scorer = _TorchCrossEncoder(model_name, batch_size)
+        return cls(
+            scorer,
+            top_n=env_int("RERANK_TOP_N", 3),
+            budget_ms=env_int("RERANK_BUDGET_MS", 300),
+            batch_size=batch_size
+        )
+
+    def _score(self, question: str, docs: List[Document], deadline: float) -> List[float]:
+        scores = []
+        for start in range(0, len(docs), self.batch_size):
+            # The caller has already fallen back; don't keep the CPU busy for nothing
+            if time.perf_counter() > deadline:
+                return None
+            batch = docs[start:start + self.batch_size]
+            scores.extend(self.scorer.score([(question, doc.page_content) for doc in batch]))
+        return scores
+
+    def rerank(self, question: str, docs: List[Document]) -> List[Document]:
+        if len(docs) <= 1:
+            return docs[:self.top_n]
+
+        started = time.perf_counter()
+        budget = self.budget_ms / 1000
+        future = self._executor.submit(self._score, question, docs, started + budget)
+        try:
+            scores = future.result(timeout=budget)
+            outcome = "ok" if scores is not None else "budget_exceeded"
+        except FutureTimeout:
+            scores, outcome = None, "budget_exceeded"
+        except Exception as e:
+            print(f"Reranker: scoring failed - {e}")
+            scores, outcome = None, "error"
+
+        RERANK_DURATION.observe(time.perf_counter() - started, outcome=outcome)
+        RERANK_RUNS.inc(outcome=outcome)
+        with self._lock:
+            self._runs += 1
+            if scores is None:
+                self._fallbacks += 1
+        if scores is None:
+            return docs[:self.top_n]
+
+        order = sorted(range(len(docs)), key=lambda i: -scores[i])[:self.top_n]
+        RERANK_PROMOTED.inc(sum(1 for i in order if i >= self.top_n))
+        if order != list(range(min(self.top_n, len(docs)))):
+            RERANK_REORDERED.inc()
+        return [docs[i] for i in order]
+
+    def warm_up(self):
+        self.scorer.score([("warm up", "warm up")])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "runs": self._runs,
+                "fallbacks": self._fallbacks,
+                "fallback_rate": round(self._fallbacks / self._runs, 4) if self._runs else 0.0,
+            }
+
+
+def rerank_enabled() -> bool:
+    return env_bool("RERANK_ENABLED", False)
+
+
+def get_reranker():
+    """The shared Reranker, or None when RERANK_ENABLED is off"""
+    global _reranker
+    if _reranker is None and rerank_enabled():
+        _reranker = Reranker.from_env()
+    return _reranker
+
+
+def rerank_candidates(k: int) -> int:
+    """How many chunks to retrieve so the reranker has something to choose from"""
+    return max(k, env_int("RERANK_CANDIDATES", 20)) if rerank_enabled() else k
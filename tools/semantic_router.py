@@ -0,0 +1,160 @@
+"""
+Embedding-based routing of questions for the planner (PLANNER_MODE=semantic).
+
+Labeled example questions (data/routing_examples.json, or
+ROUTING_EXAMPLES_PATH) are embedded once with the MiniLM model of the vector
+database; the normalized mean of each route's examples is its centroid. A
+question goes to the route whose centroid is most similar to its embedding,
+a product with a matrix of a few rows that takes microseconds once the
+question is embedded. The question vector goes through the shared embedding
+cache, so the answer cache and the retriever don't embed it again.
+
+Routes: "retriever" (questions about diseases, drugs, treatments for the
+knowledge sources), "llm_agent" (general health advice), "direct"
+(greetings, thanks, who are you) and "out_of_scope" (not about health).
+
+The centroids are saved to SEMANTIC_ROUTER_CACHE_PATH together with a hash
+of the examples and the embedding model, and recomputed when either changes.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.config import env_str
+
+ROUTES = ("retriever", "llm_agent", "direct", "out_of_scope")
+DEFAULT_EXAMPLES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                     "data", "routing_examples.json")
+
+# Global instance
+_router = None
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.clip(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12, None)
+
+
+def _fingerprint(examples: Dict[str, List[str]], namespace: str) -> str:
+    payload = json.dumps({"namespace": namespace, "examples": examples}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def _load_centroids(path: str, fingerprint: str) -> Optional[Tuple[List[str], np.ndarray]]:
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as data:
+            if str(data['fingerprint']) != fingerprint:
+                return None
+            return [str(route) for route in data['routes']], data['centroids']
+    except Exception as e:
+        print(f"SemanticRouter: failed to load centroids - {e}")
+        return None
+
+
+def _save_centroids(path: str, fingerprint: str, routes: List[str], centroids: np.ndarray):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    try:
+        np.savez(tmp_path, fingerprint=np.array(fingerprint), routes=np.array(routes), centroids=centroids)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"SemanticRouter: failed to save centroids - {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class SemanticRouter:
+    def __init__(self, routes: List[str], centroids: np.ndarray, embed_fn: Callable[[str], List[float]]):
+        """`centroids` holds one normalized row per route"""
+        self.routes = list(routes)
+        self.centroids = centroids.astype(np.float32)
+        self.embed_fn = embed_fn
+
+        self._lock = threading.Lock()
+        self._classified = 0
+        self._classify_time = 0.0
+
+    @classmethod
+    def build(cls, examples: Dict[str, List[str]], embeddings, namespace: str = "",
+              cache_path: str = None) -> 'SemanticRouter':
+        unknown = set(examples) - set(ROUTES)
+        if unknown:
+            raise ValueError(f"Unknown routes in routing examples: {sorted(unknown)}")
+        examples = {route: examples[route] for route in ROUTES if examples.get(route)}
+
+        fingerprint = _fingerprint(examples, namespace)
+        cached = _load_centroids(cache_path, fingerprint)
+        if cached:
+            routes, centroids = cached
+        else:
+            started = time.perf_counter()
+            routes = list(examples)
+            centroids = _normalize(np.stack([
+                _normalize(np.asarray(embeddings.embed_documents(examples[route]), dtype=np.float32)).mean(axis=0)
+                for route in routes
+            ]))
+            print(f"SemanticRouter: embedded {sum(len(e) for e in examples.values())} examples "
+                  f"in {time.perf_counter() - started:.1f}s")
+            if cache_path:
+                _save_centroids(cache_path, fingerprint, routes, centroids)
+        return cls(routes, centroids, embeddings.embed_query)
+
+    @classmethod
+    def from_env(cls) -> 'SemanticRouter':
+        from tools.vector_store import EMBEDDING_MODEL_NAME, get_embeddings
+        with open(env_str("ROUTING_EXAMPLES_PATH", DEFAULT_EXAMPLES_PATH), 'r', encoding='utf-8') as f:
+            examples = json.load(f)
+        embeddings = get_embeddings()
+        return cls.build(
+            examples,
+            embeddings,
+            namespace=getattr(embeddings, 'namespace', EMBEDDING_MODEL_NAME),
+            cache_path=env_str("SEMANTIC_ROUTER_CACHE_PATH", "./cache/route_centroids.npz")
+        )
+
+    def scores(self, question: str) -> Dict[str, float]:
+        """Cosine similarity of the question to every route centroid"""
+        vector = _normalize(np.asarray(self.embed_fn(question), dtype=np.float32))
+        started = time.perf_counter()
+        similarities = self.centroids @ vector
+        with self._lock:
+            self._classified += 1
+            self._classify_time += time.perf_counter() - started
+        return dict(zip(self.routes, similarities.tolist()))
+
+    def classify(self, question: str) -> Tuple[str, float]:
+        """The nearest route and its similarity, used as the routing confidence"""
+        scores = self.scores(question)
+        route = max(scores, key=scores.get)
+        return route, scores[route]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "routes": len(self.routes),
+                "classified": self._classified,
+                "avg_classify_us": round(1e6 * self._classify_time / self._classified, 1) if self._classified else 0.0,
+            }
+
+
+def planner_mode() -> str:
+    return env_str("PLANNER_MODE", "keyword").lower()
+
+
+def get_semantic_router():
+    """The shared SemanticRouter, or None unless PLANNER_MODE=semantic"""
+    global _router
+    mode = planner_mode()
+    if mode not in ("keyword", "semantic"):
+        raise ValueError(f"Unknown PLANNER_MODE: {mode}")
+    if _router is None and mode == "semantic":
+        _router = SemanticRouter.from_env()
+    return _router
@@ -0,0 +1,131 @@
+"""
+Precomputed index from disease titles to their chunk ids.
+
+Entries of the JSON disease database carry a `title` in their chunk
+metadata. When a question names one of those diseases, its chunks can be
+fetched by id, with no embedding or vector search at all. Titles are matched
+as whole words, longest first, with a leading "bệnh" ignored. Like
+tools.keyword_matcher, a question typed without diacritics is compared with
+the folded titles ("sot xuat huyet" finds "Sốt xuất huyết"), while a question
+with diacritics must match them exactly: folding it would make different
+words collide ("cần thì" is not "Cận thị"). Entries without a disease name
+(UNKNOWN_DISEASE_TITLE) are left out.
+
+The index is a JSON file next to the Chroma files. tools.ingest rebuilds it
+after every run that changed something; open_title_index() rebuilds it when
+the collection size no longer matches.
+"""
+import json
+import os
+import re
+import time
+import unicodedata
+from typing import Dict, List, Optional
+
+from tools.data_loader import UNKNOWN_DISEASE_TITLE, VIETNAMESE_CHARS
+from tools.lexical_index import STOPWORDS, fold
+
+INDEX_NAME = "title_index.json"
+# Leading words that are part of some titles but not of how people ask
+_PREFIXES = ("benh",)
+# One-word titles shorter than this are too easily part of an unrelated sentence
+MIN_SINGLE_WORD_TITLE = 5
+MAX_TITLE_WORDS = 8
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def index_path(persist_dir: str) -> str:
+    return os.path.join(persist_dir, INDEX_NAME)
+
+
+def _words(text: str, exact: bool) -> List[str]:
+    """Words of the text like tools.lexical_index.tokenize, folded to ASCII unless `exact`"""
+    text = unicodedata.normalize("NFC", text.lower()) if exact else fold(text)
+    return [token for token in _TOKEN_RE.findall(text)
+            if fold(token) not in STOPWORDS and (len(token) > 1 or token.isdigit())]
+
+
+def title_key(title: str, exact: bool = False) -> tuple:
+    words = _words(title, exact)
+    while len(words) > 1 and fold(words[0]) in _PREFIXES:
+        words = words[1:]
+    return tuple(words)
+
+
+class TitleIndex:
+    def __init__(self, titles: Dict[str, List[str]], chunk_count: int = 0):
+        """`titles` maps each title to the ids of its chunks; chunk_count is the collection size it was built from"""
+        self.titles = {title: ids for title, ids in titles.items() if title != UNKNOWN_DISEASE_TITLE}
+        self.chunk_count = chunk_count
+        self._keys = {}        # folded key -> title
+        self._exact_keys = {}  # key with diacritics -> title
+        for title in self.titles:
+            key = title_key(title)
+            if len(key) > 1 or (key and len(key[0]) >= MIN_SINGLE_WORD_TITLE):
+                self._keys.setdefault(key, title)
+                self._exact_keys.setdefault(title_key(title, exact=True), title)
+        self._max_words = min(MAX_TITLE_WORDS, max((len(key) for key in self._keys), default=0))
+
+    @classmethod
+    def build_from(cls, collection, batch_size: int = 1000) -> 'TitleIndex':
+        titles: Dict[str, List[str]] = {}
+        offset = 0
+        while True:
+            page = collection.get(limit=batch_size, offset=offset, include=["metadatas"])
+            if not page["ids"]:
+                break
+            for chunk_id, metadata in zip(page["ids"], page["metadatas"]):
+                title = (metadata or {}).get("title")
+                if title:
+                    titles.setdefault(title, []).append(chunk_id)
+            offset += len(page["ids"])
+        return cls(titles, offset)
+
+    @classmethod
+    def load(cls, path: str) -> Optional['TitleIndex']:
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data["titles"], data.get("chunk_count", 0))
+
+    def save(self, path: str):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"chunk_count": self.chunk_count, "titles": self.titles}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def match(self, question: str) -> Optional[str]:
+        """The longest title the question mentions, if any"""
+        exact = any(ch in VIETNAMESE_CHARS for ch in unicodedata.normalize("NFC", question.lower()))
+        keys = self._exact_keys if exact else self._keys
+        words = _words(question, exact)
+        for size in range(min(self._max_words, len(words)), 0, -1):
+            for start in range(len(words) - size + 1):
+                title = keys.get(tuple(words[start:start + size]))
+                if title:
+                    return title
+        return None
+
+    def ids(self, title: str) -> List[str]:
+        return self.titles.get(title, [])
+
+    def stats(self) -> dict:
+        return {"titles": len(self.titles), "chunks": sum(len(ids) for ids in self.titles.values())}
+
+
+def rebuild_title_index(persist_dir: str, collection) -> TitleIndex:
+    started = time.perf_counter()
+    index = TitleIndex.build_from(collection)
+    index.save(index_path(persist_dir))
+    print(f"Title index: {len(index.titles)} titles indexed in {time.perf_counter() - started:.1f}s")
+    return index
+
+
+def open_title_index(persist_dir: str, collection) -> TitleIndex:
+    """Load the index from persist_dir, rebuilding it when it doesn't match the collection"""
+    index = TitleIndex.load(index_path(persist_dir))
+    if index is None or index.chunk_count != collection.count():
+        return rebuild_title_index(persist_dir, collection)
+    return index
@@ -1,27 +1,285 @@
-﻿import os
-from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+﻿import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from array import array
+from collections import OrderedDict
+from typing import List
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_chroma import Chroma
+from core.config import env_int, env_str
+from tools.embedding_pipeline import EmbeddingPipeline
+from tools.hybrid_retriever import HybridRetriever
+from tools.lexical_index import open_lexical_index
+from tools.title_index import open_title_index
+from tools.onnx_embeddings import DEFAULT_ONNX_FILE, OnnxEmbeddings
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 
 # Global instances
 _embeddings = None
 _vectorstore = None
+_persist_dir = None
+_lexical_index = None
+_title_index = None
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Memoizes embed_query by a hash of the whitespace-normalized text in a
+    bounded LRU, optionally backed by an SQLite file (at most
+    `max_disk_entries` rows, oldest dropped first) so vectors survive
+    restarts. Repeated questions are what repeats; document chunks are
+    embedded once by ingestion, which tracks them itself, so embed_documents
+    goes straight to the model and never fills the cache with the corpus.
+    """
+
+    def __init__(self, underlying: Embeddings, namespace: str, max_entries: int = 4096,
+                 disk_path: str = None, max_disk_entries: int = 100000):
+        self.underlying = underlying
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.disk_path = disk_path
+        self.max_disk_entries = max_disk_entries
+
+        self._lock = threading.Lock()
+        self._lru = OrderedDict()
+        # The SQLite connection has its own lock, so disk I/O never holds up LRU lookups
+        self._db_lock = threading.Lock()
+        self._db = None
+        self._disk_rows = 0
+        if disk_path:
+            directory = os.path.dirname(disk_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            self._db.commit()
+            self._disk_rows = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._miss_time = 0.0
+        self._disk_evictions = 0
+
+    def _key(self, kind: str, text: str) -> str:
+        normalized = " ".join(text.split())
+        return hashlib.sha1(f"{self.namespace}\0{kind}\0{normalized}".encode('utf-8')).hexdigest()
+
+    def _get(self, key: str):
+        with self._lock:
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+                self._hits += 1
+                return vector
+        if self._db is None:
+            return None
+
+        with self._db_lock:
+            row = self._db.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        vector = array('d')
+        vector.frombytes(row[0])
+        vector = vector.tolist()
+        with self._lock:
+            self._disk_hits += 1
+            self._hits += 1
+            self._remember(key, vector)
+        return vector
+
+    def _remember(self, key: str, vector: List[float]):
+        """Add to the LRU (lock held)"""
+        if self.max_entries <= 0:
+            return
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def _put_many(self, items, elapsed: float):
+        with self._lock:
+            self._misses += len(items)
+            self._miss_time += elapsed
+            for key, vector in items:
+                self._remember(key, vector)
+        if self._db is None:
+            return
+
+        rows = [(key, array('d', vector).tobytes()) for key, vector in items]
+        with self._db_lock:
+            self._db.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+            self._disk_rows += len(rows)
+            if self.max_disk_entries > 0 and self._disk_rows > self.max_disk_entries:
+                self._evict_disk()
+            self._db.commit()
+
+    def _evict_disk(self):
+        """Drop the oldest rows down to 90% of max_disk_entries, so this runs once per many inserts (db lock held)"""
+        # Other processes may share the file, so count rather than trust _disk_rows
+        count = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        target = int(self.max_disk_entries * 0.9)
+        if count > target and count > self.max_disk_entries:
+            evicted = self._db.execute(
+                "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY rowid LIMIT ?)",
+                (count - target,)
+            ).rowcount
+            count -= evicted
+            with self._lock:
+                self._disk_evictions += evicted
+        self._disk_rows = count
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key("query", text)
+        vector = self._get(key)
+        if vector is not None:
+            return vector
+        started = time.perf_counter()
+        vector = self.underlying.embed_query(text)
+        self._put_many([(key, vector)], time.perf_counter() - started)
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.underlying.embed_documents(texts)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            avg_miss = self._miss_time / self._misses if self._misses else 0.0
+            return {
+                "entries": len(self._lru),
+                "disk_entries": self._disk_rows,
+                "hits": self._hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "disk_evictions": self._disk_evictions,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "avg_miss_ms": round(1000 * avg_miss, 3),
+                "time_saved_seconds": round(self._hits * avg_miss, 3),
+            }
+
+
+def embedding_backend() -> str:
+    return env_str("EMBEDDING_BACKEND", "torch").lower()
+
+
+def create_base_embeddings(batch_size: int = None) -> Embeddings:
+    """
+    Uncached embedding model for EMBEDDING_BACKEND: "torch" (sentence-transformers)
+    or "onnx" (ONNX Runtime). Each backend imports its runtime on first use,
+    so the onnx backend never loads torch.
+    """
+    backend = embedding_backend()
+    batch_size = batch_size or env_int("EMBEDDING_BATCH_SIZE", 64)
+    if backend == "torch":
+        from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(
+            model_name=EMBEDDING_MODEL_NAME,
+            encode_kwargs={"batch_size": batch_size}
+        )
+    if backend == "onnx":
+        return OnnxEmbeddings(
+            EMBEDDING_MODEL_NAME,
+            onnx_file=env_str("EMBEDDING_ONNX_FILE", DEFAULT_ONNX_FILE),
+            local_dir=env_str("EMBEDDING_ONNX_PATH"),
+            batch_size=batch_size,
+            threads=env_int("EMBEDDING_ONNX_THREADS", 0)
+        )
+    raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend}")
 
 
 def get_embeddings():
     global _embeddings
     if _embeddings is None:
-        _embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2"
-        )
+        base = create_base_embeddings()
+        # Vectors differ slightly between backends, so they don't share cache entries
+        namespace = EMBEDDING_MODEL_NAME
+        if embedding_backend() != "torch":
+            namespace += f"@{embedding_backend()}:{env_str('EMBEDDING_ONNX_FILE', DEFAULT_ONNX_FILE)}"
+        cache_size = env_int("EMBEDDING_CACHE_SIZE", 4096)
+        cache_path = env_str("EMBEDDING_CACHE_PATH")
+        if cache_size > 0 or cache_path:
+            _embeddings = CachedEmbeddings(
+                base,
+                namespace=namespace,
+                max_entries=cache_size,
+                disk_path=cache_path,
+                max_disk_entries=env_int("EMBEDDING_CACHE_DISK_MAX_ENTRIES", 100000)
+            )
+        else:
+            _embeddings = base
     return _embeddings
 
 
+def hnsw_metadata() -> dict:
+    """
+    Collection metadata with the HNSW settings from HNSW_M, HNSW_CONSTRUCTION_EF
+    and HNSW_SEARCH_EF; unset ones keep Chroma's defaults. M and construction_ef
+    only apply when a collection is created (see tools.rebuild_index).
+    """
+    metadata = {"hnsw:space": "cosine"}
+    for key, name in (("hnsw:M", "HNSW_M"), ("hnsw:construction_ef", "HNSW_CONSTRUCTION_EF"),
+                      ("hnsw:search_ef", "HNSW_SEARCH_EF")):
+        value = env_int(name, 0)
+        if value > 0:
+            metadata[key] = value
+    return metadata
+
+
+def sync_hnsw_settings(collection, metadata: dict):
+    """
+    Apply search_ef to an existing collection, which unlike M and
+    construction_ef can change at any time; warn when those two differ.
+    """
+    try:
+        current = (collection.configuration_json or {}).get("hnsw") or {}
+    except Exception:
+        # Chroma before 1.0 has no collection configuration
+        return
+    for key, name in (("hnsw:M", "max_neighbors"), ("hnsw:construction_ef", "ef_construction")):
+        if key in metadata and current.get(name) not in (None, metadata[key]):
+            print(f"Vector database was built with {key}={current[name]}, "
+                  f"run `python -m tools.rebuild_index` to apply {metadata[key]}")
+    search_ef = metadata.get("hnsw:search_ef")
+    if search_ef and current.get("ef_search") != search_ef:
+        try:
+            collection.modify(configuration={"hnsw": {"ef_search": search_ef}})
+        except Exception as e:
+            print(f"Could not set HNSW search_ef to {search_ef}: {e}")
+
+
+def open_vectorstore(persist_dir='./medical_db/', with_embeddings: bool = True, metadata: dict = None) -> Chroma:
+    """
+    Open the Chroma collection in persist_dir, creating an empty one if needed.
+    with_embeddings=False works on the stored vectors without loading the model;
+    metadata replaces the HNSW settings from the environment.
+    """
+    os.makedirs(persist_dir, exist_ok=True)
+    metadata = metadata or hnsw_metadata()
+    vectorstore = Chroma(
+        persist_directory=persist_dir,
+        embedding_function=get_embeddings() if with_embeddings else None,
+        collection_metadata=metadata
+    )
+    sync_hnsw_settings(vectorstore._collection, metadata)
+    return vectorstore
+
+
 def get_or_create_vectorstore(documents=None, persist_dir='./medical_db/'):
     """Get existing vectorstore or create new one if needed"""
-    global _vectorstore
+    global _vectorstore, _persist_dir, _lexical_index
 
     if _vectorstore is not None:
         return _vectorstore
+    _persist_dir = persist_dir
 
     embeddings = get_embeddings()
 
@@ -39,11 +297,7 @@ def get_or_create_vectorstore(documents=None, persist_dir='./medical_db/'):
 
     if db_files_exist:
         print("Loading existing vector database...")
-        _vectorstore = Chroma(
-            persist_directory=persist_dir,
-            embedding_function=embeddings,
-            collection_metadata={"hnsw:space": "cosine"}
-        )
+        _vectorstore = open_vectorstore(persist_dir)
         # Verify the database has content
         collection = _vectorstore._collection
         if collection.count() == 0:
@@ -53,14 +307,19 @@ def get_or_create_vectorstore(documents=None, persist_dir='./medical_db/'):
         print(f"Loaded {collection.count()} documents from vector database")
     elif documents:
         print("Creating new vector database...")
-        _vectorstore = Chroma.from_documents(
-            documents=documents,
-            embedding=embeddings,
-            persist_directory=persist_dir,
-            collection_metadata={"hnsw:space": "cosine"}
-        )
-        _vectorstore.persist()
-        print(f"Created vector database with {len(documents)} documents")
+        _vectorstore = open_vectorstore(persist_dir)
+        pipeline = EmbeddingPipeline.from_env(embeddings, _vectorstore._collection)
+        ids = [str(uuid.uuid4()) for _ in documents]
+        try:
+            pipeline.submit(documents, ids)
+            pipeline.drain()
+        finally:
+            pipeline.close()
+        _lexical_index = open_lexical_index(persist_dir)
+        _lexical_index.add(ids, [doc.page_content for doc in documents])
+        stats = pipeline.stats()
+        print(f"Created vector database with {len(documents)} documents "
+              f"({stats['chunks_per_second']} chunks/s)")
     else:
         print("No existing database and no documents provided")
         return None
@@ -68,9 +327,62 @@ def get_or_create_vectorstore(documents=None, persist_dir='./medical_db/'):
     return _vectorstore
 
 
-def get_retriever(k=3):
-    """Get retriever from existing vectorstore"""
+def get_lexical_index():
+    """BM25 index of the loaded vectorstore, rebuilt on first use if it has fallen behind"""
+    global _lexical_index
     vectorstore = get_or_create_vectorstore()
-    if vectorstore:
-        return vectorstore.as_retriever(search_kwargs={'k': k})
-    return None
+    if vectorstore is None:
+        return None
+    if _lexical_index is None:
+        _lexical_index = open_lexical_index(_persist_dir, vectorstore._collection)
+    return _lexical_index
+
+
+def get_title_index():
+    """Disease title -> chunk ids index of the loaded vectorstore"""
+    global _title_index
+    vectorstore = get_or_create_vectorstore()
+    if vectorstore is None:
+        return None
+    if _title_index is None:
+        _title_index = open_title_index(_persist_dir, vectorstore._collection)
+    return _title_index
+
+
+def get_title_documents(title: str, limit: int = None) -> List[Document]:
+    """The chunks of one disease entry, fetched by id without any search"""
+    index = get_title_index()
+    ids = index.ids(title)[:limit] if index else []
+    if not ids:
+        return []
+    found = _vectorstore._collection.get(ids=ids, include=["documents", "metadatas"])
+    by_id = {chunk_id: Document(id=chunk_id, page_content=text or "", metadata=metadata or {})
+             for chunk_id, text, metadata in zip(found["ids"], found["documents"], found["metadatas"])}
+    return [by_id[chunk_id] for chunk_id in ids if chunk_id in by_id]
+
+
+def retriever_mode() -> str:
+    return env_str("RETRIEVER_MODE", "vector").lower()
+
+
+def get_retriever(k=3, filter=None):
+    """
+    Get retriever from existing vectorstore (RETRIEVER_MODE: vector or hybrid),
+    optionally restricted by a Chroma metadata filter such as {"corpus": "diseases"}
+    """
+    vectorstore = get_or_create_vectorstore()
+    if not vectorstore:
+        return None
+    if retriever_mode() == "hybrid":
+        return HybridRetriever(
+            vectorstore=vectorstore,
+            lexical_index=get_lexical_index(),
+            k=k,
+            fetch_k=max(k, env_int("RETRIEVER_FETCH_K", 20)),
+            rrf_k=env_int("RETRIEVER_RRF_K", 60),
+            filter=filter
+        )
+    search_kwargs = {'k': k}
+    if filter:
+        search_kwargs['filter'] = filter
+    return vectorstore.as_retriever(search_kwargs=search_kwargs)